@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# benchmark_cleaner.py
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmark_indexer import SIZES, check_regressions, peak_rss_mb
+from synthetic_restaurants import generate_dataset
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def run_child(input_file, output_file, chunksize, workers, compact=False):
+    """
+    Clean input_file with the real cleaner and print the stage timings as JSON.
+    Runs in its own process so peak RSS belongs to this run only.
+    """
+    from data_cleaner import clean_restaurant_data
+    from metrics import Metrics
+    logging.getLogger().setLevel(logging.WARNING)
+
+    metrics = Metrics()
+    started = time.perf_counter()
+    try:
+        clean_restaurant_data(input_file, output_file, chunksize=chunksize, workers=workers, metrics=metrics,
+                              compact=compact)
+        exit_code = 0
+    except SystemExit as e:
+        exit_code = e.code or 1
+    wall = time.perf_counter() - started
+
+    print(json.dumps({
+        "exit_code": exit_code,
+        "wall_seconds": wall,
+        "stages": metrics.stage_seconds(),
+        "frame_bytes": metrics.as_dict()["gauges"],
+        "peak_rss_mb": peak_rss_mb()
+    }))
+    return exit_code
+
+def run_size(label, rows, workdir, chunksize, workers, dirt_rate, compact=False):
+    """Generate a dirty raw file of the given size, clean it in a child process and collect the results"""
+    input_file = os.path.join(workdir, f"restaurants_raw_{label}.csv")
+    if not os.path.exists(input_file):
+        generate_dataset(input_file, rows, raw=True, dirt_rate=dirt_rate)
+    output_file = os.path.join(workdir, f"restaurants_cleaned_{label}.csv")
+
+    command = [sys.executable, os.path.abspath(__file__), '--child', input_file, output_file, '--workers', str(workers)]
+    if chunksize:
+        command += ['--chunksize', str(chunksize)]
+    if compact:
+        command.append('--compact')
+    completed = subprocess.run(command, capture_output=True, text=True)
+    if completed.returncode != 0 and not completed.stdout.strip():
+        logging.error(f"Benchmark run for {label} failed:\n{completed.stderr}")
+        return None
+
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result.update({
+        "size": label,
+        "rows": rows,
+        "rows_per_sec": rows / result["wall_seconds"],
+        "input_mb": os.path.getsize(input_file) / 1e6
+    })
+    return result
+
+def main(sizes=('10k', '1m', '10m'), chunksize=None, workers=1, dirt_rate=0.05, workdir=None, output=None,
+         baseline=None, tolerance=0.2, compact=False):
+    if workdir:
+        os.makedirs(workdir, exist_ok=True)
+    else:
+        workdir = tempfile.mkdtemp(prefix='restaurants-clean-bench-')
+    logging.info(f"Data in {workdir}")
+
+    results = []
+    for label in sizes:
+        result = run_size(label, SIZES[label], workdir, chunksize, workers, dirt_rate, compact)
+        if result is None:
+            return 1
+        results.append(result)
+
+    stages = sorted({stage for result in results for stage in result["stages"]})
+    print(f"{'size':<5} {'rows':>10} {'wall s':>8} {'rows/s':>10} {'peak RSS MB':>12} "
+          + ' '.join(f"{stage:>12}" for stage in stages))
+    for result in results:
+        print(f"{result['size']:<5} {result['rows']:>10} {result['wall_seconds']:>8.2f} {result['rows_per_sec']:>10.0f} "
+              f"{result['peak_rss_mb']:>12.1f} "
+              + ' '.join(f"{result['stages'].get(stage, 0.0):>12.2f}" for stage in stages))
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if baseline and check_regressions(results, baseline, tolerance, rate='rows_per_sec'):
+        return 1
+    return 1 if any(result["exit_code"] for result in results) else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cleaner scaling benchmarks on synthetic dirty datasets")
+    parser.add_argument('--sizes', nargs='+', choices=list(SIZES), default=list(SIZES), help="Dataset sizes to run")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--chunksize', type=int, default=None, help="Clean in chunks of this many rows")
+    mode.add_argument('--workers', type=int, default=1, help="Clean with this many worker processes")
+    parser.add_argument('--compact', action='store_true', help="Run the cleaner in its compact-memory mode")
+    parser.add_argument('--dirt-rate', type=float, default=0.05, help="Fraction of generated rows to corrupt")
+    parser.add_argument('--workdir', default=None, help="Directory for the generated datasets (reused if present)")
+    parser.add_argument('--output', default=None, help="Write the results as JSON to this file")
+    parser.add_argument('--baseline', default=None, help="Results JSON of a previous run to compare rows/sec against")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed rows/sec drop versus the baseline")
+    parser.add_argument('--child', nargs=2, metavar=('INPUT_FILE', 'OUTPUT_FILE'), default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        sys.exit(run_child(args.child[0], args.child[1], args.chunksize, args.workers, args.compact))
+    sys.exit(main(args.sizes, args.chunksize, args.workers, args.dirt_rate, args.workdir, args.output,
+                  args.baseline, args.tolerance, args.compact))
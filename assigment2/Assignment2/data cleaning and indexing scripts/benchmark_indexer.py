@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# benchmark_indexer.py
+import argparse
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import mock_es_server
+from synthetic_restaurants import generate_dataset
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+SIZES = {'10k': 10_000, '1m': 1_000_000, '10m': 10_000_000}
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (ru_maxrss is KB on Linux, bytes on macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def run_child(csv_file, workers, gzip_level=0, async_mode=False):
+    """
+    Index csv_file with the real indexer against ES_HOST and print the measurements as JSON.
+    Runs in its own process so peak RSS belongs to this load only.
+    """
+    import elasticsearch_grok_indexer as indexer
+    logging.getLogger().setLevel(logging.WARNING)
+
+    latencies = []
+    batch_bytes = []
+    send_batch = indexer.bulk_index
+
+    def timed_bulk_index(bulk_data, pipeline_id=None):
+        started = time.perf_counter()
+        success = send_batch(bulk_data, pipeline_id)
+        latencies.append(time.perf_counter() - started)
+        batch_bytes.append(len(bulk_data))
+        return success
+
+    send_async_batch = indexer.async_bulk_index
+
+    async def timed_async_bulk_index(http, bulk_data, pipeline_id=None):
+        started = time.perf_counter()
+        success = await send_async_batch(http, bulk_data, pipeline_id)
+        latencies.append(time.perf_counter() - started)
+        batch_bytes.append(len(bulk_data))
+        return success
+
+    # The parallel senders look the send functions up on the module, so they are timed too
+    indexer.bulk_index = timed_bulk_index
+    indexer.async_bulk_index = timed_async_bulk_index
+    started = time.perf_counter()
+    dead_letter = os.path.join(os.path.dirname(csv_file), indexer.DEAD_LETTER_FILE)
+    exit_code = indexer.main(csv_file, workers=workers, gzip_level=gzip_level, async_mode=async_mode,
+                             dead_letter=dead_letter)
+    wall = time.perf_counter() - started
+
+    print(json.dumps({
+        "exit_code": exit_code,
+        "wall_seconds": wall,
+        "batches": len(latencies),
+        "bytes": sum(batch_bytes),
+        "batch_p50_ms": float(np.percentile(latencies, 50) * 1000) if latencies else None,
+        "batch_p99_ms": float(np.percentile(latencies, 99) * 1000) if latencies else None,
+        "peak_rss_mb": peak_rss_mb()
+    }))
+    return exit_code
+
+def run_size(label, rows, workdir, server, workers, gzip_level=0, async_mode=False):
+    """Generate a synthetic file of the given size, index it in a child process and collect the results"""
+    csv_file = os.path.join(workdir, f"restaurants_{label}.csv")
+    if not os.path.exists(csv_file):
+        generate_dataset(csv_file, rows)
+
+    items_before = server.state.stats["items"]
+    failed_before = server.state.stats["failed_items"]
+    env = dict(os.environ, ES_HOST=server.url, ES_PASS=os.environ.get('ES_PASS', 'benchmark'))
+    command = [sys.executable, os.path.abspath(__file__), '--child', csv_file, '--workers', str(workers),
+               '--gzip-level', str(gzip_level)]
+    if async_mode:
+        command.append('--async')
+    completed = subprocess.run(command, env=env, capture_output=True, text=True)
+    if completed.returncode != 0 and not completed.stdout.strip():
+        logging.error(f"Benchmark run for {label} failed:\n{completed.stderr}")
+        return None
+
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    # Only documents the mock acknowledged: failed items are left out, and a retried one counts once when it succeeds
+    docs = (server.state.stats["items"] - items_before) - (server.state.stats["failed_items"] - failed_before)
+    result.update({
+        "size": label,
+        "rows": rows,
+        "docs": docs,
+        "docs_per_sec": docs / result["wall_seconds"],
+        "bytes_per_sec": result["bytes"] / result["wall_seconds"]
+    })
+    return result
+
+def check_regressions(results, baseline_file, tolerance, rate='docs_per_sec'):
+    """Compare a throughput rate with a previous run and report sizes that got slower than the tolerance allows"""
+    with open(baseline_file) as f:
+        baseline = {result["size"]: result for result in json.load(f)}
+    regressions = []
+    for result in results:
+        previous = baseline.get(result["size"])
+        if previous and result[rate] < previous[rate] * (1 - tolerance):
+            regressions.append(result["size"])
+            logging.error(f"{result['size']}: {rate} {result[rate]:.0f}, baseline {previous[rate]:.0f}")
+    return regressions
+
+def main(sizes=('10k', '1m', '10m'), workers=1, latency=0.0, item_failure_rate=0.0, reject_rate=0.0,
+         workdir=None, output=None, baseline=None, tolerance=0.2, gzip_level=0, bandwidth_mbps=None,
+         async_mode=False):
+    server = mock_es_server.start_server(latency=latency, item_failure_rate=item_failure_rate,
+                                         reject_rate=reject_rate, seed=0, bandwidth_mbps=bandwidth_mbps)
+    if workdir:
+        os.makedirs(workdir, exist_ok=True)
+    else:
+        workdir = tempfile.mkdtemp(prefix='restaurants-bench-')
+    logging.info(f"Mock Elasticsearch on {server.url}, data in {workdir}")
+
+    results = []
+    for label in sizes:
+        result = run_size(label, SIZES[label], workdir, server, workers, gzip_level, async_mode)
+        if result is None:
+            return 1
+        results.append(result)
+    server.shutdown()
+
+    print(f"{'size':<5} {'docs':>10} {'docs/s':>10} {'MB/s':>8} {'peak RSS MB':>12} {'p50 ms':>8} {'p99 ms':>8}")
+    for result in results:
+        print(f"{result['size']:<5} {result['docs']:>10} {result['docs_per_sec']:>10.0f} "
+              f"{result['bytes_per_sec'] / 1e6:>8.1f} {result['peak_rss_mb']:>12.1f} "
+              f"{result['batch_p50_ms']:>8.1f} {result['batch_p99_ms']:>8.1f}")
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if baseline and check_regressions(results, baseline, tolerance):
+        return 1
+    return 1 if any(result["exit_code"] for result in results) else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Indexer throughput benchmarks against a local mock Elasticsearch")
+    parser.add_argument('--sizes', nargs='+', choices=list(SIZES), default=list(SIZES), help="Dataset sizes to run")
+    parser.add_argument('--workers', type=int, default=1, help="Parallel bulk senders passed to the indexer")
+    parser.add_argument('--latency', type=float, default=0.0, help="Mock latency per _bulk request in seconds")
+    parser.add_argument('--item-failure-rate', type=float, default=0.0, help="Fraction of bulk items the mock fails")
+    parser.add_argument('--reject-rate', type=float, default=0.0, help="Fraction of _bulk requests rejected with 429")
+    parser.add_argument('--bandwidth-mbps', type=float, default=None, help="Simulated link speed of the mock")
+    parser.add_argument('--gzip-level', type=int, default=0, help="gzip level passed to the indexer (0: uncompressed)")
+    parser.add_argument('--async', dest='async_mode', action='store_true',
+                        help="Run the indexer in its asyncio mode, with --workers requests in flight")
+    parser.add_argument('--workdir', default=None, help="Directory for the generated datasets (reused if present)")
+    parser.add_argument('--output', default=None, help="Write the results as JSON to this file")
+    parser.add_argument('--baseline', default=None, help="Results JSON of a previous run to compare docs/sec against")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed docs/sec drop versus the baseline")
+    parser.add_argument('--child', metavar='CSV_FILE', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        sys.exit(run_child(args.child, args.workers, args.gzip_level, args.async_mode))
+    sys.exit(main(args.sizes, args.workers, args.latency, args.item_failure_rate, args.reject_rate,
+                  args.workdir, args.output, args.baseline, args.tolerance, args.gzip_level, args.bandwidth_mbps,
+                  args.async_mode))
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# benchmark_ingest.py
+import argparse
+import json
+import logging
+import sys
+import time
+
+import elasticsearch_grok_indexer as indexer
+
+MODES = ['client', 'grok', 'dissect']
+
+def reset_scratch_index(scratch_index):
+    """Delete and recreate a scratch index so every mode starts from an empty index"""
+    indexer.session.delete(f"{indexer.ES_HOST}/{scratch_index}", headers=indexer.ES_HEADERS)
+    response = indexer.session.put(f"{indexer.ES_HOST}/{scratch_index}", headers=indexer.ES_HEADERS)
+    response.raise_for_status()
+
+def run_mode(mode, csv_file, scratch_index):
+    """
+    Load csv_file into scratch_index with one parsing strategy and measure it.
+    client parses rows in Python; grok and dissect send raw lines to the matching ingest pipeline.
+    """
+    reset_scratch_index(scratch_index)
+    if mode == 'client':
+        pipeline_id = None
+        items = indexer.iter_index_items(indexer.iter_documents(csv_file), scratch_index)
+    else:
+        pipeline_id = indexer.create_pipeline(mode)
+        items = indexer.iter_raw_line_items(csv_file, scratch_index)
+
+    docs = 0
+    failed_batches = 0
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    for bulk_data in indexer.prepare_bulk_data(csv_file, items=items):
+        docs += bulk_data.count(b'\n') // 2
+        if not indexer.bulk_index(bulk_data, pipeline_id):
+            failed_batches += 1
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    indexer.session.delete(f"{indexer.ES_HOST}/{scratch_index}", headers=indexer.ES_HEADERS)
+    return {
+        "mode": mode,
+        "docs": docs,
+        "failed_batches": failed_batches,
+        "wall_seconds": round(wall, 3),
+        "client_cpu_seconds": round(cpu, 3),
+        "docs_per_sec": round(docs / wall, 1) if wall else None,
+        "client_cpu_us_per_doc": round(cpu / docs * 1e6, 2) if docs else None
+    }
+
+def main(csv_file='restaurants_cleaned.csv', modes=MODES, repeat=1, output=None):
+    if not indexer.ES_PASSWORD:
+        logging.error("ES_PASS environment variable not set. Please set it before running this script.")
+        return 1
+    # The bulk logging per batch would drown the report
+    logging.getLogger().setLevel(logging.WARNING)
+    results = []
+    for _ in range(repeat):
+        for mode in modes:
+            results.append(run_mode(mode, csv_file, f"{indexer.index_name}-bench-{mode}"))
+
+    print(f"{'mode':<8} {'docs':>10} {'wall s':>9} {'docs/s':>10} {'client cpu s':>13} {'cpu us/doc':>11}")
+    for result in results:
+        print(f"{result['mode']:<8} {result['docs']:>10} {result['wall_seconds']:>9} {result['docs_per_sec']:>10} "
+              f"{result['client_cpu_seconds']:>13} {result['client_cpu_us_per_doc']:>11}")
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 1 if any(result['failed_batches'] for result in results) else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare client-side parsing against grok and dissect ingest pipelines")
+    parser.add_argument('csv_file', nargs='?', default='restaurants_cleaned.csv', help="Cleaned CSV file to load")
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES, help="Parsing strategies to compare")
+    parser.add_argument('--repeat', type=int, default=1, help="Run every mode this many times")
+    parser.add_argument('--output', default=None, help="Also write the results as JSON to this file")
+    args = parser.parse_args()
+    sys.exit(main(args.csv_file, args.modes, args.repeat, args.output))
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# benchmark_search.py
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+import tempfile
+
+import elasticsearch_grok_indexer as indexer
+from benchmark_indexer import SIZES
+from query_runner import percentile_row, read_query_file, run_searches, timed_iterations
+from synthetic_restaurants import generate_dataset
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+QUERY_DIR = os.path.join('..', '..', 'section1Query')
+QUERY_FILES = [os.path.join(QUERY_DIR, 'Q1Query.txt'), os.path.join(QUERY_DIR, 'Q3Query.txt')]
+NAME_FIELD = 'RestaurantName'
+# text: wildcard over the word terms, what the queries do on a dynamically mapped index (the baseline);
+# wildcard: the wildcard field type; ngram: match_phrase over the trigrams
+VARIANTS = ['text', 'wildcard', 'ngram']
+# The benchmark loads synthetic data, so it gets its own alias instead of the one the real data is behind;
+# its name still matches the restaurants* template, so the mappings under test are the same
+PRODUCTION_INDEX = indexer.index_name
+BENCH_INDEX = f"{PRODUCTION_INDEX}-bench-search"
+
+def template_query(query, variant):
+    """
+    Copy of a section1 query for the index template: .keyword fields become
+    their keyword base field, and the wildcard and match clauses on
+    RestaurantName move to the sub-field of the variant.
+    """
+    if isinstance(query, list):
+        return [template_query(clause, variant) for clause in query]
+    if not isinstance(query, dict):
+        return query
+    if set(query) == {'wildcard'} and NAME_FIELD in query['wildcard']:
+        pattern = query['wildcard'][NAME_FIELD]
+        pattern = pattern.get('value', pattern.get('wildcard')) if isinstance(pattern, dict) else pattern
+        if variant == 'ngram' and re.fullmatch(r'\*[^*?]+\*', pattern):
+            return {"match_phrase": {f"{NAME_FIELD}.ngram": pattern[1:-1]}}
+        if variant == 'wildcard':
+            return {"wildcard": {f"{NAME_FIELD}.wildcard": {"value": pattern, "case_insensitive": True}}}
+        return {"wildcard": {f"{NAME_FIELD}.text": pattern}}
+    if set(query) == {'match'} and NAME_FIELD in query['match']:
+        return {"match": {f"{NAME_FIELD}.text": query['match'][NAME_FIELD]}}
+    rewritten = {}
+    for key, value in query.items():
+        if key.endswith('.keyword'):
+            key = key[:-len('.keyword')]
+        if key == 'field' and isinstance(value, str) and value.endswith('.keyword'):
+            value = value[:-len('.keyword')]
+        rewritten[key] = template_query(value, variant)
+    return rewritten
+
+def production_indices():
+    """The production alias and the concrete indices behind it"""
+    response = indexer.session.get(f"{indexer.ES_HOST}/{PRODUCTION_INDEX}/_alias", headers=indexer.ES_HEADERS)
+    if response.status_code == 404:
+        return {PRODUCTION_INDEX}
+    response.raise_for_status()
+    return {PRODUCTION_INDEX, *response.json()}
+
+def load(csv_file, workers, index):
+    """Index csv_file into a fresh generation behind the index alias, with the template mappings"""
+    logging.info(f"Indexing {csv_file} into {index}")
+    level = logging.getLogger().level
+    logging.getLogger().setLevel(logging.WARNING)
+    indexer.index_name = index
+    try:
+        exit_code = indexer.main(csv_file, workers=workers, bulk_load=True)
+    finally:
+        indexer.index_name = PRODUCTION_INDEX
+        logging.getLogger().setLevel(level)
+    return exit_code
+
+def main(size='10m', iterations=20, concurrency=1, workers=4, workdir=None, skip_load=False, output=None,
+         index=BENCH_INDEX):
+    if not indexer.ES_PASSWORD:
+        logging.error("ES_PASS environment variable not set. Please set it before running this script.")
+        return 1
+    try:
+        protected = production_indices()
+    except Exception as e:
+        logging.error(f"Failed to look up the indices behind {PRODUCTION_INDEX}: {str(e)}")
+        return 1
+    if index in protected:
+        logging.error(f"Refusing to benchmark {index}: it is the production alias {PRODUCTION_INDEX} or behind it")
+        return 1
+    workdir = workdir or tempfile.mkdtemp(prefix='restaurants-search-bench-')
+    csv_file = os.path.join(workdir, f"restaurants_{size}.csv")
+    if not skip_load:
+        if not os.path.exists(csv_file):
+            generate_dataset(csv_file, SIZES[size])
+        if load(csv_file, workers, index):
+            logging.error("Loading the benchmark data failed")
+            return 1
+
+    results = []
+    mismatches = 0
+    try:
+        for query_file in QUERY_FILES:
+            # The queries name the production alias; they run against the benchmark data instead
+            _, body = read_query_file(query_file)
+            totals = {}
+            for variant in VARIANTS:
+                search = (index, template_query(body, variant))
+                (response,), _ = run_searches([search])
+                if "error" in response:
+                    logging.error(f"{query_file} ({variant}) failed: {json.dumps(response['error'])}")
+                    return 1
+                totals[variant] = response["hits"]["total"]["value"]
+                took, _ = timed_iterations([search], iterations, concurrency)
+                results.append({"query": os.path.basename(query_file), "variant": variant, "hits": totals[variant],
+                                **dict(zip(("p50_ms", "p95_ms", "p99_ms"), percentile_row(took[0])))})
+            if len(set(totals.values())) > 1:
+                mismatches += 1
+                logging.error(f"{query_file}: variants disagree on the hit count: {totals}")
+    except Exception as e:
+        logging.error(f"Error running the benchmark queries: {str(e)}")
+        return 1
+
+    baseline = {result["query"]: result["p50_ms"] for result in results if result["variant"] == VARIANTS[0]}
+    print(f"{'query':<14} {'variant':<9} {'hits':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'speedup':>8}")
+    for result in results:
+        speedup = baseline[result["query"]] / result["p50_ms"] if result["p50_ms"] else float('nan')
+        print(f"{result['query']:<14} {result['variant']:<9} {result['hits']:>8} {result['p50_ms']:>8.1f} "
+              f"{result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f} {speedup:>7.1f}x")
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 1 if mismatches else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Substring search latency of RestaurantName: text wildcard vs wildcard field vs n-gram phrase")
+    parser.add_argument('--size', choices=list(SIZES), default='10m', help="Synthetic dataset size to index")
+    parser.add_argument('--iterations', type=int, default=20, help="Timed runs of every query variant")
+    parser.add_argument('--concurrency', type=int, default=1, help="Runs in flight at once")
+    parser.add_argument('--workers', type=int, default=4, help="Bulk senders used to load the data")
+    parser.add_argument('--workdir', default=None, help="Directory for the generated dataset (reused if present)")
+    parser.add_argument('--skip-load', action='store_true', help="Query the data already behind --index")
+    parser.add_argument('--index', default=BENCH_INDEX,
+                        help=f"Scratch alias to load and query; never the production alias {PRODUCTION_INDEX}")
+    parser.add_argument('--output', default=None, help="Write the results as JSON to this file")
+    args = parser.parse_args()
+    sys.exit(main(args.size, args.iterations, args.concurrency, args.workers, args.workdir, args.skip_load,
+                  args.output, args.index))
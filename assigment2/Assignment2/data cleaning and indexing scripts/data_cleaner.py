@@ -1,36 +1,168 @@
 # data_cleaner.py
 import pandas as pd
 import numpy as np
-import re
 import logging
 from tqdm import tqdm
 import os
+import io
+import sys
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from pandas.api.types import union_categoricals
+from metrics import add_metrics_arguments, finish_metrics, metrics_from_args, timed_stage
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def clean_restaurant_data(input_file='restaurants.csv', output_file='restaurants_cleaned.csv'):
+ISO_DATE_PATTERN = r'\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}Z'
+ISO_DATE_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+# Text columns are read as str in partitions so a partition never infers a numeric type on its own
+TEXT_COLUMNS = ['RestaurantName', 'RatingText', 'Date', 'Coordinates', 'City/Country/Continent']
+COORDINATES_PATTERN = r'\[\s*([-+]?\d*\.?\d+)\s*,\s*([-+]?\d*\.?\d+)\s*\]'
+# Low-cardinality text columns read as category in compact mode
+COMPACT_DTYPES = {'RatingText': 'category', 'City/Country/Continent': 'category'}
+NUMERIC_COLUMNS = ['SerialNumber', 'AverageCostForTwo', 'AggregateRating', 'Votes']
+
+def clean_dates(dates):
     """
-    Clean and prepare the restaurant dataset for Elasticsearch import
+    Keep ISO dates as they are and convert any other parseable date to ISO.
+    Missing or unparseable dates become None.
     """
-    logging.info(f"Starting data cleaning process for {input_file}")
+    text = dates.astype(str)
+    is_iso = dates.notna() & text.str.match(ISO_DATE_PATTERN, na=False)
+    to_parse = dates.notna() & ~is_iso
     
-    df = pd.read_csv(input_file, sep=';')
-    
-    # Display initial info
-    logging.info(f"Original dataset: {df.shape[0]} rows, {df.shape[1]} columns")
-    logging.info(f"Column names: {list(df.columns)}")
+    cleaned = pd.Series(None, index=dates.index, dtype=object)
+    cleaned[is_iso] = dates[is_iso]
+    if to_parse.any():
+        try:
+            # Parse every non-ISO cell on its own format, unparseable cells become NaT
+            parsed = pd.to_datetime(dates[to_parse], errors='coerce', format='mixed')
+            formatted = parsed.dt.strftime(ISO_DATE_FORMAT).where(parsed.notna(), None)
+        except ValueError:
+            # Cells with different UTC offsets cannot share one datetime column,
+            # so each distinct value is parsed alone, keeping its local time
+            unique = dates[to_parse].unique()
+            formatted = dates[to_parse].map(dict(zip(unique, map(parse_date, unique))))
+        cleaned[to_parse] = formatted
+    return cleaned
+
+def parse_date(value):
+    """A single date converted to ISO, or None when it cannot be parsed"""
+    try:
+        return pd.to_datetime(value).strftime(ISO_DATE_FORMAT)
+    except (ValueError, TypeError, OverflowError):
+        return None
+
+def clean_categories(series, cleaner):
+    """
+    Run a vectorized cleaner once per category instead of once per row and
+    rebuild the categorical from its results (missing cells are cleaned as NaN)
+    """
+    categories = pd.Series(list(series.cat.categories) + [np.nan], dtype=object)
+    new_codes, new_categories = pd.factorize(cleaner(categories))
+    # Missing cells have code -1, which picks the NaN entry appended above
+    codes = new_codes[series.cat.codes.to_numpy()]
+    return pd.Series(pd.Categorical.from_codes(codes, categories=new_categories), index=series.index, name=series.name)
+
+def fill_text(series, value):
+    """
+    fillna that also works on categorical columns, where value must be a category first
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype) and value not in series.cat.categories:
+        series = series.cat.add_categories([value])
+    return series.fillna(value)
+
+def downcast_numeric(series):
+    """
+    Shrink integers to the smallest integer type and floats to float32 when
+    every value survives the round trip, so the written values do not change
+    """
+    if pd.api.types.is_integer_dtype(series.dtype):
+        return pd.to_numeric(series, downcast='integer')
+    if pd.api.types.is_float_dtype(series.dtype) and series.dtype != np.float32:
+        narrow = series.astype(np.float32)
+        if np.array_equal(narrow.to_numpy(dtype=np.float64), series.to_numpy(), equal_nan=True):
+            return narrow
+    return series
+
+def read_dtypes(compact):
+    """
+    Explicit dtypes for read_csv in compact mode; None lets pandas infer them
+    """
+    if not compact:
+        return None
+    return {**{column: str for column in TEXT_COLUMNS}, **COMPACT_DTYPES}
+
+def frame_memory(df):
+    """
+    Bytes held by a frame, including the Python strings it points to
+    """
+    return int(df.memory_usage(deep=True).sum())
+
+def report_memory(df, stage, metrics=None):
+    """
+    Log the deep memory use of a frame and record it as a gauge
+    """
+    size = frame_memory(df)
+    logging.info(f"Memory {stage}: {size / 1e6:.1f} MB for {len(df)} rows ({size / max(len(df), 1):.0f} bytes/row)")
+    if metrics is not None:
+        metrics.set_gauge(f'frame_bytes_{stage.replace(" ", "_")}', size)
+    return size
+
+def clean_locations(locations):
+    """
+    Fill missing locations and blank out values that are not exactly City/Country/Continent.
+    """
+    if isinstance(locations.dtype, pd.CategoricalDtype):
+        return clean_categories(locations, clean_locations)
+    filled = locations.fillna('Unknown/Unknown/Unknown')
+    return filled.where(filled.str.count('/') == 2, None)
+
+def clean_coordinates(coordinates):
+    """
+    Keep well-formed [lat, lon] strings, rebuild the ones that only contain a
+    [lat, lon] pair and zero out-of-range values, default everything else to [0, 0].
+    """
+    text = coordinates.astype(str)
+    is_valid = coordinates.notna() & text.str.match(COORDINATES_PATTERN, na=False)
     
-    # Check for missing values
-    missing_values = df.isnull().sum()
-    logging.info(f"Missing values by column:\n{missing_values}")
+    extracted = text.str.extract(COORDINATES_PATTERN).astype(float)
+    lat = extracted[0].to_numpy()
+    lon = extracted[1].to_numpy()
+    # Out-of-range values are reset to 0
+    lat_text = np.where((lat < -90) | (lat > 90), '0', lat.astype(str))
+    lon_text = np.where((lon < -180) | (lon > 180), '0', lon.astype(str))
+    rebuilt = pd.Series(np.char.add(np.char.add('[', lat_text), np.char.add(', ', np.char.add(lon_text, ']'))),
+                        index=coordinates.index, dtype=object)
+    rebuilt[extracted[0].isna()] = '[0, 0]'
     
+    return rebuilt.where(~is_valid, coordinates)
+
+CLEANING_STAGES = ['numeric', 'fill_missing', 'dates', 'locations', 'coordinates']
+
+def clean_frame(df, show_progress=True, metrics=None, compact=False):
+    """
+    Apply the field-level cleaning steps to a frame of raw rows.
+    With compact set the numeric columns are downcast once they are cleaned.
+    """
     # Rename the first column to SerialNumber
     first_col = df.columns[0]
     df = df.rename(columns={first_col: 'SerialNumber'})
     
-    # Clean numeric fields with progress bar
-    for _ in tqdm(range(1), desc="Cleaning numeric fields"):
+    # Every step is vectorized over all rows, so progress is reported per step
+    progress = tqdm(total=len(CLEANING_STAGES), desc=f"Cleaning {len(df)} rows", unit="step",
+                    disable=not show_progress)
+    
+    # Clean numeric fields
+    progress.set_postfix_str('numeric')
+    with timed_stage(metrics, 'numeric'):
         # Clean AggregateRating - ensure it's numeric
         df['AggregateRating'] = pd.to_numeric(df['AggregateRating'], errors='coerce')
         
@@ -39,90 +171,396 @@ def clean_restaurant_data(input_file='restaurants.csv', output_file='restaurants
         
         # Clean AverageCostForTwo - ensure it's numeric
         df['AverageCostForTwo'] = pd.to_numeric(df['AverageCostForTwo'], errors='coerce')
+    progress.update()
     
     # Fill missing values appropriately
-    df['RestaurantName'] = df['RestaurantName'].fillna('Unknown Restaurant')
-    df['RatingText'] = df['RatingText'].fillna('Not Rated')
-    df['AggregateRating'] = df['AggregateRating'].fillna(0)
-    df['Votes'] = df['Votes'].fillna(0)
-    df['AverageCostForTwo'] = df['AverageCostForTwo'].fillna(0)
-    
-    # Validate date format
-    def validate_date(date_str):
-        if pd.isna(date_str):
-            return None
-        # Check if date is already in ISO format
-        if re.match(r'\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}Z', str(date_str)):
-            return date_str
-        try:
-            # Try to parse as datetime and convert to ISO
-            date = pd.to_datetime(date_str)
-            return date.strftime('%Y-%m-%dT%H:%M:%SZ')
-        except:
-            return None
+    progress.set_postfix_str('fill_missing')
+    with timed_stage(metrics, 'fill_missing'):
+        df['RestaurantName'] = df['RestaurantName'].fillna('Unknown Restaurant')
+        df['RatingText'] = fill_text(df['RatingText'], 'Not Rated')
+        df['AggregateRating'] = df['AggregateRating'].fillna(0)
+        df['Votes'] = df['Votes'].fillna(0)
+        df['AverageCostForTwo'] = df['AverageCostForTwo'].fillna(0)
+        if compact:
+            for column in NUMERIC_COLUMNS:
+                df[column] = downcast_numeric(df[column])
+    progress.update()
     
-    df['Date'] = df['Date'].apply(validate_date)
+    progress.set_postfix_str('dates')
+    with timed_stage(metrics, 'dates'):
+        df['Date'] = clean_dates(df['Date'])
+    progress.update()
     
     # Handle City/Country/Continent
-    def split_location(location_str):
-        if pd.isna(location_str):
-            return 'Unknown/Unknown/Unknown'
+    progress.set_postfix_str('locations')
+    with timed_stage(metrics, 'locations'):
+        df['City/Country/Continent'] = clean_locations(df['City/Country/Continent'])
+        # Remove rows where City/Country/Continent is None
+        df = df.dropna(subset=['City/Country/Continent'])
+    progress.update()
+    
+    progress.set_postfix_str('coordinates')
+    with timed_stage(metrics, 'coordinates'):
+        df['Coordinates'] = clean_coordinates(df['Coordinates'])
+    if compact:
+        # The date and coordinate cleaners build object columns, which the string dtype stores more compactly
+        df = df.astype({'Date': 'str', 'Coordinates': 'str'})
+    progress.update()
+    progress.close()
+    return df
+
+def row_hashes(df):
+    """
+    64-bit hash of every row, stable across chunks whatever dtype pandas inferred
+    """
+    numeric_columns = df.select_dtypes(include='number').columns
+    canonical = df.astype({column: 'float64' for column in numeric_columns})
+    return pd.util.hash_pandas_object(canonical, index=False).to_numpy()
+
+def drop_seen_rows(df, seen_hashes):
+    """
+    Drop rows whose hash is already in seen_hashes (or repeats within df) and record the rest
+    """
+    hashes = row_hashes(df)
+    is_seen = np.fromiter((h in seen_hashes for h in hashes.tolist()), dtype=bool, count=len(hashes))
+    is_duplicate = pd.Series(hashes).duplicated().to_numpy() | is_seen
+    seen_hashes.update(hashes[~is_duplicate].tolist())
+    return df[~is_duplicate], int(is_duplicate.sum())
+
+def record_counts(metrics, rows_read, duplicates, rows_kept):
+    """
+    Add the row counters of a cleaning pass to metrics when they are being collected
+    """
+    if metrics is not None:
+        metrics.inc('rows_read', rows_read)
+        metrics.inc('duplicates_removed', duplicates)
+        metrics.inc('rows_cleaned', rows_kept)
+
+def iter_cleaned_chunks(input_file, chunksize, stats=None, output_file=None, metrics=None, compact=False):
+    """
+    Read the CSV in chunks and yield each chunk cleaned and de-duplicated
+    against every chunk before it. Running totals are kept in stats, and
+    each chunk is also appended to output_file when one is given.
+    With compact set the chunks use category and downcast numeric dtypes.
+    """
+    stats = stats if stats is not None else {}
+    stats.update({'rows': 0, 'columns': 0, 'missing_values': None, 'duplicates': 0, 'final_rows': 0})
+    seen_hashes = set()
+    
+    reader = iter(pd.read_csv(input_file, sep=';', chunksize=chunksize, dtype=read_dtypes(compact)))
+    progress = tqdm(desc="Cleaning", unit="rows", unit_scale=True)
+    while True:
+        with timed_stage(metrics, 'read_csv'):
+            chunk = next(reader, None)
+        if chunk is None:
+            break
+        if stats['rows'] == 0:
+            logging.info(f"Column names: {list(chunk.columns)}")
+        stats['rows'] += len(chunk)
+        stats['columns'] = chunk.shape[1]
         
-        parts = location_str.split('/')
-        if len(parts) != 3:
-            # If parts are not exactly 3, return None to filter out this row
-            return None
-        return '/'.join(parts)
-    
-    df['City/Country/Continent'] = df['City/Country/Continent'].apply(split_location)
-    # Remove rows where City/Country/Continent is None
-    df = df.dropna(subset=['City/Country/Continent'])
-    
-    # Validate coordinates
-    def validate_coordinates(coord_str):
-        if pd.isna(coord_str):
-            return '[0, 0]'  # Default coordinates if missing
-            
-        # Check if it's already in [lat, lon] format
-        if re.match(r'\[\s*[-+]?\d*\.?\d+\s*,\s*[-+]?\d*\.?\d+\s*\]', str(coord_str)):
-            return coord_str
-            
-        try:
-            # Try to extract lat and lon values
-            match = re.search(r'\[\s*([-+]?\d*\.?\d+)\s*,\s*([-+]?\d*\.?\d+)\s*\]', str(coord_str))
-            if match:
-                lat = float(match.group(1))
-                lon = float(match.group(2))
-                # Validate latitude range
-                if lat < -90 or lat > 90:
-                    lat = 0
-                # Validate longitude range
-                if lon < -180 or lon > 180:
-                    lon = 0
-                return f"[{lat}, {lon}]"
-            else:
-                return '[0, 0]'
-        except:
-            return '[0, 0]'
-    
-    df['Coordinates'] = df['Coordinates'].apply(validate_coordinates)
+        # Check for missing values
+        missing_values = chunk.isnull().sum()
+        if stats['missing_values'] is not None:
+            missing_values = stats['missing_values'].add(missing_values, fill_value=0).astype('int64')
+        stats['missing_values'] = missing_values
+        
+        chunk_rows = len(chunk)
+        first_chunk = stats['rows'] == chunk_rows
+        if first_chunk:
+            report_memory(chunk, 'after read', metrics)
+        chunk = clean_frame(chunk, show_progress=False, metrics=metrics, compact=compact)
+        if first_chunk:
+            report_memory(chunk, 'after cleaning', metrics)
+        
+        # Exact de-duplication across chunks through the row hash set
+        with timed_stage(metrics, 'dedup'):
+            chunk, duplicate_count = drop_seen_rows(chunk, seen_hashes)
+        stats['duplicates'] += duplicate_count
+        stats['final_rows'] += len(chunk)
+        record_counts(metrics, chunk_rows, duplicate_count, len(chunk))
+        
+        if output_file:
+            # Write the header with the first chunk, then append
+            first_chunk = stats['final_rows'] == len(chunk)
+            with timed_stage(metrics, 'write_csv'):
+                chunk.to_csv(output_file, sep=';', index=False, mode='w' if first_chunk else 'a', header=first_chunk)
+        
+        logging.info(f"Processed {stats['rows']} rows so far: "
+                     f"{stats['duplicates']} duplicates removed, {stats['final_rows']} rows kept")
+        progress.update(chunk_rows)
+        yield chunk
+    progress.close()
+
+def typed_schema():
+    """
+    Schema of the typed Parquet output: numbers, split coordinates and
+    location parts, a parsed UTC timestamp and dictionary-encoded repeated strings
+    """
+    repeated_string = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ('SerialNumber', pa.int64()),
+        ('RestaurantName', pa.string()),
+        ('AverageCostForTwo', pa.int64()),
+        ('AggregateRating', pa.float64()),
+        ('RatingText', repeated_string),
+        ('Votes', pa.float64()),
+        ('Date', pa.timestamp('ms', tz='UTC')),
+        ('lat', pa.float64()),
+        ('lon', pa.float64()),
+        ('City', repeated_string),
+        ('Country', repeated_string),
+        ('Continent', repeated_string)
+    ])
+
+def to_typed_table(df):
+    """
+    Convert a cleaned frame to an Arrow table with the typed schema
+    """
+    coordinates = df['Coordinates'].astype(str).str.extract(COORDINATES_PATTERN).astype(float)
+    locations = df['City/Country/Continent'].astype(str).str.split('/', expand=True).reindex(columns=[0, 1, 2])
+    typed = pd.DataFrame({
+        'SerialNumber': df['SerialNumber'].astype('int64'),
+        'RestaurantName': df['RestaurantName'].astype(str),
+        'AverageCostForTwo': df['AverageCostForTwo'].astype('int64'),
+        'AggregateRating': df['AggregateRating'].astype(float),
+        'RatingText': df['RatingText'].astype(str),
+        'Votes': df['Votes'].astype(float),
+        'Date': pd.to_datetime(df['Date'], format=ISO_DATE_FORMAT, errors='coerce', utc=True),
+        'lat': coordinates[0],
+        'lon': coordinates[1],
+        'City': locations[0],
+        'Country': locations[1],
+        'Continent': locations[2]
+    })
+    return pa.Table.from_pandas(typed, schema=typed_schema(), preserve_index=False)
+
+def require_pyarrow():
+    """
+    Stop with a clear message when typed output is asked for without pyarrow
+    """
+    if pa is None:
+        logging.error("Typed Parquet output requires pyarrow (pip install pyarrow)")
+        sys.exit(1)
+
+def open_typed_writer(typed_output):
+    """
+    Open a Parquet writer for the typed output
+    """
+    require_pyarrow()
+    return pq.ParquetWriter(typed_output, typed_schema())
+
+def write_typed_output(df, typed_output, metrics=None):
+    """
+    Write the whole cleaned frame as a typed Parquet file
+    """
+    with timed_stage(metrics, 'write_parquet'):
+        writer = open_typed_writer(typed_output)
+        writer.write_table(to_typed_table(df))
+        writer.close()
+    logging.info(f"Typed data saved to '{typed_output}'")
+
+def clean_restaurant_data_chunked(input_file, output_file, chunksize, metrics=None, typed_output=None, compact=False):
+    """
+    Clean the dataset chunk by chunk with bounded memory, appending each
+    cleaned chunk to the output file (and as a row group to typed_output).
+    Numeric dtypes are inferred per chunk, so a cost column with gaps in one
+    chunk is written to the CSV as 60.0 there and 60 elsewhere.
+    """
+    logging.info(f"Starting chunked data cleaning process for {input_file} ({chunksize} rows per chunk)")
+    
+    stats = {}
+    columns = None
+    writer = open_typed_writer(typed_output) if typed_output else None
+    for chunk in iter_cleaned_chunks(input_file, chunksize, stats, output_file, metrics, compact):
+        columns = chunk.shape[1]
+        if writer is not None:
+            with timed_stage(metrics, 'write_parquet'):
+                writer.write_table(to_typed_table(chunk))
+    if writer is not None:
+        writer.close()
+        logging.info(f"Typed data saved to '{typed_output}'")
+    
+    logging.info(f"Original dataset: {stats['rows']} rows, {stats['columns']} columns")
+    logging.info(f"Missing values by column:\n{stats['missing_values']}")
+    logging.info(f"Found {stats['duplicates']} duplicate entries")
+    logging.info(f"Cleaning complete. Data saved to '{output_file}'")
+    logging.info(f"Final dataset: {stats['final_rows']} rows, {columns} columns")
+    return stats
+
+def partition_byte_ranges(input_file, partitions):
+    """
+    Split the body of the CSV into byte ranges that start and end on line boundaries.
+    Assumes no quoted field spans several lines, which holds for the restaurant files.
+    """
+    size = os.path.getsize(input_file)
+    with open(input_file, 'rb') as f:
+        header = f.readline()
+        body_start = f.tell()
+        bounds = [body_start]
+        for i in range(1, partitions):
+            f.seek(body_start + (size - body_start) * i // partitions)
+            f.readline()
+            bounds.append(max(f.tell(), bounds[-1]))
+    bounds.append(size)
+    ranges = [(begin, end) for begin, end in zip(bounds, bounds[1:]) if end > begin]
+    return header, ranges
+
+def clean_partition(input_file, header, byte_range, compact=False):
+    """
+    Read and clean one byte range of the CSV (runs in a worker process)
+    """
+    begin, end = byte_range
+    with open(input_file, 'rb') as f:
+        f.seek(begin)
+        data = f.read(end - begin)
+    df = pd.read_csv(io.BytesIO(header + data), sep=';', dtype=read_dtypes(compact) or {column: str for column in TEXT_COLUMNS})
+    return len(df), df.isnull().sum(), clean_frame(df, show_progress=False, compact=compact)
+
+def render_shard(df, header):
+    """
+    Format one slice of the cleaned frame as CSV text (runs in a worker process)
+    """
+    return df.to_csv(sep=';', index=False, header=header)
+
+def unify_categories(frames):
+    """
+    Give every categorical column the same categories in all frames, so
+    concatenating them keeps the category dtype instead of falling back to object
+    """
+    for column in frames[0].select_dtypes(include='category').columns:
+        categories = union_categoricals([frame[column] for frame in frames]).categories
+        for frame in frames:
+            frame[column] = frame[column].cat.set_categories(categories)
+    return frames
+
+def clean_restaurant_data_parallel(input_file, output_file, workers, metrics=None, typed_output=None, compact=False):
+    """
+    Clean the dataset on several processes. The file is split into byte
+    ranges cleaned in parallel; duplicates are then removed over the
+    combined frame and the CSV shards are rendered in parallel and written
+    back in their original order, so the output matches a single-process run.
+    """
+    logging.info(f"Starting parallel data cleaning process for {input_file} with {workers} workers")
+    
+    header, ranges = partition_byte_ranges(input_file, workers)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        with timed_stage(metrics, 'clean_partitions'):
+            results = list(executor.map(clean_partition, repeat(input_file), repeat(header), ranges, repeat(compact)))
+        
+        # Display initial info
+        total_rows = sum(rows for rows, _, _ in results)
+        logging.info(f"Original dataset: {total_rows} rows, {results[0][2].shape[1]} columns")
+        
+        # Check for missing values
+        missing_values = results[0][1]
+        for _, missing, _ in results[1:]:
+            missing_values = missing_values + missing
+        logging.info(f"Missing values by column:\n{missing_values}")
+        
+        # Concatenating unifies the per-partition dtypes the same way a whole-file read would
+        df = pd.concat(unify_categories([frame for _, _, frame in results]))
+        del results
+        report_memory(df, 'after cleaning', metrics)
+        
+        # Check for duplicates
+        with timed_stage(metrics, 'dedup'):
+            duplicate_count = df.duplicated().sum()
+            logging.info(f"Found {duplicate_count} duplicate entries")
+            if duplicate_count > 0:
+                df = df.drop_duplicates()
+                logging.info(f"Removed duplicates. New size: {df.shape[0]} rows")
+        
+        record_counts(metrics, total_rows, int(duplicate_count), len(df))
+        
+        # Render the shards in parallel and write them back in order
+        shard_bounds = np.linspace(0, len(df), workers + 1, dtype=int)
+        shards = [df.iloc[begin:end] for begin, end in zip(shard_bounds, shard_bounds[1:])]
+        headers = [True] + [False] * (len(shards) - 1)
+        with timed_stage(metrics, 'write_csv'), open(output_file, 'w', encoding='utf-8', newline='') as f:
+            for text in executor.map(render_shard, shards, headers):
+                f.write(text)
+    if typed_output:
+        write_typed_output(df, typed_output, metrics)
+    
+    logging.info(f"Cleaning complete. Data saved to '{output_file}'")
+    logging.info(f"Final dataset: {df.shape[0]} rows, {df.shape[1]} columns")
+    return df
+
+def clean_restaurant_data(input_file='restaurants.csv', output_file='restaurants_cleaned.csv', chunksize=None, workers=1,
+                          metrics=None, typed_output=None, compact=False):
+    """
+    Clean and prepare the restaurant dataset for Elasticsearch import.
+    With chunksize set the file is streamed instead (see clean_restaurant_data_chunked)
+    and the run statistics are returned instead of the cleaned frame.
+    With workers > 1 the cleaning runs on a process pool (see clean_restaurant_data_parallel).
+    Pass a metrics.Metrics to collect stage timings and row counters.
+    With typed_output the cleaned rows are also written as typed Parquet (needs pyarrow).
+    With compact set low-cardinality text is read as category and numeric
+    columns are downcast, which keeps the output the same with less memory.
+    """
+    if typed_output:
+        # Fail before the cleaning work rather than after it
+        require_pyarrow()
+    if workers > 1:
+        return clean_restaurant_data_parallel(input_file, output_file, workers, metrics, typed_output, compact)
+    if chunksize:
+        return clean_restaurant_data_chunked(input_file, output_file, chunksize, metrics, typed_output, compact)
+    
+    logging.info(f"Starting data cleaning process for {input_file}")
+    
+    with timed_stage(metrics, 'read_csv'):
+        df = pd.read_csv(input_file, sep=';', dtype=read_dtypes(compact))
+    report_memory(df, 'after read', metrics)
+    
+    # Display initial info
+    logging.info(f"Original dataset: {df.shape[0]} rows, {df.shape[1]} columns")
+    logging.info(f"Column names: {list(df.columns)}")
+    
+    # Check for missing values
+    missing_values = df.isnull().sum()
+    logging.info(f"Missing values by column:\n{missing_values}")
+    
+    rows_read = len(df)
+    df = clean_frame(df, metrics=metrics, compact=compact)
+    report_memory(df, 'after cleaning', metrics)
     
     # Check for duplicates
-    duplicate_count = df.duplicated().sum()
-    logging.info(f"Found {duplicate_count} duplicate entries")
-    if duplicate_count > 0:
-        df = df.drop_duplicates()
-        logging.info(f"Removed duplicates. New size: {df.shape[0]} rows")
+    with timed_stage(metrics, 'dedup'):
+        duplicate_count = df.duplicated().sum()
+        logging.info(f"Found {duplicate_count} duplicate entries")
+        if duplicate_count > 0:
+            df = df.drop_duplicates()
+            logging.info(f"Removed duplicates. New size: {df.shape[0]} rows")
+    
+    record_counts(metrics, rows_read, int(duplicate_count), len(df))
     
     # Save the cleaned data
-    df.to_csv(output_file, sep=';', index=False)
+    with timed_stage(metrics, 'write_csv'):
+        df.to_csv(output_file, sep=';', index=False)
+    if typed_output:
+        write_typed_output(df, typed_output, metrics)
     logging.info(f"Cleaning complete. Data saved to '{output_file}'")
     logging.info(f"Final dataset: {df.shape[0]} rows, {df.shape[1]} columns")
     
     return df
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Clean the restaurant dataset for Elasticsearch import")
     # Use correct relative paths
-    input_file = '../restaurants.csv'
-    output_file = 'restaurants_cleaned.csv'
-    clean_restaurant_data(input_file, output_file) 
\ No newline at end of file
+    parser.add_argument('input_file', nargs='?', default='../restaurants.csv', help="Raw semicolon-separated CSV")
+    parser.add_argument('output_file', nargs='?', default='restaurants_cleaned.csv', help="Where to write the cleaned CSV")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--chunksize', type=int, default=None,
+                      help="Stream the input in chunks of this many rows to bound memory")
+    mode.add_argument('--workers', type=int, default=1, help="Clean partitions of the input on N processes")
+    parser.add_argument('--compact', action='store_true',
+                        help="Use category and downcast numeric dtypes to fit more rows in memory")
+    parser.add_argument('--parquet', dest='typed_output', default=None,
+                        help="Also write a typed Parquet file (split coordinates and location, parsed dates)")
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    metrics = metrics_from_args(args)
+    clean_restaurant_data(args.input_file, args.output_file, chunksize=args.chunksize, workers=args.workers,
+                          metrics=metrics, typed_output=args.typed_output, compact=args.compact)
+    finish_metrics(metrics, args)
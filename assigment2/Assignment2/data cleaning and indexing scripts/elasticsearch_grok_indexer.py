@@ -1,14 +1,47 @@
 #!/usr/bin/env python3
 # elasticsearch_grok_indexer.py
 import pandas as pd
+import numpy as np
 import json
 import requests
 import urllib3
 import logging
 import sys
 import os
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
-import re
+import io
+import gzip
+import time
+import queue
+import threading
+import argparse
+import asyncio
+import hashlib
+import itertools
+import random
+from concurrent.futures import ThreadPoolExecutor
+from tqdm import tqdm
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+from data_cleaner import iter_cleaned_chunks
+from geo_index import GEOHASH_FIELDS, geohash_columns
+from metrics import Metrics, add_metrics_arguments, finish_metrics, metrics_from_args
+from partitions import (PARTITION_DOCS_PER_SHARD, PARTITION_RUN_FORMAT, PARTITION_UNDATED, partition_index,
+                        partition_key, partition_keys, partition_shards)
+from rollup import ROLLUP_INDEX, Rollup, rollup_mappings
 
 # Suppress insecure HTTPS warnings
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -17,31 +50,96 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # Elasticsearch connection settings
-ES_HOST = "https://localhost:9200"
+ES_HOST = os.environ.get('ES_HOST', "https://localhost:9200")
 ES_USER = "elastic"
 ES_PASSWORD = os.environ.get('ES_PASS')
-if not ES_PASSWORD:
-    logging.error("ES_PASS environment variable not set. Please set it before running this script.")
-    sys.exit(1)
 ES_HEADERS = {"Content-Type": "application/json"}
-ES_AUTH = HTTPBasicAuth(ES_USER, ES_PASSWORD)
+ES_AUTH = HTTPBasicAuth(ES_USER, ES_PASSWORD) if ES_PASSWORD else None
 index_name = "restaurants"
+INDEX_SHARDS = 1
+INDEX_REPLICAS = 0
+# RestaurantName.ngram holds the lowercase trigrams of each word (apostrophes kept, like the standard tokenizer)
+NAME_NGRAM_SIZE = 3
+NAME_NGRAM_CUSTOM_CHARS = "'"
 
-def create_pipeline():
-    """Create the grok-based ingestion pipeline"""
-    pipeline_id = "restaurants_grok_pipeline"
+# Bulk batching limits; keep batches well below ES http.max_content_length
+CSV_CHUNK_SIZE = 10000
+# Documents encoded between two reads of the serialize timer
+SERIALIZE_GROUP_SIZE = 1000
+BULK_MAX_BYTES = 10 * 1024 * 1024
+BULK_MAX_DOCS = 5000
+
+# gzip level for _bulk request bodies (0 sends them uncompressed); compression runs in chunks of this size
+BULK_GZIP_LEVEL = 0
+GZIP_CHUNK_SIZE = 64 * 1024
+# Link speed assumed when estimating the send time gzip saves
+BULK_LINK_MBPS = 100
+
+# Per-document content hashes from the last incremental run
+STATE_FILE = "index_state.json"
+
+# Concurrency and backoff settings for the bulk senders
+HTTP_POOL_SIZE = 16
+BULK_WORKERS = 4
+BULK_MAX_RETRIES = 5
+BULK_BACKOFF_BASE = 0.5
+BULK_BACKOFF_MAX = 30
+
+# Failed bulk items worth resending; 409 version conflicts only when asked for
+RETRYABLE_ITEM_STATUSES = {429, 503}
+CONFLICT_STATUS = 409
+ITEM_MAX_RETRIES = 5
+# gzip level of the resent items of a compressed batch
+RETRY_GZIP_LEVEL = 6
+# Documents that still failed after the retries, one JSON object per line
+DEAD_LETTER_FILE = "bulk_dead_letter.ndjson"
+
+def create_session(pool_size=HTTP_POOL_SIZE):
+    """Create a pooled HTTP session shared by all Elasticsearch calls"""
+    new_session = requests.Session()
+    new_session.auth = ES_AUTH
+    new_session.verify = False
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    new_session.mount('https://', adapter)
+    new_session.mount('http://', adapter)
+    return new_session
+
+session = create_session()
+
+# Stage timings and counters of the current run, shared by the sender threads
+metrics = Metrics()
+
+# Where permanently failed documents are appended, and which item statuses are resent
+dead_letter_file = DEAD_LETTER_FILE
+dead_letter_lock = threading.Lock()
+retry_statuses = set(RETRYABLE_ITEM_STATUSES)
+
+def create_pipeline(parser='grok'):
+    """Create the ingestion pipeline, parsing raw_data with grok or the cheaper dissect processor"""
+    pipeline_id = f"restaurants_{parser}_pipeline"
+    if parser == 'dissect':
+        # dissect splits on literal delimiters without regex backtracking, so it expects the cleaned CSV layout
+        parse_processor = {
+            "dissect": {
+                "field": "raw_data",
+                "pattern": "%{SerialNumber};%{RestaurantName};%{AverageCostForTwo};%{AggregateRating};%{RatingText};%{Votes};%{Date};[%{lat}, %{lon}];%{City2}/%{Country}/%{Continent}",
+                "ignore_missing": True
+            }
+        }
+    else:
+        parse_processor = {
+            "grok": {
+                "field": "raw_data",
+                "patterns": [
+                    "%{DATA:SerialNumber};%{DATA:RestaurantName};%{NUMBER:AverageCostForTwo};%{NUMBER:AggregateRating};%{DATA:RatingText};%{NUMBER:Votes};%{TIMESTAMP_ISO8601:Date};\\[%{SPACE}*%{NUMBER:lat}%{SPACE}*,%{SPACE}*%{NUMBER:lon}%{SPACE}*\\];(?:(?<City1>%{DATA})/)?(?<City2>%{DATA})/(?<Country>%{DATA})/(?<Continent>%{DATA})"
+                ],
+                "ignore_missing": True
+            }
+        }
     pipeline_def = {
-        "description": "Pipeline for processing restaurant data using grok patterns",
+        "description": f"Pipeline for processing restaurant data using {parser} patterns",
         "processors": [
-            {
-                "grok": {
-                    "field": "raw_data",
-                    "patterns": [
-                        "%{DATA:SerialNumber};%{DATA:RestaurantName};%{NUMBER:AverageCostForTwo};%{NUMBER:AggregateRating};%{DATA:RatingText};%{NUMBER:Votes};%{TIMESTAMP_ISO8601:Date};\\[%{SPACE}*%{NUMBER:lat}%{SPACE}*,%{SPACE}*%{NUMBER:lon}%{SPACE}*\\];(?:(?<City1>%{DATA})/)?(?<City2>%{DATA})/(?<Country>%{DATA})/(?<Continent>%{DATA})"
-                    ],
-                    "ignore_missing": True
-                }
-            },
+            parse_processor,
             {
                 "convert": {
                     "field": "SerialNumber",
@@ -110,7 +208,7 @@ def create_pipeline():
     
     url = f"{ES_HOST}/_ingest/pipeline/{pipeline_id}"
     try:
-        response = requests.put(url, auth=ES_AUTH, headers=ES_HEADERS, json=pipeline_def, verify=False)
+        response = session.put(url, headers=ES_HEADERS, json=pipeline_def)
         response.raise_for_status()
         logging.info(f"Pipeline {pipeline_id} created successfully")
         return pipeline_id
@@ -128,13 +226,38 @@ def create_index_template():
         "index_patterns": ["restaurants*"],
         "template": {
             "settings": {
-                "number_of_shards": 1,
-                "number_of_replicas": 0
+                "number_of_shards": INDEX_SHARDS,
+                "number_of_replicas": INDEX_REPLICAS,
+                "analysis": {
+                    "tokenizer": {
+                        "name_ngram": {
+                            "type": "ngram",
+                            "min_gram": NAME_NGRAM_SIZE,
+                            "max_gram": NAME_NGRAM_SIZE,
+                            "token_chars": ["letter", "digit", "custom"],
+                            "custom_token_chars": NAME_NGRAM_CUSTOM_CHARS
+                        }
+                    },
+                    "analyzer": {
+                        "name_ngram": {"type": "custom", "tokenizer": "name_ngram", "filter": ["lowercase"]}
+                    }
+                }
             },
             "mappings": {
                 "properties": {
                     "SerialNumber": {"type": "long"},
-                    "RestaurantName": {"type": "keyword"},
+                    # Substring searches like *pizza* use the sub-fields instead of scanning every keyword term:
+                    # match_phrase on .ngram looks up the trigrams of the substring, and the wildcard
+                    # field type checks an n-gram index before verifying candidates. .text is the
+                    # word-level field the section1 queries were written against.
+                    "RestaurantName": {
+                        "type": "keyword",
+                        "fields": {
+                            "text": {"type": "text"},
+                            "ngram": {"type": "text", "analyzer": "name_ngram"},
+                            "wildcard": {"type": "wildcard"}
+                        }
+                    },
                     "AverageCostForTwo": {"type": "long"},
                     "AggregateRating": {"type": "double"},
                     "RatingText": {"type": "keyword"},
@@ -142,6 +265,7 @@ def create_index_template():
                     "Date": {"type": "date", "format": "iso8601"},
                     "@timestamp": {"type": "date", "format": "strict_date_optional_time"},
                     "Coordinates": {"type": "geo_point"},
+                    **{field: {"type": "keyword"} for field in GEOHASH_FIELDS},
                     "City": {"type": "keyword"},
                     "Country": {"type": "keyword"},
                     "Continent": {"type": "keyword"},
@@ -153,7 +277,7 @@ def create_index_template():
     
     url = f"{ES_HOST}/_index_template/{template_id}"
     try:
-        response = requests.put(url, auth=ES_AUTH, headers=ES_HEADERS, json=template_def, verify=False)
+        response = session.put(url, headers=ES_HEADERS, json=template_def)
         response.raise_for_status()
         logging.info(f"Index template {template_id} created successfully")
     except Exception as e:
@@ -163,15 +287,46 @@ def create_index_template():
             logging.error(f"Response body: {e.response.text}")
         sys.exit(1)
 
+def create_rollup_template():
+    """Create the rollup index template; its higher priority keeps the restaurants* template off the rollup index"""
+    template_id = "restaurants_rollup_template"
+    template_def = {
+        "index_patterns": [f"{ROLLUP_INDEX}*"],
+        "priority": 1,
+        "template": {
+            "settings": {
+                "number_of_shards": 1,
+                "number_of_replicas": INDEX_REPLICAS
+            },
+            "mappings": rollup_mappings()
+        }
+    }
+    
+    url = f"{ES_HOST}/_index_template/{template_id}"
+    try:
+        response = session.put(url, headers=ES_HEADERS, json=template_def)
+        response.raise_for_status()
+        logging.info(f"Index template {template_id} created successfully")
+    except Exception as e:
+        logging.error(f"Failed to create rollup index template: {str(e)}")
+        if hasattr(e, 'response') and e.response is not None:
+            logging.error(f"Response status: {e.response.status_code}")
+            logging.error(f"Response body: {e.response.text}")
+        sys.exit(1)
+
 def recreate_index():
     """Delete and recreate the index"""
     # Check if index exists and delete it
     try:
-        response = requests.head(f"{ES_HOST}/{index_name}", auth=ES_AUTH, headers=ES_HEADERS, verify=False)
+        response = session.head(f"{ES_HOST}/{index_name}", headers=ES_HEADERS)
         if response.status_code == 200:
-            logging.info(f"Deleting existing index {index_name}")
-            delete_response = requests.delete(f"{ES_HOST}/{index_name}", auth=ES_AUTH, headers=ES_HEADERS, verify=False)
-            delete_response.raise_for_status()
+            # index_name may be an alias left by a bulk load, so delete the indices behind it
+            alias_response = session.get(f"{ES_HOST}/{index_name}/_alias", headers=ES_HEADERS)
+            alias_response.raise_for_status()
+            for existing_index in alias_response.json():
+                logging.info(f"Deleting existing index {existing_index}")
+                delete_response = session.delete(f"{ES_HOST}/{existing_index}", headers=ES_HEADERS)
+                delete_response.raise_for_status()
     except requests.exceptions.HTTPError as e:
         # 404 is ok, index doesn't exist
         if e.response.status_code != 404:
@@ -180,7 +335,7 @@ def recreate_index():
     
     # Create the index
     try:
-        response = requests.put(f"{ES_HOST}/{index_name}", auth=ES_AUTH, headers=ES_HEADERS, verify=False)
+        response = session.put(f"{ES_HOST}/{index_name}", headers=ES_HEADERS)
         response.raise_for_status()
         logging.info(f"Index {index_name} created successfully")
     except Exception as e:
@@ -190,94 +345,1029 @@ def recreate_index():
             logging.error(f"Response body: {e.response.text}")
         sys.exit(1)
 
-def prepare_bulk_data(csv_file):
-    """Read the CSV and prepare bulk indexing data"""
+def index_identity():
+    """
+    Name and uuid of the single concrete index behind index_name, or None
+    when there is no such index or index_name is an alias over several
+    """
+    try:
+        response = session.get(f"{ES_HOST}/{index_name}/_stats/docs", headers=ES_HEADERS)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+    except Exception as e:
+        logging.error(f"Failed to look up index {index_name}: {str(e)}")
+        if hasattr(e, 'response') and e.response is not None:
+            logging.error(f"Response status: {e.response.status_code}")
+            logging.error(f"Response body: {e.response.text}")
+        sys.exit(1)
+    indices = response.json()["indices"]
+    if len(indices) != 1:
+        return None
+    (name, stats), = indices.items()
+    return {"index": name, "uuid": stats["uuid"]}
+
+def write_rollup(rollup):
+    """
+    Load the rollup documents into a new versioned index and swap the
+    ROLLUP_INDEX alias onto it, so panels keep reading the previous rollup
+    until the new one is complete. Returns the number of failed bulk batches.
+    """
+    load_index = create_load_index(f"{ROLLUP_INDEX}-{time.strftime('%Y%m%d%H%M%S')}")
+    # A few thousand small documents, so one sender is enough
+    failed_batches = 0
+    for bulk_data in prepare_bulk_data(None, documents=rollup.documents(), target_index=load_index):
+        if not bulk_index(bulk_data):
+            failed_batches += 1
+    if failed_batches:
+        logging.error(f"Rollup load failed, alias {ROLLUP_INDEX} left unchanged; {load_index} kept for inspection")
+        return failed_batches
+    finish_load_index(load_index, force_merge=False)
+    swap_alias(load_index, alias=ROLLUP_INDEX)
+    logging.info(f"Wrote {len(rollup)} rollup documents to {load_index}")
+    return failed_batches
+
+def create_load_index(load_index=None, number_of_shards=None):
+    """
+    Create a new versioned index (or load_index, which must not exist yet)
+    with refresh and replicas disabled for bulk loading
+    """
+    load_settings = {
+        "settings": {
+            "index": {
+                "refresh_interval": "-1",
+                "number_of_replicas": 0,
+                "translog.durability": "async"
+            }
+        }
+    }
+    if number_of_shards:
+        load_settings["settings"]["index"]["number_of_shards"] = number_of_shards
+    try:
+        if load_index is None:
+            load_index = f"{index_name}-{time.strftime('%Y%m%d%H%M%S')}"
+        # Never deleted first: an index of that name may be serving searches behind the alias
+        response = session.put(f"{ES_HOST}/{load_index}", headers=ES_HEADERS, json=load_settings)
+        response.raise_for_status()
+        logging.info(f"Load index {load_index} created with refresh disabled")
+        return load_index
+    except Exception as e:
+        logging.error(f"Failed to create load index: {str(e)}")
+        if hasattr(e, 'response') and e.response is not None:
+            logging.error(f"Response status: {e.response.status_code}")
+            logging.error(f"Response body: {e.response.text}")
+        sys.exit(1)
+
+def finish_load_index(load_index, force_merge=True, read_only=False):
+    """Restore the search-time settings on a loaded index, force-merge it and optionally block writes to it"""
+    search_settings = {
+        "index": {
+            "refresh_interval": None,
+            "number_of_replicas": INDEX_REPLICAS,
+            "translog.durability": None
+        }
+    }
+    try:
+        response = session.put(f"{ES_HOST}/{load_index}/_settings", headers=ES_HEADERS, json=search_settings)
+        response.raise_for_status()
+        response = session.post(f"{ES_HOST}/{load_index}/_refresh", headers=ES_HEADERS)
+        response.raise_for_status()
+        if force_merge:
+            logging.info(f"Force-merging {load_index}")
+            response = session.post(f"{ES_HOST}/{load_index}/_forcemerge", headers=ES_HEADERS,
+                                    params={"max_num_segments": 1})
+            response.raise_for_status()
+        if read_only:
+            # Merged to one segment and never written again, so searches of it stay cheap
+            response = session.put(f"{ES_HOST}/{load_index}/_settings", headers=ES_HEADERS,
+                                   json={"index": {"blocks.write": True}})
+            response.raise_for_status()
+            logging.info(f"{load_index} is now read-only")
+        logging.info(f"Load index {load_index} restored to search settings")
+    except Exception as e:
+        logging.error(f"Failed to finish load index: {str(e)}")
+        if hasattr(e, 'response') and e.response is not None:
+            logging.error(f"Response status: {e.response.status_code}")
+            logging.error(f"Response body: {e.response.text}")
+        sys.exit(1)
+
+def swap_alias(*load_indices, write_index=None, alias=None):
+    """
+    Atomically point the alias (index_name unless given) at load_indices and drop
+    the previous generation. With several indices, writes through the alias go
+    to write_index.
+    """
+    alias = alias or index_name
+    if len(load_indices) > 1 and write_index not in load_indices:
+        # ES rejects every write through an alias over several indices without one
+        logging.error(f"No write index among {', '.join(load_indices)} for alias {alias}")
+        sys.exit(1)
     try:
-        df = pd.read_csv(csv_file, sep=';')
-        logging.info(f"Read {len(df)} rows from {csv_file}")
+        # The keys are the concrete indices behind the alias, or the alias name itself for a plain index
+        response = session.get(f"{ES_HOST}/{alias}/_alias", headers=ES_HEADERS)
+        previous = list(response.json()) if response.status_code == 200 else []
         
-        bulk_data = []
-        for _, row in df.iterrows():
-            # Extract coordinates
-            coords_str = str(row['Coordinates'])
-            match = re.search(r'\[\s*([-+]?\d*\.?\d+)\s*,\s*([-+]?\d*\.?\d+)\s*\]', coords_str)
-            if match:
-                lat = float(match.group(1))
-                lon = float(match.group(2))
-                coordinates = f"{lat},{lon}"
+        actions = [{"add": {"index": load_index, "alias": alias,
+                            **({"is_write_index": True} if load_index == write_index else {})}}
+                   for load_index in load_indices]
+        for old_index in previous:
+            if old_index in load_indices:
+                continue
+            if old_index == alias:
+                # A plain index with the alias name has to go in the same atomic call
+                actions.append({"remove_index": {"index": old_index}})
             else:
-                coordinates = "0,0"
-            
-            # Extract location parts
-            location_parts = str(row['City/Country/Continent']).split('/')
-            city = location_parts[0] if len(location_parts) > 0 else ''
-            country = location_parts[1] if len(location_parts) > 1 else ''
-            continent = location_parts[2] if len(location_parts) > 2 else ''
-            
-            # Build document
-            doc = {
-                "SerialNumber": int(row['SerialNumber']),
-                "RestaurantName": str(row['RestaurantName']),
-                "AverageCostForTwo": int(row['AverageCostForTwo']),
-                "AggregateRating": float(row['AggregateRating']),
-                "RatingText": str(row['RatingText']),
-                "Votes": float(row['Votes']),
-                "Date": str(row['Date']),
-                "@timestamp": str(row['Date']),
-                "Coordinates": coordinates,
-                "City": city,
-                "Country": country,
-                "Continent": continent,
-                "City/Country/Continent": f"{city}/{country}/{continent}"
-            }
-            
-            # Add index action and document
-            bulk_data.append(json.dumps({"index": {"_index": index_name}}))
-            bulk_data.append(json.dumps(doc))
+                actions.append({"remove": {"index": old_index, "alias": alias}})
+        response = session.post(f"{ES_HOST}/_aliases", headers=ES_HEADERS, json={"actions": actions})
+        response.raise_for_status()
+        logging.info(f"Alias {alias} now points to {', '.join(load_indices)}")
         
-        return '\n'.join(bulk_data) + '\n'  # Add final newline
+        for old_index in previous:
+            if old_index != alias and old_index not in load_indices:
+                logging.info(f"Deleting previous index {old_index}")
+                session.delete(f"{ES_HOST}/{old_index}", headers=ES_HEADERS).raise_for_status()
     except Exception as e:
-        logging.error(f"Error preparing bulk data: {str(e)}")
+        logging.error(f"Failed to swap alias: {str(e)}")
+        if hasattr(e, 'response') and e.response is not None:
+            logging.error(f"Response status: {e.response.status_code}")
+            logging.error(f"Response body: {e.response.text}")
         sys.exit(1)
 
-def bulk_index(bulk_data, pipeline_id=None):
-    """Perform bulk indexing with the pipeline"""
-    url = f"{ES_HOST}/_bulk"  # Remove pipeline parameter
-    headers = {"Content-Type": "application/x-ndjson"}
+def count_partitions(csv_file, chunksize=CSV_CHUNK_SIZE):
+    """Documents per partition key of the input, reading only its Date column"""
+    counts = {}
+    try:
+        if csv_file.endswith('.parquet'):
+            if pa is None:
+                logging.error("Reading typed Parquet input requires pyarrow (pip install pyarrow)")
+                sys.exit(1)
+            parquet = pq.ParquetFile(csv_file, memory_map=True)
+            dates = (pd.Series(iso_dates(batch.column('Date')).to_pylist(), dtype=object)
+                     for batch in parquet.iter_batches(batch_size=chunksize, columns=['Date']))
+        else:
+            dates = (as_text(chunk['Date']) for chunk in pd.read_csv(csv_file, sep=';', usecols=['Date'],
+                                                                      chunksize=chunksize))
+        for chunk_dates in dates:
+            for key, count in partition_keys(chunk_dates).value_counts().items():
+                counts[key] = counts.get(key, 0) + int(count)
+    except Exception as e:
+        logging.error(f"Error reading the dates of {csv_file}: {str(e)}")
+        sys.exit(1)
+    return counts
+
+def create_partitions(counts, docs_per_shard=PARTITION_DOCS_PER_SHARD):
+    """
+    Create a new load index per partition key, named with the run id so the
+    partitions of the previous run keep serving until swap_alias replaces
+    them, with primary shards sized to its document count. Returns the index
+    of every key.
+    """
+    run_id = time.strftime(PARTITION_RUN_FORMAT)
+    partitions = {}
+    for key, docs in sorted(counts.items()):
+        shards = partition_shards(docs, docs_per_shard)
+        partitions[key] = create_load_index(partition_index(index_name, key, run_id), shards)
+        logging.info(f"Partition {partitions[key]}: {docs} documents, {shards} primary shards")
+    return partitions
+
+def finish_partitions(partitions):
+    """
+    Restore the search settings on the loaded partitions. Years before the
+    newest get no more reviews, so they are force-merged and made read-only;
+    the newest year, which keeps taking writes through the alias, is returned.
+    """
+    years = sorted(key for key in partitions if key != PARTITION_UNDATED)
+    newest = years[-1] if years else PARTITION_UNDATED
+    for key, partition in sorted(partitions.items()):
+        closed = key in years and key != newest
+        finish_load_index(partition, force_merge=closed, read_only=closed)
+    return partitions[newest]
+
+COORDINATES_PATTERN = r'\[\s*([-+]?\d*\.?\d+)\s*,\s*([-+]?\d*\.?\d+)\s*\]'
+DOCUMENT_FIELDS = ["SerialNumber", "RestaurantName", "AverageCostForTwo", "AggregateRating", "RatingText",
+                   "Votes", "Date", "@timestamp", "Coordinates", *GEOHASH_FIELDS, "City", "Country", "Continent",
+                   "City/Country/Continent"]
+
+def as_text(series):
+    """Column-wise str() of every cell, with missing values rendered as 'nan'"""
+    return series.astype(str).fillna('nan')
+
+# Coordinates spelled exactly as '[lat, lon]', which split on the comma without a regex per row
+BRACKETED_COORDINATES_PATTERN = r'^\[\s*[-+]?\d*\.?\d+\s*,\s*[-+]?\d*\.?\d+\s*\]$'
+# A number written the way repr() writes its float, e.g. 14.565443 or -0.5, so the text can be copied
+# instead of parsed and formatted again. Only up to 15 significant digits is every such text its own
+# repr: 77.89902520679447 has 16 and repr() of its float is 77.89902520679448
+FLOAT_REPR_PATTERN = r'^-?(0|[1-9][0-9]*)\.(0|[0-9]*[1-9])$'
+FLOAT_REPR_MAX_DIGITS = 15
+REGEX_WHITESPACE = ' \t\n\f\r'
+
+def extract_coordinates(text):
+    """Latitudes, longitudes and 'lat,lon' strings of Coordinates text with one COORDINATES_PATTERN pass"""
+    coords = text.str.extract(COORDINATES_PATTERN).astype(float)
+    coordinates = (coords[0].astype(str) + ',' + coords[1].astype(str)).fillna('0,0')
+    return coords[0].to_numpy(), coords[1].to_numpy(), coordinates.to_numpy(dtype=object)
+
+def coordinate_columns(text):
+    """
+    Latitudes, longitudes and 'lat,lon' strings of a Coordinates column, as
+    COORDINATES_PATTERN and float() read it: NaN and '0,0' where it does not
+    match. With pyarrow the usual '[lat, lon]' rows are split by Arrow kernels
+    and only the other spellings go through the regex.
+    """
+    text = as_text(text).reset_index(drop=True)
+    if pa is None:
+        return extract_coordinates(text)
+    lat = np.full(len(text), np.nan)
+    lon = np.full(len(text), np.nan)
+    coordinates = np.full(len(text), '0,0', dtype=object)
+    
+    values = pa.array(text, type=pa.string())
+    bracketed = np.flatnonzero(pc.match_substring_regex(values, BRACKETED_COORDINATES_PATTERN)
+                               .to_numpy(zero_copy_only=False))
+    # Every bracketed value has exactly one comma, so the flattened parts alternate lat, lon
+    parts = pc.split_pattern(pc.utf8_slice_codeunits(values.take(bracketed), 1, -1), ',')
+    numbers_text = pc.ascii_trim(pc.list_flatten(parts), REGEX_WHITESPACE)
+    numbers = pc.cast(numbers_text, pa.float64()).to_numpy()
+    lat[bracketed] = numbers[0::2]
+    lon[bracketed] = numbers[1::2]
+    # Significant digits: the digits after dropping the sign, the point and leading zeros
+    digits = pc.utf8_ltrim(pc.replace_substring(pc.replace_substring(numbers_text, '-', ''), '.', ''), '0')
+    # Below 1e-4 repr() switches to exponent notation
+    is_repr = (pc.match_substring_regex(numbers_text, FLOAT_REPR_PATTERN).to_numpy(zero_copy_only=False)
+               & (pc.utf8_length(digits).to_numpy() <= FLOAT_REPR_MAX_DIGITS)
+               & ((numbers == 0) | (np.abs(numbers) >= 1e-4)))
+    copied = is_repr[0::2] & is_repr[1::2]
+    pairs = numbers_text.filter(np.repeat(copied, 2))
+    coordinates[bracketed[copied]] = pc.binary_join_element_wise(
+        pairs.take(np.arange(0, len(pairs), 2)), pairs.take(np.arange(1, len(pairs), 2)), ',').to_pylist()
+    
+    # Other spellings, missing values and the rare non-canonical number are parsed like before
+    rest = np.setdiff1d(np.arange(len(text)), bracketed[copied], assume_unique=True)
+    if len(rest):
+        lat[rest], lon[rest], coordinates[rest] = extract_coordinates(text.iloc[rest])
+    return lat, lon, coordinates
+
+def location_columns(location):
+    """
+    City, Country and Continent lists of a City/Country/Continent column, ''
+    for missing parts, followed by the three joined again
+    """
+    location = as_text(location)
+    if pa is None:
+        parts = location.str.split('/', expand=True).reindex(columns=[0, 1, 2]).fillna('')
+        joined = parts[0] + '/' + parts[1] + '/' + parts[2]
+        return [parts[part].tolist() for part in range(3)] + [joined.tolist()]
+    # Two more slashes give every value at least three parts
+    padded = pc.binary_join_element_wise(pa.array(location, type=pa.string()), '//', '')
+    parts = [pc.list_element(pc.split_pattern(padded, '/', max_splits=3), part) for part in range(3)]
+    joined = pc.binary_join_element_wise(*parts, '/')
+    return [part.to_pylist() for part in parts] + [joined.to_pylist()]
+
+def document_values(df):
+    """The document fields of a frame of cleaned rows as lists of native values, in DOCUMENT_FIELDS order"""
+    lat, lon, coordinates = coordinate_columns(df['Coordinates'])
+    # Grid cells of the same point, so geo filters can match cells before measuring distances
+    missing = np.isnan(lat) | np.isnan(lon)
+    geohashes = geohash_columns(np.where(missing, 0.0, lat), np.where(missing, 0.0, lon))
+    city, country, continent, location = location_columns(df['City/Country/Continent'])
+    
+    date = as_text(df['Date']).tolist()
+    return [
+        df['SerialNumber'].astype('int64').tolist(),
+        as_text(df['RestaurantName']).tolist(),
+        df['AverageCostForTwo'].astype('int64').tolist(),
+        df['AggregateRating'].astype(float).tolist(),
+        as_text(df['RatingText']).tolist(),
+        df['Votes'].astype(float).tolist(),
+        date,
+        date,
+        coordinates.tolist(),
+        *(geohashes[field] for field in GEOHASH_FIELDS),
+        city,
+        country,
+        continent,
+        location
+    ]
+
+def document_columns(df):
+    """The document fields of a frame of cleaned rows as columns, in DOCUMENT_FIELDS order"""
+    return {field: pd.Series(values, index=df.index)
+            for field, values in zip(DOCUMENT_FIELDS, document_values(df))}
+
+def build_documents(df):
+    """Build the bulk documents for a frame of cleaned rows, one column at a time"""
+    return [dict(zip(DOCUMENT_FIELDS, values)) for values in zip(*document_values(df))]
+
+def iter_timed(iterable, stage):
+    """Iterate while timing every next() call as one call of stage"""
+    iterator = iter(iterable)
+    while True:
+        with metrics.stage(stage):
+            value = next(iterator, None)
+        if value is None:
+            return
+        yield value
+
+ISO_DATE_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+def iso_dates(column):
+    """ISO 8601 strings of an Arrow date or timestamp column, null where the date is missing"""
+    return pc.strftime(pc.cast(column, pa.timestamp('s', tz='UTC')), format=ISO_DATE_FORMAT)
+
+def arrow_values(column):
+    """Python values of an Arrow column; dictionary columns are decoded through their small dictionary"""
+    if pa.types.is_dictionary(column.type):
+        # Much faster than to_pylist(), which boxes every dictionary scalar on its own
+        values = column.dictionary.to_pylist()
+        return [None if i is None else values[i] for i in column.indices.to_pylist()]
+    return column.to_pylist()
+
+def build_typed_documents(batch):
+    """
+    Build the bulk documents for a record batch of the typed Parquet file.
+    Coordinates and locations are already split, so nothing is parsed; the
+    output matches build_documents on the equivalent cleaned CSV rows.
+    """
+    lat = arrow_values(batch.column('lat'))
+    lon = arrow_values(batch.column('lon'))
+    coordinates = ['0,0' if a is None or b is None else f"{a},{b}" for a, b in zip(lat, lon)]
+    lat_values = batch.column('lat').to_numpy(zero_copy_only=False)
+    lon_values = batch.column('lon').to_numpy(zero_copy_only=False)
+    missing = np.isnan(lat_values) | np.isnan(lon_values)
+    geohashes = geohash_columns(np.where(missing, 0.0, lat_values), np.where(missing, 0.0, lon_values))
+    
+    # Like the CSV path, a missing date is rendered as 'nan'
+    date = ['nan' if d is None else d for d in iso_dates(batch.column('Date')).to_pylist()]
+    
+    city = arrow_values(batch.column('City'))
+    country = arrow_values(batch.column('Country'))
+    continent = arrow_values(batch.column('Continent'))
+    columns = [
+        arrow_values(batch.column('SerialNumber')),
+        arrow_values(batch.column('RestaurantName')),
+        arrow_values(batch.column('AverageCostForTwo')),
+        arrow_values(batch.column('AggregateRating')),
+        arrow_values(batch.column('RatingText')),
+        arrow_values(batch.column('Votes')),
+        date,
+        date,
+        coordinates,
+        *(geohashes[field] for field in GEOHASH_FIELDS),
+        city,
+        country,
+        continent,
+        [f"{a}/{b}/{c}" for a, b, c in zip(city, country, continent)]
+    ]
+    return [dict(zip(DOCUMENT_FIELDS, values)) for values in zip(*columns)]
+
+def iter_frame_documents(frames, source, build=build_documents):
+    """Stream documents from an iterable of cleaned frames (or typed record batches with build_typed_documents)"""
+    total_rows = 0
+    for frame in frames:
+        total_rows += len(frame)
+        with metrics.stage('build_documents'):
+            documents = build(frame)
+        metrics.inc('documents_built', len(documents))
+        yield from documents
+    logging.info(f"Read {total_rows} rows from {source}")
+
+def iter_typed_documents(parquet_file, chunksize=CSV_CHUNK_SIZE):
+    """Stream documents from a typed Parquet file, memory-mapped and read one record batch at a time"""
+    if pa is None:
+        logging.error("Reading typed Parquet input requires pyarrow (pip install pyarrow)")
+        sys.exit(1)
+    parquet = pq.ParquetFile(parquet_file, memory_map=True)
+    batches = iter_timed(parquet.iter_batches(batch_size=chunksize), 'read_parquet')
+    yield from iter_frame_documents(batches, parquet_file, build_typed_documents)
+
+def iter_documents(csv_file, chunksize=CSV_CHUNK_SIZE):
+    """Stream documents from the CSV one chunk at a time (or from a typed .parquet file)"""
+    if csv_file.endswith('.parquet'):
+        yield from iter_typed_documents(csv_file, chunksize)
+        return
+    yield from iter_frame_documents(iter_timed(pd.read_csv(csv_file, sep=';', chunksize=chunksize), 'read_csv'), csv_file)
+
+def iter_raw_documents(raw_file, chunksize=CSV_CHUNK_SIZE, cleaned_output=None, compact=False):
+    """Clean the raw CSV in memory and stream documents without re-reading a cleaned CSV"""
+    frames = iter_cleaned_chunks(raw_file, chunksize, output_file=cleaned_output, metrics=metrics, compact=compact)
+    yield from iter_frame_documents(frames, raw_file)
+
+# Compact UTF-8 JSON; orjson is used when installed, the stdlib encoder is configured to match it
+if orjson is not None:
+    encode_json = orjson.dumps
+else:
+    _json_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    
+    def encode_json(value):
+        return _json_encoder.encode(value).encode('utf-8')
+
+def action_line(action, target_index, doc_id=None):
+    """Encoded bulk action line, newline included"""
+    meta = {"_index": target_index} if doc_id is None else {"_index": target_index, "_id": doc_id}
+    return encode_json({action: meta}) + b'\n'
+
+def iter_encoded_groups(documents, group_size=SERIALIZE_GROUP_SIZE):
+    """Encode the documents a group at a time; yields each group with its encoded sources"""
+    documents = iter(documents)
+    while True:
+        group = list(itertools.islice(documents, group_size))
+        if not group:
+            return
+        # Per-document timers would cost more than the encoding, so the whole group is timed
+        started = time.perf_counter()
+        sources = list(map(encode_json, group))
+        metrics.observe('serialize', time.perf_counter() - started, len(group))
+        yield group, sources
+
+def iter_index_items(documents, target_index=None):
+    """Encode each document as an (action line, source) item sharing one precomputed action line"""
+    action = action_line("index", target_index or index_name)
+    for _, sources in iter_encoded_groups(documents):
+        yield from zip(itertools.repeat(action), sources)
+
+def iter_partitioned_items(documents, partitions):
+    """Encode each document as an item for the partition of its Date, with one precomputed action line per partition"""
+    actions = {key: action_line("index", partition) for key, partition in partitions.items()}
+    for group, sources in iter_encoded_groups(documents):
+        yield from zip([actions[partition_key(doc['Date'])] for doc in group], sources)
+
+def iter_raw_line_items(csv_file, target_index=None):
+    """Wrap every raw CSV line in a raw_data document for server-side parsing by an ingest pipeline"""
+    action = action_line("index", target_index or index_name)
+    seconds = 0.0
+    count = 0
+    with open(csv_file, encoding='utf-8') as f:
+        next(f)  # Skip the header
+        try:
+            for line in f:
+                line = line.rstrip('\r\n')
+                if line:
+                    started = time.perf_counter()
+                    source = encode_json({'raw_data': line})
+                    seconds += time.perf_counter() - started
+                    count += 1
+                    yield action, source
+        finally:
+            metrics.observe('serialize', seconds, count)
+
+def document_hash(doc):
+    """Short content hash of a document, independent of key order"""
+    return hashlib.blake2b(json.dumps(doc, sort_keys=True).encode('utf-8'), digest_size=8).hexdigest()
+
+def load_state(state_file):
+    """
+    Load the state of the last incremental run: the index it wrote to, as
+    index_identity returned it, and its SerialNumber -> content hash map
+    """
+    if not os.path.exists(state_file):
+        return {}
+    with open(state_file) as f:
+        state = json.load(f)
+    # A state without its index cannot be checked against the cluster, so it is not trusted
+    return state if 'documents' in state else {}
+
+def save_state(state_file, identity, documents):
+    """Write the incremental state atomically so an interrupted run keeps the old one"""
+    tmp_file = f"{state_file}.tmp"
+    with open(tmp_file, 'w') as f:
+        json.dump({**identity, "documents": documents}, f)
+    os.replace(tmp_file, state_file)
+
+def iter_delta_items(documents, previous_state, new_state, counts, target_index=None):
+    """
+    Yield index actions keyed on SerialNumber for new or changed documents,
+    then delete actions for documents that are no longer in the input
+    """
+    target_index = target_index or index_name
+    hash_seconds = 0.0
+    serialize_seconds = 0.0
+    for doc in documents:
+        started = time.perf_counter()
+        doc_id = str(doc['SerialNumber'])
+        doc_hash = document_hash(doc)
+        new_state[doc_id] = doc_hash
+        hash_seconds += time.perf_counter() - started
+        previous_hash = previous_state.get(doc_id)
+        if previous_hash == doc_hash:
+            counts['unchanged'] += 1
+            continue
+        counts['new' if previous_hash is None else 'changed'] += 1
+        started = time.perf_counter()
+        item = action_line("index", target_index, doc_id), encode_json(doc)
+        serialize_seconds += time.perf_counter() - started
+        yield item
+    metrics.observe('hash', hash_seconds, len(new_state))
+    metrics.observe('serialize', serialize_seconds, counts['new'] + counts['changed'])
+    
+    for doc_id in previous_state.keys() - new_state.keys():
+        counts['deleted'] += 1
+        yield action_line("delete", target_index, doc_id), None
+
+def open_batch(gzip_level):
+    """
+    Return the buffer holding a batch and the writer items go through.
+    With a gzip level the writer compresses every GZIP_CHUNK_SIZE of items
+    into the buffer as they arrive; otherwise both are the same BytesIO.
+    """
+    buffer = io.BytesIO()
+    if not gzip_level:
+        return buffer, buffer
+    # mtime=0 keeps the bodies reproducible
+    compressor = gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=gzip_level, mtime=0)
+    return buffer, io.BufferedWriter(compressor, GZIP_CHUNK_SIZE)
+
+def finish_batch(buffer, writer):
+    """Flush the gzip trailer if there is one and return the batch bytes"""
+    if writer is not buffer:
+        # Closing the writer closes the GzipFile, which leaves the buffer open
+        writer.close()
+    return buffer.getvalue()
+
+def prepare_bulk_data(csv_file, max_bytes=BULK_MAX_BYTES, max_docs=BULK_MAX_DOCS, documents=None, target_index=None,
+                      items=None, progress=None, gzip_level=BULK_GZIP_LEVEL):
+    """
+    Read the CSV (or the given documents, or already encoded (action line, source)
+    items) and yield bulk indexing batches capped by byte size and doc count.
+    A tqdm progress bar passed as progress advances by the items of each batch.
     
+    Items are written straight into a BytesIO; getvalue() hands its storage
+    over as the batch bytes without a copy. Each batch gets a fresh buffer
+    because queued batches may still be waiting for a sender. With gzip_level
+    set the batches are gzip streams compressed while they fill up; max_bytes
+    still caps the uncompressed size.
+    """
+    buffer, writer = open_batch(gzip_level)
+    batch_items = 0
+    batch_bytes = 0
+    compress_seconds = 0.0
     try:
-        response = requests.post(url, auth=ES_AUTH, headers=headers, data=bulk_data, verify=False)
-        result = response.json()
+        if items is None:
+            if documents is None:
+                documents = iter_documents(csv_file)
+            items = iter_index_items(documents, target_index)
+        for action, source in items:
+            item_bytes = len(action) if source is None else len(action) + len(source) + 1
+            if batch_items and (batch_bytes + item_bytes > max_bytes or batch_items >= max_docs):
+                if progress is not None:
+                    progress.update(batch_items)
+                started = time.perf_counter()
+                batch = finish_batch(buffer, writer)
+                compress_seconds += time.perf_counter() - started
+                if gzip_level:
+                    metrics.observe('compress', compress_seconds)
+                yield batch
+                buffer, writer = open_batch(gzip_level)
+                batch_items = 0
+                batch_bytes = 0
+                compress_seconds = 0.0
+            # The gzip writer only does work when it compresses a full chunk, so timing it is cheap;
+            # plain batches are not timed at all
+            if gzip_level:
+                started = time.perf_counter()
+            writer.writelines((action,) if source is None else (action, source, b'\n'))
+            if gzip_level:
+                compress_seconds += time.perf_counter() - started
+            batch_items += 1
+            batch_bytes += item_bytes
         
-        if result.get('errors', False):
-            error_count = sum(1 for item in result.get('items', []) 
-                             if item.get('index', {}).get('status', 200) >= 400)
-            logging.error(f"Bulk indexing completed with {error_count} errors")
-            for item in result.get('items', []):
-                if item.get('index', {}).get('status', 200) >= 400:
-                    logging.error(f"Error: {item['index'].get('error')}")
-            return False
+        if batch_items:
+            if progress is not None:
+                progress.update(batch_items)
+            started = time.perf_counter()
+            batch = finish_batch(buffer, writer)
+            if gzip_level:
+                metrics.observe('compress', compress_seconds + time.perf_counter() - started)
+            yield batch
+    except Exception as e:
+        logging.error(f"Error preparing bulk data: {str(e)}")
+        sys.exit(1)
+
+def is_rejected(status, result):
+    """Check whether ES rejected the whole request because it is overloaded; result is None for a 429"""
+    if status == 429:
+        return True
+    error = result.get('error') if isinstance(result, dict) else None
+    return isinstance(error, dict) and error.get('type') == 'es_rejected_execution_exception'
+
+def is_gzipped(bulk_data):
+    """Check for the gzip magic number, which an NDJSON body can never start with"""
+    return bulk_data[:2] == b'\x1f\x8b'
+
+def uncompressed_size(bulk_data):
+    """Size of a bulk body before compression; gzip keeps it (mod 2**32) in the last 4 bytes"""
+    return int.from_bytes(bulk_data[-4:], 'little') if is_gzipped(bulk_data) else len(bulk_data)
+
+def bulk_headers(bulk_data):
+    """Headers of a _bulk request, announcing gzip bodies"""
+    headers = {"Content-Type": "application/x-ndjson"}
+    if is_gzipped(bulk_data):
+        headers["Content-Encoding"] = "gzip"
+    return headers
+
+def record_bulk_request(bulk_data):
+    metrics.inc('bulk_requests')
+    metrics.inc('bulk_bytes', len(bulk_data))
+    metrics.inc('bulk_raw_bytes', uncompressed_size(bulk_data))
+
+def backoff_delay(attempt):
+    """Seconds to wait before retrying a rejected batch"""
+    return min(BULK_BACKOFF_BASE * 2 ** attempt, BULK_BACKOFF_MAX)
+
+def item_retry_delay(attempt):
+    """backoff_delay with jitter, so items failed by one busy node are not all resent at the same moment"""
+    return backoff_delay(attempt) * random.uniform(0.5, 1.0)
+
+def bulk_entries(bulk_data):
+    """The (action line, source line or None) of each item of a bulk body, in request order"""
+    body = gzip.decompress(bulk_data) if is_gzipped(bulk_data) else bulk_data
+    lines = iter(body.splitlines(keepends=True))
+    entries = []
+    for line in lines:
+        # Deletes are the only actions without a source line
+        source = None if 'delete' in json.loads(line) else next(lines, None)
+        entries.append((line, source))
+    return entries
+
+def retry_body(entries, bulk_data):
+    """A bulk body with only the given items, compressed like the batch they came from"""
+    body = b''.join(action + (source or b'') for action, source in entries)
+    return gzip.compress(body, compresslevel=RETRY_GZIP_LEVEL, mtime=0) if is_gzipped(bulk_data) else body
+
+def write_dead_letter(failures):
+    """Append (entry, outcome) pairs of permanently failed items to the dead-letter file"""
+    try:
+        with dead_letter_lock, open(dead_letter_file, 'a', encoding='utf-8') as f:
+            for (action, source), outcome in failures:
+                record = {"action": json.loads(action), "source": json.loads(source) if source else None,
+                          "status": outcome.get('status'), "error": outcome.get('error')}
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        metrics.inc('items_dead_lettered', len(failures))
+    except Exception as e:
+        logging.error(f"Error writing to dead-letter file {dead_letter_file}: {str(e)}")
+
+def dead_letter_batch(bulk_data, reason):
+    """Send every item of a batch the cluster never accepted to the dead-letter file"""
+    error = {"type": "bulk_request_failed", "reason": reason}
+    write_dead_letter([(entry, {"error": error}) for entry in bulk_entries(bulk_data)])
+
+def check_bulk_result(bulk_data, result, final=False):
+    """
+    Log the outcome of an accepted bulk batch. Returns the entries of the items
+    to resend (none on the final attempt) and whether any item failed for good;
+    those are written to the dead-letter file.
+    """
+    metrics.observe('es_took', result.get('took', 0) / 1000)
+    if result.get('errors', False):
+        # Each item is keyed by its action type (index or delete) and is in the same position as in the request
+        failed_items = [(position, outcome) for position, item in enumerate(result.get('items', []))
+                        for outcome in item.values() if outcome.get('status', 200) >= 400 and outcome.get('error')]
+        entries = bulk_entries(bulk_data)
+        retry = [] if final else [entries[position] for position, outcome in failed_items
+                                  if outcome.get('status') in retry_statuses]
+        failures = [(entries[position], outcome) for position, outcome in failed_items
+                    if final or outcome.get('status') not in retry_statuses]
+        metrics.inc('items_indexed', len(result.get('items', [])) - len(failed_items))
+        metrics.inc('items_retried', len(retry))
+        if failures:
+            metrics.inc('items_failed', len(failures))
+            logging.error(f"Bulk indexing completed with {len(failures)} errors")
+            for _, outcome in failures:
+                logging.error(f"Error: {outcome.get('error')}")
+            write_dead_letter(failures)
+        return retry, bool(failures)
+    else:
+        took_ms = result.get('took', 0)
+        count = len(result.get('items', []))
+        metrics.inc('items_indexed', count)
+        if is_gzipped(bulk_data):
+            logging.info(f"Bulk batch completed successfully: {count} documents indexed in {took_ms}ms "
+                         f"({len(bulk_data) / 1024:.0f} KB gzip of {uncompressed_size(bulk_data) / 1024:.0f} KB)")
         else:
-            took_ms = result.get('took', 0)
-            count = len(result.get('items', []))
-            logging.info(f"Bulk indexing completed successfully: {count} documents indexed in {took_ms}ms")
-            return True
+            logging.info(f"Bulk batch completed successfully: {count} documents indexed in {took_ms}ms")
+        return [], False
+
+def post_bulk(bulk_data, pipeline_id=None):
+    """POST a bulk body, backing off while the cluster rejects it; the response, or None when it never got in"""
+    url = f"{ES_HOST}/_bulk"
+    headers = bulk_headers(bulk_data)
+    params = {"pipeline": pipeline_id} if pipeline_id else None
+    
+    for attempt in range(BULK_MAX_RETRIES + 1):
+        with metrics.stage('http_send'):
+            response = session.post(url, headers=headers, data=bulk_data, params=params)
+            # A 429 can come from a proxy in front of ES with a body that is not JSON, so it is not parsed
+            result = None if response.status_code == 429 else response.json()
+        record_bulk_request(bulk_data)
+        if not is_rejected(response.status_code, result):
+            return result
+        metrics.inc('bulk_rejected')
+        if attempt == BULK_MAX_RETRIES:
+            logging.error(f"Bulk batch still rejected after {BULK_MAX_RETRIES} retries")
+            return None
+        delay = backoff_delay(attempt)
+        logging.warning(f"Cluster rejected bulk batch (HTTP {response.status_code}), retrying in {delay:.1f}s")
+        time.sleep(delay)
+
+def bulk_index(bulk_data, pipeline_id=None):
+    """
+    Send a single bulk batch. Items that fail with a retryable status are resent
+    on their own with jittered backoff; the others go to the dead-letter file.
+    """
+    failed = False
+    try:
+        for attempt in range(ITEM_MAX_RETRIES + 1):
+            result = post_bulk(bulk_data, pipeline_id)
+            if result is None:
+                dead_letter_batch(bulk_data, "bulk request rejected")
+                return False
+            retry, permanent = check_bulk_result(bulk_data, result, final=attempt == ITEM_MAX_RETRIES)
+            failed = failed or permanent
+            if not retry:
+                return not failed
+            bulk_data = retry_body(retry, bulk_data)
+            delay = item_retry_delay(attempt)
+            logging.warning(f"Resending {len(retry)} failed bulk items in {delay:.1f}s")
+            time.sleep(delay)
     except Exception as e:
         logging.error(f"Error during bulk indexing: {str(e)}")
+        dead_letter_batch(bulk_data, str(e))
         return False
 
-def main(csv_file='restaurants_cleaned.csv'):
+def parallel_bulk_index(batches, workers=BULK_WORKERS, queue_size=None, pipeline_id=None):
+    """Send bulk batches from several worker threads fed through a bounded queue"""
+    # The bounded queue blocks the producer while all senders are busy
+    batch_queue = queue.Queue(maxsize=queue_size or workers * 2)
+    lock = threading.Lock()
+    stats = {'batches': 0, 'failed': 0}
+    
+    def sender():
+        while True:
+            bulk_data = batch_queue.get()
+            if bulk_data is None:
+                break
+            success = bulk_index(bulk_data, pipeline_id)
+            with lock:
+                stats['batches'] += 1
+                if not success:
+                    stats['failed'] += 1
+    
+    threads = [threading.Thread(target=sender, name=f"bulk-sender-{i}", daemon=True) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    try:
+        for bulk_data in batches:
+            batch_queue.put(bulk_data)
+    finally:
+        # One sentinel per sender, then wait for in-flight batches to finish
+        for _ in threads:
+            batch_queue.put(None)
+        for thread in threads:
+            thread.join()
+    
+    return stats['batches'], stats['failed']
+
+async def async_post_bulk(http, bulk_data, pipeline_id=None):
+    """post_bulk on an aiohttp session; backing off only delays this batch, not the others in flight"""
+    url = f"{ES_HOST}/_bulk"
+    headers = bulk_headers(bulk_data)
+    params = {"pipeline": pipeline_id} if pipeline_id else None
+    
+    for attempt in range(BULK_MAX_RETRIES + 1):
+        with metrics.stage('http_send'):
+            async with http.post(url, headers=headers, data=bulk_data, params=params) as response:
+                status = response.status
+                result = None if status == 429 else await response.json(content_type=None)
+        record_bulk_request(bulk_data)
+        if not is_rejected(status, result):
+            return result
+        metrics.inc('bulk_rejected')
+        if attempt == BULK_MAX_RETRIES:
+            logging.error(f"Bulk batch still rejected after {BULK_MAX_RETRIES} retries")
+            return None
+        delay = backoff_delay(attempt)
+        logging.warning(f"Cluster rejected bulk batch (HTTP {status}), retrying in {delay:.1f}s")
+        await asyncio.sleep(delay)
+
+async def async_bulk_index(http, bulk_data, pipeline_id=None):
+    """bulk_index on an aiohttp session"""
+    failed = False
+    try:
+        for attempt in range(ITEM_MAX_RETRIES + 1):
+            result = await async_post_bulk(http, bulk_data, pipeline_id)
+            if result is None:
+                dead_letter_batch(bulk_data, "bulk request rejected")
+                return False
+            retry, permanent = check_bulk_result(bulk_data, result, final=attempt == ITEM_MAX_RETRIES)
+            failed = failed or permanent
+            if not retry:
+                return not failed
+            bulk_data = retry_body(retry, bulk_data)
+            delay = item_retry_delay(attempt)
+            logging.warning(f"Resending {len(retry)} failed bulk items in {delay:.1f}s")
+            await asyncio.sleep(delay)
+    except Exception as e:
+        logging.error(f"Error during bulk indexing: {str(e)}")
+        dead_letter_batch(bulk_data, str(e))
+        return False
+
+async def async_parallel_bulk_index(batches, concurrency=BULK_WORKERS, pipeline_id=None):
+    """
+    Send bulk batches from one event loop over a pooled aiohttp session, with at
+    most concurrency requests in flight. The next batch is built in an executor
+    thread meanwhile, so reading and serializing overlap the wait for the cluster.
+    """
+    loop = asyncio.get_running_loop()
+    in_flight = asyncio.Semaphore(concurrency)
+    results = []
+    pending = set()
+    
+    async def send(bulk_data):
+        try:
+            results.append(await async_bulk_index(http, bulk_data, pipeline_id))
+        finally:
+            in_flight.release()
+    
+    connector = aiohttp.TCPConnector(limit=concurrency, ssl=False)
+    auth = aiohttp.BasicAuth(ES_USER, ES_PASSWORD) if ES_PASSWORD else None
+    # A single builder thread, since the batch generator must not be advanced from two threads at once
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="bulk-builder") as builder:
+        async with aiohttp.ClientSession(connector=connector, auth=auth) as http:
+            batches = iter(batches)
+            try:
+                while True:
+                    bulk_data = await loop.run_in_executor(builder, next, batches, None)
+                    if bulk_data is None:
+                        break
+                    # Holds the built batch back while all requests are in flight
+                    await in_flight.acquire()
+                    task = asyncio.create_task(send(bulk_data))
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+            finally:
+                # Let the batches already sent finish
+                await asyncio.gather(*pending)
+    
+    return len(results), results.count(False)
+
+def report_compression(link_mbps=BULK_LINK_MBPS):
+    """
+    Log the gzip ratio of the bulk bodies and the send time it saved per batch
+    (bytes no longer transferred at link_mbps, minus the time spent compressing),
+    and record both as gauges. The observed send throughput cannot be used
+    instead, since it also includes the time the cluster spends indexing.
+    """
+    data = metrics.as_dict()
+    raw_bytes = data["counters"].get('bulk_raw_bytes', 0)
+    wire_bytes = data["counters"].get('bulk_bytes', 0)
+    requests_sent = data["counters"].get('bulk_requests', 0)
+    compress_seconds = data["stages"].get('compress', {}).get('seconds', 0.0)
+    if not wire_bytes:
+        return
+    
+    bytes_per_second = link_mbps * 1e6 / 8
+    saved_seconds = (raw_bytes - wire_bytes) / bytes_per_second - compress_seconds
+    metrics.set_gauge('gzip_ratio', raw_bytes / wire_bytes)
+    metrics.set_gauge('gzip_saved_seconds_per_batch', saved_seconds / requests_sent)
+    logging.info(f"gzip: {raw_bytes / 1e6:.1f} MB sent as {wire_bytes / 1e6:.1f} MB (ratio {raw_bytes / wire_bytes:.1f}), "
+                 f"{compress_seconds:.2f}s compressing, about {saved_seconds / requests_sent * 1000:.0f}ms saved per batch "
+                 f"at {bytes_per_second * 8 / 1e6:.0f} Mbit/s")
+
+def main(csv_file='restaurants_cleaned.csv', workers=1, queue_size=None, raw_file=None, cleaned_output=None,
+         bulk_load=False, incremental=False, state_file=STATE_FILE, ingest=None, gzip_level=BULK_GZIP_LEVEL,
+         link_mbps=BULK_LINK_MBPS, compact=False, async_mode=False, dead_letter=DEAD_LETTER_FILE,
+         retry_conflicts=False, rollup=False, partitioned=False, docs_per_shard=PARTITION_DOCS_PER_SHARD):
+    global session, dead_letter_file, retry_statuses
+    if not ES_PASSWORD:
+        logging.error("ES_PASS environment variable not set. Please set it before running this script.")
+        return 1
+    if async_mode and aiohttp is None:
+        logging.error("The asyncio mode needs aiohttp. Install it with: pip install aiohttp")
+        return 1
     logging.info("Starting Elasticsearch indexing")
+    if workers > HTTP_POOL_SIZE:
+        session = create_session(workers)
+    dead_letter_file = dead_letter
+    retry_statuses = RETRYABLE_ITEM_STATUSES | ({CONFLICT_STATUS} if retry_conflicts else set())
     
     # Create the components and prepare data
     create_index_template()
-    recreate_index()
-    bulk_data = prepare_bulk_data(csv_file)
+    if rollup:
+        create_rollup_template()
+    if bulk_load:
+        # Load into a fresh versioned index while the alias keeps serving the old one
+        target_index = create_load_index()
+    elif partitioned:
+        # One load index per review year, sized from a first pass over the dates
+        partitions = create_partitions(count_partitions(csv_file), docs_per_shard)
+        target_index = None
+    elif incremental:
+        state = load_state(state_file)
+        identity = index_identity()
+        if state and identity == {"index": state["index"], "uuid": state["uuid"]}:
+            previous_state = state["documents"]
+        else:
+            # Any other run since the state was saved rebuilt the index with generated ids, or put
+            # an alias over new indices, so the state no longer describes what is in there
+            if state:
+                logging.info(f"{index_name} is not the index {state['index']} ({state['uuid']}) recorded in "
+                             f"{state_file}, rebuilding it from scratch")
+            else:
+                logging.info(f"No state in {state_file}, rebuilding {index_name} from scratch")
+            recreate_index()
+            identity = index_identity()
+            previous_state = {}
+        target_index = index_name
+    else:
+        recreate_index()
+        target_index = index_name
     
-    # Perform the bulk indexing
-    success = bulk_index(bulk_data)
+    # Either clean the raw file in memory or read an already cleaned CSV
+    if raw_file:
+        logging.info(f"Cleaning {raw_file} and indexing it in one pass")
+        documents = iter_raw_documents(raw_file, cleaned_output=cleaned_output, compact=compact)
+    else:
+        documents = iter_documents(csv_file)
+    if rollup:
+        # Every document passes through, unchanged ones in --incremental too, so the rollup covers the full input
+        partials = Rollup()
+        documents = partials.observe(documents)
+    
+    pipeline_id = None
+    # Advances as batches are handed to the senders, at most a few batches ahead of them
+    progress = tqdm(desc="Indexing", unit="docs", unit_scale=True)
+    if ingest:
+        # Send raw lines and let the ingest pipeline parse them on the cluster
+        pipeline_id = create_pipeline(ingest)
+        batches = prepare_bulk_data(csv_file, items=iter_raw_line_items(csv_file, target_index), progress=progress,
+                                    gzip_level=gzip_level)
+    elif incremental:
+        # Only new, changed and deleted documents are sent
+        new_state = {}
+        counts = {'new': 0, 'changed': 0, 'unchanged': 0, 'deleted': 0}
+        items = iter_delta_items(documents, previous_state, new_state, counts, target_index)
+        batches = prepare_bulk_data(csv_file, items=items, progress=progress, gzip_level=gzip_level)
+    elif partitioned:
+        items = iter_partitioned_items(documents, partitions)
+        batches = prepare_bulk_data(csv_file, items=items, progress=progress, gzip_level=gzip_level)
+    else:
+        batches = prepare_bulk_data(csv_file, documents=documents, target_index=target_index, progress=progress,
+                                    gzip_level=gzip_level)
     
-    if success:
+    # Stream the bulk batches, sending each one as soon as it is full
+    if async_mode:
+        logging.info(f"Sending bulk batches with asyncio, up to {workers} requests in flight")
+        batch_count, failed_batches = asyncio.run(async_parallel_bulk_index(batches, workers, pipeline_id))
+    elif workers > 1:
+        logging.info(f"Sending bulk batches with {workers} parallel workers")
+        batch_count, failed_batches = parallel_bulk_index(batches, workers, queue_size, pipeline_id)
+    else:
+        batch_count = 0
+        failed_batches = 0
+        for bulk_data in batches:
+            batch_count += 1
+            if not bulk_index(bulk_data, pipeline_id):
+                failed_batches += 1
+    progress.close()
+    metrics.set_gauge('bulk_batches', batch_count)
+    metrics.set_gauge('failed_batches', failed_batches)
+    logging.info(f"Sent {batch_count} bulk batches, {failed_batches} failed")
+    counters = metrics.as_dict()["counters"]
+    if counters.get('items_retried'):
+        logging.info(f"Resent {counters['items_retried']} bulk items that failed with a retryable status")
+    if counters.get('items_dead_lettered'):
+        logging.error(f"{counters['items_dead_lettered']} failed documents written to {dead_letter_file}")
+    if gzip_level:
+        report_compression(link_mbps)
+    
+    if incremental:
+        logging.info(f"Delta: {counts['new']} new, {counts['changed']} changed, "
+                     f"{counts['deleted']} deleted, {counts['unchanged']} unchanged")
+        if failed_batches == 0:
+            save_state(state_file, identity, new_state)
+        else:
+            logging.error(f"State file {state_file} not updated, the next run will resend the delta")
+    
+    if bulk_load:
+        if failed_batches == 0:
+            finish_load_index(target_index)
+            swap_alias(target_index)
+        else:
+            logging.error(f"Load failed, alias {index_name} left unchanged; {target_index} kept for inspection")
+    
+    if partitioned:
+        if failed_batches == 0:
+            swap_alias(*partitions.values(), write_index=finish_partitions(partitions))
+        else:
+            logging.error(f"Load failed, alias {index_name} left on the previous partitions; "
+                          f"{', '.join(partitions.values())} kept for inspection")
+    
+    if rollup:
+        if failed_batches == 0:
+            failed_batches += write_rollup(partials)
+        else:
+            logging.error(f"Rollup index {ROLLUP_INDEX} not updated because documents failed to index")
+    
+    if failed_batches == 0:
         logging.info("Indexing completed successfully")
         return 0
     else:
@@ -285,9 +1375,60 @@ def main(csv_file='restaurants_cleaned.csv'):
         return 1
 
 if __name__ == "__main__":
-    # Accept command line argument for CSV file
-    if len(sys.argv) > 1:
-        csv_file = sys.argv[1]
-        sys.exit(main(csv_file))
-    else:
-        sys.exit(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Index the cleaned restaurant data into Elasticsearch")
+    parser.add_argument('csv_file', nargs='?', default='restaurants_cleaned.csv',
+                        help="Cleaned CSV file to index, or the typed .parquet file written by data_cleaner.py --parquet")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of parallel bulk sender threads, or of requests in flight with --async")
+    parser.add_argument('--queue-size', type=int, default=None, help="Max batches waiting for a sender (default: 2 per worker)")
+    parser.add_argument('--async', dest='async_mode', action='store_true',
+                        help="Send from an asyncio event loop with aiohttp instead of sender threads")
+    parser.add_argument('--raw', dest='raw_file', default=None,
+                        help="Clean this raw CSV in memory and index it directly instead of reading csv_file")
+    parser.add_argument('--cleaned-out', dest='cleaned_output', default=None,
+                        help="With --raw, also write the cleaned rows to this CSV")
+    parser.add_argument('--compact', action='store_true',
+                        help="With --raw, clean with category and downcast numeric dtypes to use less memory")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--bulk-load', action='store_true',
+                      help="Load into a new versioned index tuned for ingestion, then swap the alias to it")
+    mode.add_argument('--incremental', action='store_true',
+                      help="Only send documents that are new, changed or deleted since the last incremental run")
+    mode.add_argument('--partitioned', action='store_true',
+                      help="Load into one index per review year, restaurants-YYYY-<run>, swapped in behind the alias")
+    parser.add_argument('--docs-per-shard', type=int, default=PARTITION_DOCS_PER_SHARD,
+                        help="With --partitioned, documents per primary shard a partition is sized for")
+    parser.add_argument('--state-file', default=STATE_FILE, help="Content hash state for --incremental")
+    parser.add_argument('--ingest', choices=['grok', 'dissect'], default=None,
+                        help="Send raw CSV lines and parse them server-side with this ingest pipeline")
+    parser.add_argument('--gzip-level', type=int, choices=range(0, 10), default=BULK_GZIP_LEVEL, metavar='0-9',
+                        help="Compress _bulk bodies with gzip at this level while they are built (0: uncompressed)")
+    parser.add_argument('--link-mbps', type=float, default=BULK_LINK_MBPS,
+                        help="Link speed in Mbit/s used to estimate the send time gzip saves")
+    parser.add_argument('--dead-letter', default=DEAD_LETTER_FILE,
+                        help="Append documents that still fail after the item retries to this NDJSON file")
+    parser.add_argument('--retry-conflicts', action='store_true',
+                        help="Also resend items that failed with a 409 version conflict")
+    parser.add_argument('--rollup', action='store_true',
+                        help=f"Also write per city, rating text and month partial aggregates to {ROLLUP_INDEX}")
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    if args.ingest and args.rollup:
+        parser.error("--rollup aggregates the documents built here and cannot be combined with --ingest")
+    if args.ingest and (args.raw_file or args.incremental):
+        parser.error("--ingest sends csv_file lines as they are and cannot be combined with --raw or --incremental")
+    if args.ingest and args.csv_file.endswith('.parquet'):
+        parser.error("--ingest sends CSV lines and cannot read a .parquet file")
+    if args.partitioned and (args.raw_file or args.ingest):
+        parser.error("--partitioned counts the dates of csv_file before loading and cannot be combined with "
+                     "--raw or --ingest")
+    metrics = metrics_from_args(args)
+    exit_code = main(args.csv_file, workers=args.workers, queue_size=args.queue_size,
+                     raw_file=args.raw_file, cleaned_output=args.cleaned_output, bulk_load=args.bulk_load,
+                     incremental=args.incremental, state_file=args.state_file, ingest=args.ingest,
+                     gzip_level=args.gzip_level, link_mbps=args.link_mbps, compact=args.compact,
+                     async_mode=args.async_mode, dead_letter=args.dead_letter,
+                     retry_conflicts=args.retry_conflicts, rollup=args.rollup, partitioned=args.partitioned,
+                     docs_per_shard=args.docs_per_shard)
+    finish_metrics(metrics, args)
+    sys.exit(exit_code)
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# geo_index.py
+import argparse
+import logging
+import math
+import sys
+import time
+
+import numpy as np
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+GEOHASH_ALPHABET = np.array(list('0123456789bcdefghjkmnpqrstuvwxyz'))
+# Precisions indexed as GeohashN keyword fields: cells of about 39x20 km, 4.9x4.9 km and 1.2x0.6 km
+GEOHASH_PRECISIONS = (4, 5, 6)
+GEOHASH_FIELDS = [f"Geohash{precision}" for precision in GEOHASH_PRECISIONS]
+
+EARTH_RADIUS_METERS = 6371008.7714
+# Grid cells of the local index; about 1.1 km high, so a city-sized radius touches a few dozen rows
+GRID_CELL_DEGREES = 0.01
+
+def encode_geohash(lat, lon, precision=max(GEOHASH_PRECISIONS)):
+    """
+    Geohashes of arrays of coordinates, looping over the 5 * precision bits
+    instead of the points. Shorter precisions are prefixes of the result.
+    """
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    bits = 5 * precision
+    lon_bits, lat_bits = (bits + 1) // 2, bits // 2
+    # Halving an interval bit by bit is the same as quantizing it to 2**bits cells
+    lat_cells = np.clip(((lat + 90) / 180 * (1 << lat_bits)).astype(np.int64), 0, (1 << lat_bits) - 1)
+    lon_cells = np.clip(((lon + 180) / 360 * (1 << lon_bits)).astype(np.int64), 0, (1 << lon_bits) - 1)
+
+    # Interleave the bits, longitude first
+    code = np.zeros(len(lat), dtype=np.int64)
+    for position in range(bits):
+        if position % 2 == 0:
+            lon_bits -= 1
+            bit = (lon_cells >> lon_bits) & 1
+        else:
+            lat_bits -= 1
+            bit = (lat_cells >> lat_bits) & 1
+        code = (code << 1) | bit
+
+    # Five bits per character, most significant first; the character rows become one string each
+    shifts = 5 * np.arange(precision - 1, -1, -1)
+    characters = GEOHASH_ALPHABET[(code[:, None] >> shifts) & 31]
+    return characters.view(f'<U{precision}').ravel()
+
+def geohash_columns(lat, lon):
+    """GEOHASH_FIELDS for arrays of coordinates, as lists of strings"""
+    full = encode_geohash(lat, lon, max(GEOHASH_PRECISIONS))
+    return {field: full.astype(f'<U{precision}').tolist() for field, precision in zip(GEOHASH_FIELDS, GEOHASH_PRECISIONS)}
+
+def haversine_meters(lat, lon, origin_lat, origin_lon):
+    """Arc distance in meters from every (lat, lon) to the origin"""
+    lat, lon = np.radians(lat), np.radians(lon)
+    origin_lat, origin_lon = math.radians(origin_lat), math.radians(origin_lon)
+    h = np.sin((lat - origin_lat) / 2) ** 2 + np.cos(lat) * math.cos(origin_lat) * np.sin((lon - origin_lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(np.minimum(h, 1.0)))
+
+class GridIndex:
+    """
+    Points bucketed into square cells of cell_degrees and stored sorted by cell.
+    Cells of one latitude row are consecutive, so the cells overlapping the
+    bounding box of a circle are one slice per row; distances are only computed
+    for the points in those slices. k-nearest queries grow a radius until it
+    holds k points.
+    """
+
+    def __init__(self, lat, lon, cell_degrees=GRID_CELL_DEGREES):
+        lat = np.asarray(lat, dtype=float)
+        lon = np.asarray(lon, dtype=float)
+        self.cell_degrees = cell_degrees
+        self.rows = int(math.ceil(180 / cell_degrees))
+        self.columns = int(math.ceil(360 / cell_degrees))
+
+        # Points without coordinates are left out, like the out of range ones ES rejects for geo_point fields
+        points = np.flatnonzero((np.abs(lat) <= 90) & (np.abs(lon) <= 180))
+        cells = self.row_of(lat[points]) * self.columns + self.column_of(lon[points])
+        order = np.argsort(cells, kind='stable')
+        self.points = points[order]
+        self.cells = cells[order]
+        self.lat = lat[self.points]
+        self.lon = lon[self.points]
+
+    def __len__(self):
+        return len(self.points)
+
+    def row_of(self, lat):
+        return np.clip(((np.asarray(lat) + 90) / self.cell_degrees).astype(np.int64), 0, self.rows - 1)
+
+    def column_of(self, lon):
+        return np.clip(((np.asarray(lon) + 180) / self.cell_degrees).astype(np.int64), 0, self.columns - 1)
+
+    def column_ranges(self, lon, lon_degrees):
+        """Inclusive column ranges covering lon +- lon_degrees, split where they cross the antimeridian"""
+        if lon_degrees >= 180:
+            return [(0, self.columns - 1)]
+        low, high = lon - lon_degrees, lon + lon_degrees
+        if low < -180:
+            return [(int(self.column_of(low + 360)), self.columns - 1), (0, int(self.column_of(high)))]
+        if high > 180:
+            return [(int(self.column_of(low)), self.columns - 1), (0, int(self.column_of(high - 360)))]
+        return [(int(self.column_of(low)), int(self.column_of(high)))]
+
+    def candidates(self, lat, lon, radius):
+        """Positions (in cell order) of the points in the cells around the circle"""
+        angle = radius / EARTH_RADIUS_METERS
+        lat_degrees = math.degrees(angle)
+        if angle >= math.pi / 2 or abs(lat) + lat_degrees >= 90:
+            # The circle reaches a pole or half the globe: every longitude is in range
+            lon_degrees = 180.0
+        else:
+            lon_degrees = math.degrees(math.asin(min(1.0, math.sin(angle) / math.cos(math.radians(lat)))))
+        rows = np.arange(self.row_of(lat - lat_degrees), self.row_of(lat + lat_degrees) + 1)
+        ranges = self.column_ranges(lon, lon_degrees)
+        first = np.concatenate([rows * self.columns + low for low, _ in ranges])
+        last = np.concatenate([rows * self.columns + high for _, high in ranges])
+        starts = np.searchsorted(self.cells, first, side='left')
+        lengths = np.searchsorted(self.cells, last, side='right') - starts
+        # All slices at once: a running count, shifted by the start of the slice each position falls in
+        offsets = np.cumsum(lengths) - lengths
+        return np.arange(lengths.sum()) + np.repeat(starts - offsets, lengths)
+
+    def within(self, lat, lon, radius, return_distance=False):
+        """Ids of the points at most radius meters from (lat, lon), in id order"""
+        positions = self.candidates(lat, lon, radius)
+        distances = haversine_meters(self.lat[positions], self.lon[positions], lat, lon)
+        inside = distances <= radius
+        ids, distances = self.points[positions[inside]], distances[inside]
+        order = np.argsort(ids)
+        return (ids[order], distances[order]) if return_distance else ids[order]
+
+    def mask_within(self, lat, lon, radius, size):
+        """within() as a boolean mask over size points"""
+        mask = np.zeros(size, dtype=bool)
+        mask[self.within(lat, lon, radius)] = True
+        return mask
+
+    def nearest(self, lat, lon, k=1):
+        """Ids and distances of the k points nearest to (lat, lon), nearest first"""
+        k = min(k, len(self))
+        # Start from the radius that holds k points at the density of the origin's cell
+        cell_meters = math.radians(self.cell_degrees) * EARTH_RADIUS_METERS
+        cell = self.row_of(lat) * self.columns + self.column_of(lon)
+        in_cell = np.searchsorted(self.cells, cell, side='right') - np.searchsorted(self.cells, cell, side='left')
+        radius = cell_meters * math.sqrt(k / (math.pi * in_cell)) if in_cell else cell_meters
+        while True:
+            ids, distances = self.within(lat, lon, radius, return_distance=True)
+            # Every point within radius is found, so once k are inside the k nearest are among them
+            if len(ids) >= k or radius >= math.pi * EARTH_RADIUS_METERS:
+                break
+            radius *= 2
+        order = np.argsort(distances, kind='stable')[:k]
+        return ids[order], distances[order]
+
+def main(data_file, lat, lon, radius=None, k=None, cell_degrees=GRID_CELL_DEGREES):
+    # Imported here: query_engine imports the indexer, which imports this module
+    from query_engine import load_engine, parse_distance
+    engine = load_engine(data_file)
+    started = time.perf_counter()
+    index = engine.grid_index('Coordinates', cell_degrees)
+    logging.info(f"Grid index of {len(index)} points built in {(time.perf_counter() - started) * 1000:.1f}ms")
+
+    started = time.perf_counter()
+    if radius is not None:
+        ids, distances = index.within(lat, lon, parse_distance(radius), return_distance=True)
+    else:
+        ids, distances = index.nearest(lat, lon, k)
+    elapsed = time.perf_counter() - started
+    logging.info(f"{len(ids)} restaurants found in {elapsed * 1000:.3f}ms")
+
+    names = engine.columns['RestaurantName']
+    cities = engine.columns['City/Country/Continent']
+    for point, distance in zip(ids, distances):
+        print(f"{distance / 1000:8.2f} km  {names.iat[point]} ({cities.iat[point]})")
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Radius and k-nearest restaurant lookups with the local grid index")
+    parser.add_argument('lat', type=float, help="Latitude of the origin")
+    parser.add_argument('lon', type=float, help="Longitude of the origin")
+    query = parser.add_mutually_exclusive_group(required=True)
+    query.add_argument('--radius', default=None, help="Restaurants within this distance, e.g. 10km")
+    query.add_argument('--k', type=int, default=None, help="The k nearest restaurants")
+    parser.add_argument('--data', dest='data_file', default='restaurants_cleaned.csv', help="Cleaned CSV to index")
+    parser.add_argument('--cell-degrees', type=float, default=GRID_CELL_DEGREES, help="Size of the grid cells")
+    args = parser.parse_args()
+    sys.exit(main(args.data_file, args.lat, args.lon, args.radius, args.k, args.cell_degrees))
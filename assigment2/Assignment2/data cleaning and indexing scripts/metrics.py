@@ -0,0 +1,205 @@
+# metrics.py
+import cProfile
+import json
+import logging
+import os
+import re
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+PROFILERS = ['cpu', 'memory']
+METRIC_PREFIX = "restaurants"
+
+class Metrics:
+    """
+    Stage timers, counters and gauges collected during a run. Updates are
+    locked, so bulk sender threads can share one instance; stage seconds
+    are summed over threads. Stages listed in profile_stages are also run
+    under cProfile (profiler='cpu') or tracemalloc (profiler='memory') and
+    the results are written to profile_dir by write_profiles().
+    """
+
+    def __init__(self, profile_stages=(), profiler='cpu', profile_dir='.'):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.timers = {}
+        self.counters = {}
+        self.gauges = {}
+        self.profile_stages = set(profile_stages)
+        self.profiler = profiler
+        self.profile_dir = profile_dir
+        self.profiles = {}
+        self.profiling = set()
+        self.peak_bytes = {}
+        self.allocations = {}
+
+    def observe(self, stage, seconds, calls=1):
+        """Add seconds spent in a stage"""
+        with self.lock:
+            timer = self.timers.setdefault(stage, {"seconds": 0.0, "calls": 0})
+            timer["seconds"] += seconds
+            timer["calls"] += calls
+
+    def inc(self, name, value=1):
+        """Increase a counter"""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_gauge(self, name, value):
+        """Record the current value of a gauge"""
+        with self.lock:
+            self.gauges[name] = value
+
+    def stage_seconds(self):
+        """Seconds per stage as a plain dict"""
+        with self.lock:
+            return {stage: timer["seconds"] for stage, timer in self.timers.items()}
+
+    @contextmanager
+    def stage(self, name):
+        """Time the block as one call of the named stage, profiling it when asked to"""
+        with self.profile(name):
+            started = time.perf_counter()
+            try:
+                yield
+            finally:
+                self.observe(name, time.perf_counter() - started)
+
+    def profile(self, name):
+        if name not in self.profile_stages:
+            return nullcontext()
+        with self.lock:
+            # One profiled call per stage at a time; parallel senders run the rest unprofiled
+            if name in self.profiling:
+                return nullcontext()
+            self.profiling.add(name)
+        return self.memory_profile(name) if self.profiler == 'memory' else self.cpu_profile(name)
+
+    @contextmanager
+    def cpu_profile(self, name):
+        profile = self.profiles.setdefault(name, cProfile.Profile())
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is already active on this thread (a profiled stage inside another)
+            profile = None
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            with self.lock:
+                self.profiling.discard(name)
+
+    @contextmanager
+    def memory_profile(self, name):
+        # Tracing slows every allocation down, so it only runs inside profiled stages
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(25)
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        try:
+            yield
+        finally:
+            _, peak = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot()
+            if started_tracing:
+                tracemalloc.stop()
+            with self.lock:
+                self.profiling.discard(name)
+                # Keep the allocation diff of the call with the highest peak
+                if peak > self.peak_bytes.get(name, -1):
+                    self.peak_bytes[name] = peak
+                    self.allocations[name] = after.compare_to(before, 'lineno')[:25]
+
+    def write_profiles(self):
+        """Write a .prof file (cpu) or an allocation report (memory) for every profiled stage"""
+        os.makedirs(self.profile_dir, exist_ok=True)
+        for name, profile in self.profiles.items():
+            path = os.path.join(self.profile_dir, f"{name}.prof")
+            profile.dump_stats(path)
+            logging.info(f"CPU profile of stage {name} written to {path}")
+        for name, statistics in self.allocations.items():
+            path = os.path.join(self.profile_dir, f"{name}.memory.txt")
+            with open(path, 'w') as f:
+                f.write(f"Peak traced memory: {self.peak_bytes[name] / 1e6:.1f} MB\n")
+                f.writelines(f"{stat}\n" for stat in statistics)
+            logging.info(f"Memory profile of stage {name} written to {path}")
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                "started": self.started,
+                "elapsed_seconds": time.time() - self.started,
+                "stages": {stage: dict(timer) for stage, timer in self.timers.items()},
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+                "stage_peak_bytes": dict(self.peak_bytes)
+            }
+
+    def to_prometheus(self):
+        """Render the metrics in the Prometheus text exposition format"""
+        data = self.as_dict()
+        lines = [f"# TYPE {METRIC_PREFIX}_elapsed_seconds gauge",
+                 f"{METRIC_PREFIX}_elapsed_seconds {data['elapsed_seconds']}"]
+        lines.append(f"# TYPE {METRIC_PREFIX}_stage_seconds_total counter")
+        lines += [f'{METRIC_PREFIX}_stage_seconds_total{{stage="{stage}"}} {timer["seconds"]}'
+                  for stage, timer in data["stages"].items()]
+        lines.append(f"# TYPE {METRIC_PREFIX}_stage_calls_total counter")
+        lines += [f'{METRIC_PREFIX}_stage_calls_total{{stage="{stage}"}} {timer["calls"]}'
+                  for stage, timer in data["stages"].items()]
+        for name, value in data["counters"].items():
+            lines += [f"# TYPE {METRIC_PREFIX}_{metric_name(name)}_total counter",
+                      f"{METRIC_PREFIX}_{metric_name(name)}_total {value}"]
+        for name, value in data["gauges"].items():
+            lines += [f"# TYPE {METRIC_PREFIX}_{metric_name(name)} gauge",
+                      f"{METRIC_PREFIX}_{metric_name(name)} {value}"]
+        if data["stage_peak_bytes"]:
+            lines.append(f"# TYPE {METRIC_PREFIX}_stage_peak_bytes gauge")
+            lines += [f'{METRIC_PREFIX}_stage_peak_bytes{{stage="{stage}"}} {peak}'
+                      for stage, peak in data["stage_peak_bytes"].items()]
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path, fmt=None):
+        """Dump the metrics as JSON, or as Prometheus text for .prom/.txt files or fmt='prometheus'"""
+        fmt = fmt or ('prometheus' if path.endswith(('.prom', '.txt')) else 'json')
+        with open(path, 'w') as f:
+            if fmt == 'prometheus':
+                f.write(self.to_prometheus())
+            else:
+                json.dump(self.as_dict(), f, indent=2)
+        logging.info(f"Metrics written to {path}")
+
+def metric_name(name):
+    """Turn a counter or gauge name into a valid Prometheus metric name"""
+    return re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+def timed_stage(metrics, stage):
+    """metrics.stage(stage), or a no-op when no metrics are being collected"""
+    return metrics.stage(stage) if metrics is not None else nullcontext()
+
+def add_metrics_arguments(parser):
+    """Add the --metrics-out and profiling options shared by the command line scripts"""
+    parser.add_argument('--metrics-out', default=None,
+                        help="Write stage timings and counters here at the end (JSON, or Prometheus text for .prom/.txt)")
+    parser.add_argument('--metrics-format', choices=['json', 'prometheus'], default=None,
+                        help="Format of --metrics-out when the extension does not say")
+    parser.add_argument('--profile-stage', action='append', default=[], metavar='STAGE',
+                        help="Profile this stage (repeatable), e.g. dates, build_documents or http_send")
+    parser.add_argument('--profiler', choices=PROFILERS, default='cpu',
+                        help="cProfile (cpu) or tracemalloc (memory) for --profile-stage")
+    parser.add_argument('--profile-dir', default='profiles', help="Where the profiles of --profile-stage are written")
+
+def metrics_from_args(args):
+    """Create the Metrics for a run configured by add_metrics_arguments options"""
+    return Metrics(args.profile_stage, args.profiler, args.profile_dir)
+
+def finish_metrics(metrics, args):
+    """Write the profiles and the metrics file requested on the command line"""
+    if metrics.profile_stages:
+        metrics.write_profiles()
+    if args.metrics_out:
+        metrics.write(args.metrics_out, args.metrics_format)
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+# mock_es_server.py
+import argparse
+import gzip
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Error type ES reports for each injected item status
+ITEM_ERROR_TYPES = {
+    400: "mapper_parsing_exception",
+    409: "version_conflict_engine_exception",
+    429: "es_rejected_execution_exception",
+    503: "unavailable_shards_exception"
+}
+
+class MockState:
+    """Indices, aliases and counters shared by all request handler threads"""
+
+    def __init__(self, latency=0.0, item_failure_rate=0.0, item_failure_status=400, reject_rate=0.0, seed=None,
+                 bandwidth_mbps=None, search_data=None, search_mapping='dynamic'):
+        self.latency = latency
+        self.bandwidth_mbps = bandwidth_mbps
+        self.item_failure_rate = item_failure_rate
+        self.item_failure_status = item_failure_status
+        self.reject_rate = reject_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.indices = {}
+        # index -> {alias: properties such as is_write_index}
+        self.aliases = {}
+        self.templates = {}
+        self.pipelines = {}
+        self.stats = {"bulk_requests": 0, "bulk_rejected": 0, "bulk_bytes": 0, "bulk_raw_bytes": 0, "items": 0, "failed_items": 0,
+                      "searches": 0}
+        self.engine = None
+        if search_data:
+            # Searches are answered by the offline query engine over this file; without it they find nothing
+            from query_engine import load_engine
+            self.engine = load_engine(search_data, search_mapping)
+
+    def new_index(self, settings=None):
+        """An index entry with a fresh uuid, like ES gives every created index"""
+        return {"settings": settings or {}, "docs": 0, "uuid": uuid.uuid4().hex, "writes": 0, "deletes": 0, "ids": set()}
+
+    def resolve(self, name):
+        """Concrete indices behind an index or alias name, or a comma-separated list of them"""
+        if ',' in name:
+            return sorted({index for part in name.split(',') for index in self.resolve(part)})
+        if name in self.indices:
+            return [name]
+        return sorted(index for index, aliases in self.aliases.items() if name in aliases)
+
+    def write_index(self, name):
+        """
+        The index a write to name goes to, like ES: the index itself, the only
+        index behind an alias, or the one the alias marks with is_write_index.
+        None when an alias over several indices has no write index.
+        """
+        if name in self.indices:
+            return name
+        behind = {index: aliases[name] for index, aliases in self.aliases.items() if name in aliases}
+        marked = [index for index, properties in behind.items() if properties.get("is_write_index")]
+        if len(marked) == 1:
+            return marked[0]
+        if len(behind) == 1 and next(iter(behind.values())).get("is_write_index") is not False:
+            return next(iter(behind))
+        return None
+
+class MockHandler(BaseHTTPRequestHandler):
+    """Implements the subset of the Elasticsearch REST API used by the indexer"""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return self.rfile.read(length) if length else b''
+    
+    def decode_body(self, body):
+        """Undo Content-Encoding: gzip like ES does for compressed requests"""
+        if self.headers.get('Content-Encoding', '').lower() == 'gzip':
+            return gzip.decompress(body)
+        return body
+
+    def send_json(self, status, body=None):
+        payload = json.dumps(body).encode('utf-8') if body is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(payload)
+
+    def not_found(self, index):
+        self.send_json(404, {"error": {"type": "index_not_found_exception", "reason": f"no such index [{index}]"},
+                             "status": 404})
+
+    def route(self):
+        return [part for part in urlsplit(self.path).path.split('/') if part]
+
+    def do_HEAD(self):
+        parts = self.route()
+        self.read_body()
+        with self.state.lock:
+            exists = len(parts) == 1 and bool(self.state.resolve(parts[0]))
+        self.send_json(200 if exists else 404)
+
+    def do_GET(self):
+        parts = self.route()
+        self.read_body()
+        with self.state.lock:
+            if parts == ['_mock', 'stats']:
+                indices = {index: {key: value for key, value in entry.items() if key != "ids"}
+                           for index, entry in self.state.indices.items()}
+                return self.send_json(200, dict(self.state.stats, indices=indices))
+            if len(parts) >= 2 and parts[1] == '_stats':
+                indices = self.state.resolve(parts[0])
+                if not indices:
+                    return self.not_found(parts[0])
+                return self.send_json(200, {"indices": {index: self.index_stats(self.state.indices[index])
+                                                        for index in indices}})
+            if len(parts) == 2 and parts[1] == '_alias':
+                indices = self.state.resolve(parts[0])
+                if not indices:
+                    return self.not_found(parts[0])
+                return self.send_json(200, {index: {"aliases": dict(self.state.aliases.get(index, {}))}
+                                            for index in indices})
+            if len(parts) == 1 and self.state.resolve(parts[0]):
+                return self.send_json(200, {index: {"settings": self.state.indices[index]["settings"]}
+                                            for index in self.state.resolve(parts[0])})
+        self.send_json(404, {"error": {"type": "resource_not_found_exception"}, "status": 404})
+
+    def do_PUT(self):
+        parts = self.route()
+        body = self.read_body()
+        with self.state.lock:
+            if len(parts) == 2 and parts[0] == '_index_template':
+                self.state.templates[parts[1]] = json.loads(body or b'{}')
+                return self.send_json(200, {"acknowledged": True})
+            if len(parts) == 3 and parts[:2] == ['_ingest', 'pipeline']:
+                self.state.pipelines[parts[2]] = json.loads(body or b'{}')
+                return self.send_json(200, {"acknowledged": True})
+            if len(parts) == 2 and parts[1] == '_settings':
+                for index in self.state.resolve(parts[0]):
+                    self.state.indices[index]["settings"].update(json.loads(body or b'{}').get("index", {}))
+                return self.send_json(200, {"acknowledged": True})
+            if len(parts) == 1:
+                index = parts[0]
+                if index in self.state.indices or self.state.resolve(index):
+                    return self.send_json(400, {"error": {"type": "resource_already_exists_exception"}, "status": 400})
+                self.state.indices[index] = self.state.new_index(json.loads(body or b'{}').get("settings", {}))
+                return self.send_json(200, {"acknowledged": True, "index": index})
+        self.send_json(400, {"error": {"type": "illegal_argument_exception"}, "status": 400})
+
+    def do_DELETE(self):
+        parts = self.route()
+        self.read_body()
+        with self.state.lock:
+            if len(parts) == 1 and parts[0] in self.state.indices:
+                del self.state.indices[parts[0]]
+                self.state.aliases.pop(parts[0], None)
+                return self.send_json(200, {"acknowledged": True})
+        self.not_found(parts[0] if parts else '')
+
+    def do_POST(self):
+        parts = self.route()
+        body = self.read_body()
+        if parts == ['_bulk'] or (len(parts) == 2 and parts[1] == '_bulk'):
+            return self.bulk(body, parts[0] if len(parts) == 2 else None)
+        if parts == ['_msearch'] or (len(parts) == 2 and parts[1] == '_msearch'):
+            return self.msearch(body, parts[0] if len(parts) == 2 else None)
+        with self.state.lock:
+            if parts == ['_aliases']:
+                for action in json.loads(body).get("actions", []):
+                    (kind, spec), = action.items()
+                    if kind == "add":
+                        properties = {"is_write_index": spec["is_write_index"]} if "is_write_index" in spec else {}
+                        self.state.aliases.setdefault(spec["index"], {})[spec["alias"]] = properties
+                    elif kind == "remove":
+                        self.state.aliases.get(spec["index"], {}).pop(spec["alias"], None)
+                    elif kind == "remove_index":
+                        self.state.indices.pop(spec["index"], None)
+                        self.state.aliases.pop(spec["index"], None)
+                return self.send_json(200, {"acknowledged": True})
+            if len(parts) == 2 and parts[1] in ('_refresh', '_forcemerge'):
+                return self.send_json(200, {"_shards": {"failed": 0}})
+        self.send_json(400, {"error": {"type": "illegal_argument_exception"}, "status": 400})
+
+    def bulk(self, body, default_index):
+        """Count the actions of a _bulk body, injecting latency, rejections and item failures"""
+        state = self.state
+        started = time.perf_counter()
+        wire_bytes = len(body)
+        body = self.decode_body(body)
+        # A slow link costs time per byte on the wire, on top of the fixed latency
+        delay = state.latency + (wire_bytes * 8 / (state.bandwidth_mbps * 1e6) if state.bandwidth_mbps else 0.0)
+        if delay:
+            time.sleep(delay)
+        with state.lock:
+            state.stats["bulk_requests"] += 1
+            state.stats["bulk_bytes"] += wire_bytes
+            state.stats["bulk_raw_bytes"] += len(body)
+            if state.reject_rate and state.random.random() < state.reject_rate:
+                state.stats["bulk_rejected"] += 1
+                return self.send_json(429, {"error": {"type": "es_rejected_execution_exception",
+                                                      "reason": "rejected execution of bulk (mock)"},
+                                            "status": 429})
+
+            items = []
+            lines = iter(body.splitlines())
+            for line in lines:
+                if not line.strip():
+                    continue
+                (action, meta), = json.loads(line).items()
+                if action != "delete":
+                    next(lines, None)  # The source line
+                index = meta.get("_index", default_index)
+                doc_id = meta.get("_id") or f"mock-{state.stats['items'] + len(items)}"
+                if state.item_failure_rate and state.random.random() < state.item_failure_rate:
+                    status = state.item_failure_status
+                    items.append({action: {"_index": index, "_id": doc_id, "status": status,
+                                           "error": {"type": ITEM_ERROR_TYPES.get(status, "exception"),
+                                                     "reason": "injected failure (mock)"}}})
+                    continue
+                if state.resolve(index) and state.write_index(index) is None:
+                    items.append({action: {"_index": index, "_id": doc_id, "status": 400,
+                                           "error": {"type": "illegal_argument_exception",
+                                                     "reason": f"no write index is defined for alias [{index}]"}}})
+                    continue
+                target = state.write_index(index) or index
+                # Like ES, indexing into a missing index creates it
+                if target not in state.indices:
+                    state.indices[target] = state.new_index()
+                entry = state.indices[target]
+                if str(entry["settings"].get("blocks.write")).lower() == 'true':
+                    items.append({action: {"_index": target, "_id": doc_id, "status": 403,
+                                           "error": {"type": "cluster_block_exception",
+                                                     "reason": f"index [{target}] blocked by: [FORBIDDEN/8/index write (api)]"}}})
+                    continue
+                # Explicit ids are tracked so overwrites and deletes change the count like in ES;
+                # generated ones are always new
+                exists = doc_id in entry["ids"]
+                if action == "delete":
+                    if not exists:
+                        items.append({action: {"_index": target, "_id": doc_id, "status": 404, "result": "not_found"}})
+                        continue
+                    entry["ids"].discard(doc_id)
+                    entry["docs"] -= 1
+                    entry["deletes"] += 1
+                    items.append({action: {"_index": target, "_id": doc_id, "status": 200, "result": "deleted"}})
+                    continue
+                if meta.get("_id"):
+                    entry["ids"].add(doc_id)
+                entry["docs"] += 0 if exists else 1
+                entry["writes"] += 1
+                items.append({action: {"_index": target, "_id": doc_id, "status": 200 if exists else 201,
+                                       "result": "updated" if exists else "created"}})
+
+            # Like ES, a delete of a missing id is reported as not_found without being an error
+            failed = sum(1 for item in items for outcome in item.values() if "error" in outcome)
+            state.stats["items"] += len(items)
+            state.stats["failed_items"] += failed
+        took = int((time.perf_counter() - started) * 1000)
+        self.send_json(200, {"took": took, "errors": failed > 0, "items": items})
+
+    def index_stats(self, entry):
+        return {"uuid": entry["uuid"],
+                "primaries": {"docs": {"count": entry["docs"]},
+                              "indexing": {"index_total": entry["writes"], "delete_total": entry["deletes"]}}}
+
+    def msearch(self, body, default_index):
+        """Answer each header/body pair of an _msearch request; searches of missing indices fail on their own"""
+        state = self.state
+        started = time.perf_counter()
+        lines = [line for line in self.decode_body(body).splitlines() if line.strip()]
+        responses = []
+        for header, request in zip(lines[0::2], lines[1::2]):
+            index = json.loads(header).get("index", default_index)
+            with state.lock:
+                state.stats["searches"] += 1
+                found = bool(state.resolve(index))
+            if not found:
+                responses.append({"error": {"type": "index_not_found_exception", "reason": f"no such index [{index}]"},
+                                  "status": 404})
+                continue
+            if state.engine is None:
+                response = {"took": 0, "timed_out": False,
+                            "hits": {"total": {"value": 0, "relation": "eq"}, "max_score": None, "hits": []}}
+            else:
+                response = state.engine.search(json.loads(request))
+            responses.append(dict(response, status=200))
+        took = int((time.perf_counter() - started) * 1000)
+        self.send_json(200, {"took": took, "responses": responses})
+
+def start_server(host='127.0.0.1', port=0, **options):
+    """Start the mock server on a background thread and return it; server.url is its base URL"""
+    server = ThreadingHTTPServer((host, port), MockHandler)
+    server.daemon_threads = True
+    server.state = MockState(**options)
+    server.url = f"http://{host}:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, name="mock-es", daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the Elasticsearch endpoints used by the indexer")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9200)
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to every _bulk request")
+    parser.add_argument('--item-failure-rate', type=float, default=0.0, help="Fraction of bulk items that fail")
+    parser.add_argument('--item-failure-status', type=int, default=400, choices=sorted(ITEM_ERROR_TYPES),
+                        help="HTTP status reported for failed items")
+    parser.add_argument('--reject-rate', type=float, default=0.0,
+                        help="Fraction of _bulk requests rejected with HTTP 429")
+    parser.add_argument('--seed', type=int, default=None, help="Seed for the failure injection")
+    parser.add_argument('--bandwidth-mbps', type=float, default=None,
+                        help="Simulated link speed; _bulk requests are delayed by their wire size")
+    parser.add_argument('--search-data', default=None,
+                        help="Answer _msearch with the offline query engine over this CSV instead of empty results")
+    parser.add_argument('--search-mapping', choices=['dynamic', 'template'], default='dynamic',
+                        help="Field types the query engine emulates for --search-data")
+    args = parser.parse_args()
+    server = start_server(args.host, args.port, latency=args.latency, item_failure_rate=args.item_failure_rate,
+                          item_failure_status=args.item_failure_status, reject_rate=args.reject_rate, seed=args.seed,
+                          bandwidth_mbps=args.bandwidth_mbps, search_data=args.search_data,
+                          search_mapping=args.search_mapping)
+    logging.info(f"Mock Elasticsearch listening on {server.url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# partitions.py
+import math
+import re
+
+import pandas as pd
+
+# Documents go to <index>-YYYY-<run> by the year of their Date, or to <index>-undated-<run> without one;
+# every load writes a new generation under its own run id while the alias keeps serving the previous one
+PARTITION_UNDATED = "undated"
+PARTITION_KEY_PATTERN = r'^(\d{4})-'
+PARTITION_RUN_FORMAT = '%Y%m%d%H%M%S'
+# Primary shards are sized by document count: at roughly 1 KB indexed per restaurant, 10M documents
+# make a shard of about 10 GB, within the 10-50 GB ES recommends
+PARTITION_DOCS_PER_SHARD = 10_000_000
+PARTITION_MAX_SHARDS = 16
+# Date fields that hold the same value the partitions are keyed on
+PARTITION_DATE_FIELDS = ['Date', '@timestamp']
+
+def partition_key(date):
+    """Partition of a document from its Date string: the year, or PARTITION_UNDATED"""
+    match = re.match(PARTITION_KEY_PATTERN, date)
+    return match.group(1) if match else PARTITION_UNDATED
+
+def partition_keys(dates):
+    """partition_key of every value of a column of Date strings"""
+    return dates.astype(str).str.extract(PARTITION_KEY_PATTERN)[0].fillna(PARTITION_UNDATED)
+
+def partition_index(index, key, run_id):
+    return f"{index}-{key}-{run_id}"
+
+def partition_shards(docs, docs_per_shard=PARTITION_DOCS_PER_SHARD):
+    """Primary shard count for a partition of docs documents"""
+    return max(1, min(PARTITION_MAX_SHARDS, math.ceil(docs / docs_per_shard)))
+
+def required_date_ranges(query):
+    """Range clauses on the date fields that every hit has to match: the query itself or its bool must/filter clauses"""
+    if not query:
+        return
+    (kind, spec), = query.items()
+    if kind == 'range':
+        field, bounds = next((field, bounds) for field, bounds in spec.items() if isinstance(bounds, dict))
+        if field in PARTITION_DATE_FIELDS:
+            yield bounds
+    elif kind == 'bool':
+        for occur in ('must', 'filter'):
+            clauses = spec.get(occur, [])
+            for clause in clauses if isinstance(clauses, list) else [clauses]:
+                yield from required_date_ranges(clause)
+
+def bound_year(value, op, time_zone=None):
+    """UTC year of the first (gt, gte) or last (lt, lte) instant a range bound admits"""
+    if not isinstance(value, str):
+        raise ValueError(f"Unsupported date bound: {value!r}")
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.tz_localize(time_zone or 'UTC')
+    timestamp = timestamp.tz_convert('UTC')
+    if op in ('gt', 'lte') and re.fullmatch(r'\d{4}-\d{2}-\d{2}', value):
+        # Like ES, a bare date is rounded up to the end of its day for gt and lte
+        timestamp += pd.Timedelta(days=1) - pd.Timedelta(milliseconds=1)
+    if op == 'gt':
+        timestamp += pd.Timedelta(milliseconds=1)
+    elif op == 'lt':
+        timestamp -= pd.Timedelta(milliseconds=1)
+    return timestamp.year
+
+def query_years(query):
+    """
+    First and last year (None when open) a query's required date ranges
+    allow, or None when it has no date bound or one that cannot be read
+    here, like date math; such queries search every partition.
+    """
+    first, last = None, None
+    bounded = False
+    try:
+        for bounds in required_date_ranges(query):
+            for op in ('gt', 'gte', 'lt', 'lte'):
+                if bounds.get(op) is None:
+                    continue
+                bounded = True
+                year = bound_year(bounds[op], op, bounds.get('time_zone'))
+                if op in ('gt', 'gte'):
+                    first = year if first is None else max(first, year)
+                else:
+                    last = year if last is None else min(last, year)
+    except ValueError:
+        return None
+    return (first, last) if bounded else None
+
+def prune_partitions(query, indices, index):
+    """
+    The indices behind index that can hold hits of query: year partitions
+    outside its date range are dropped, and so is the undated one, which
+    no date range matches. Other indices are always kept.
+    """
+    years = query_years(query)
+    if years is None:
+        return list(indices)
+    first, last = years
+    kept = []
+    for name in indices:
+        # Partitions loaded before run ids were added have no suffix
+        match = re.fullmatch(rf'{re.escape(index)}-(\d{{4}}|{PARTITION_UNDATED})(?:-\d+)?', name)
+        if not match:
+            kept.append(name)
+        elif match.group(1) != PARTITION_UNDATED and (first is None or int(match.group(1)) >= first) \
+                and (last is None or int(match.group(1)) <= last):
+            kept.append(name)
+    return kept
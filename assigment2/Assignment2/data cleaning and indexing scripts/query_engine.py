@@ -0,0 +1,755 @@
+#!/usr/bin/env python3
+# query_engine.py
+import argparse
+import json
+import logging
+import math
+import os
+import re
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from elasticsearch_grok_indexer import DOCUMENT_FIELDS, NAME_NGRAM_SIZE, document_columns, index_name
+from geo_index import GEOHASH_FIELDS, GRID_CELL_DEGREES, GridIndex
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+STRING_FIELDS = ['RestaurantName', 'RatingText', 'City', 'Country', 'Continent', 'City/Country/Continent'] + GEOHASH_FIELDS
+NUMERIC_FIELDS = ['SerialNumber', 'AverageCostForTwo', 'AggregateRating', 'Votes']
+# Fields sent as JSON floats, which dynamic mapping stores as 32-bit floats
+FLOAT_FIELDS = ['AggregateRating', 'Votes']
+# 'dynamic': what ES maps without the index template (text with a .keyword sub-field, float),
+# which the section1 queries and their stored results were written against.
+# 'template': the keyword and double fields of create_index_template().
+MAPPINGS = ['dynamic', 'template']
+DATE_FIELDS = ['Date', '@timestamp']
+GEO_FIELDS = ['Coordinates']
+# Sub-fields of create_index_template() and how each one is searched; a wildcard field matches like a keyword
+TEMPLATE_SUBFIELDS = {'RestaurantName': {'text': 'text', 'ngram': 'ngram', 'wildcard': 'keyword'}}
+
+# Rough stand-in for the standard tokenizer: words, keeping inner apostrophes
+TOKEN_PATTERN = r"\w+(?:'\w+)*"
+# The token_chars of the name_ngram tokenizer: letters, digits and apostrophes
+NGRAM_TOKEN_PATTERN = r"(?:[^\W_]|')+"
+DISTANCE_UNITS = {'mi': 1609.344, 'miles': 1609.344, 'yd': 0.9144, 'ft': 0.3048, 'in': 0.0254, 'km': 1000.0,
+                  'm': 1.0, 'cm': 0.01, 'mm': 0.001, 'nmi': 1852.0, 'NM': 1852.0}
+DEFAULT_SIZE = 10
+TOTAL_HITS_LIMIT = 10000
+
+class TermIndex:
+    """Terms of one field: term codes per (document, term) pair and the sorted term dictionary"""
+
+    def __init__(self, doc_ids, codes, terms):
+        self.doc_ids = doc_ids
+        self.codes = codes
+        self.terms = terms
+
+    def docs_with(self, term_mask, size):
+        """Mask of the documents holding any term selected by term_mask"""
+        mask = np.zeros(size, dtype=bool)
+        mask[self.doc_ids[term_mask[self.codes]]] = True
+        return mask
+
+class QueryEngine:
+    """
+    Runs the subset of the ES query DSL used by the section1 queries and
+    aggregations over the restaurant documents, with vectorized NumPy operations
+    instead of a cluster. Queries become boolean masks over all documents;
+    wildcard, prefix and term queries are matched against the term dictionary of
+    the field first, like Lucene does. Scores are not computed, so hits without
+    a sort come back in index order with a score of 1.
+    """
+
+    def __init__(self, df, mapping='dynamic'):
+        self.size = len(df)
+        self.columns = document_columns(df.reset_index(drop=True))
+        self.mapping = mapping
+        self.values = {}
+        self.term_indexes = {}
+        self.token_strings = {}
+        self.grid_indexes = {}
+
+    # Field access
+
+    def field_type(self, field):
+        base, _, subfield = field.partition('.')
+        if subfield and subfield != 'keyword':
+            if self.mapping == 'template' and subfield in TEMPLATE_SUBFIELDS.get(base, {}):
+                return TEMPLATE_SUBFIELDS[base][subfield]
+            raise ValueError(f"Unknown field: {field}")
+        if base in STRING_FIELDS:
+            return 'keyword' if subfield or self.mapping == 'template' else 'text'
+        if field in NUMERIC_FIELDS:
+            return 'number'
+        if field in DATE_FIELDS:
+            return 'date'
+        if field in GEO_FIELDS:
+            return 'geo_point'
+        raise ValueError(f"Unknown field: {field}")
+
+    def field_values(self, field):
+        """Values of a field as an array; NaN (NaT for dates) marks documents without one"""
+        base = field.partition('.')[0]
+        if base not in self.values:
+            kind = self.field_type(field)
+            column = self.columns[base]
+            if kind in ('text', 'keyword', 'ngram'):
+                values = column.astype(object).to_numpy()
+            elif kind == 'number':
+                values = column.astype(float).to_numpy()
+                if self.mapping == 'dynamic' and base in FLOAT_FIELDS:
+                    # Search and aggregations see the 32-bit value, not the one in _source
+                    values = values.astype(np.float32).astype(float)
+            elif kind == 'date':
+                values = pd.to_datetime(column, utc=True, errors='coerce', format='ISO8601').dt.tz_convert(None).to_numpy()
+            else:
+                lat_lon = np.char.partition(column.to_numpy(dtype=str), ',')
+                values = np.column_stack([lat_lon[:, 0].astype(float), lat_lon[:, 2].astype(float)])
+            self.values[base] = values
+        return self.values[base]
+
+    def term_index(self, field):
+        """Term dictionary of a field, built on first use; text fields are lowercased and tokenized"""
+        if field not in self.term_indexes:
+            kind = self.field_type(field)
+            if kind == 'text':
+                doc_ids, values = tokenize(self.field_values(field))
+            elif kind in ('keyword', 'number'):
+                values = self.field_values(field)
+                present = ~pd.isna(values)
+                doc_ids, values = np.flatnonzero(present), values[present]
+            else:
+                raise ValueError(f"Field {field} of type {kind} has no terms")
+            codes, terms = pd.factorize(values, sort=True)
+            self.term_indexes[field] = TermIndex(doc_ids, codes, pd.Index(terms))
+        return self.term_indexes[field]
+
+    def token_mask(self, field, query):
+        """
+        Documents whose analyzed field holds the analyzed query as consecutive
+        tokens, like match_phrase. Each distinct value is analyzed once into a
+        '|'-delimited token string, so a phrase is a substring search; for the
+        trigrams of .ngram this matches the substring the query spells out.
+        """
+        if field not in self.token_strings:
+            codes, uniques = pd.factorize(self.field_values(field))
+            strings = pd.Series([token_string(analyze(value, self.field_type(field))) for value in uniques], dtype=object)
+            self.token_strings[field] = codes, strings
+        codes, strings = self.token_strings[field]
+        tokens = analyze(str(query), self.field_type(field))
+        if not tokens:
+            # Like zero_terms_query: none, a query without tokens matches nothing
+            return np.zeros(self.size, dtype=bool)
+        selected = strings.str.contains(token_string(tokens), regex=False).to_numpy()
+        return (codes >= 0) & selected[codes]
+
+    def grid_index(self, field, cell_degrees=GRID_CELL_DEGREES):
+        """Grid spatial index of a geo_point field, built on first use"""
+        if (field, cell_degrees) not in self.grid_indexes:
+            coordinates = self.field_values(field)
+            self.grid_indexes[field, cell_degrees] = GridIndex(coordinates[:, 0], coordinates[:, 1], cell_degrees)
+        return self.grid_indexes[field, cell_degrees]
+
+    def term_mask(self, field, selected):
+        """Documents of field holding one of the terms selected by the boolean array"""
+        return self.term_index(field).docs_with(np.asarray(selected, dtype=bool), self.size)
+
+    def pattern_mask(self, field, regex, case_insensitive=False):
+        terms = pd.Series(self.term_index(field).terms.astype(str))
+        return self.term_mask(field, terms.str.fullmatch(regex, case=not case_insensitive,
+                                                         flags=re.DOTALL).to_numpy())
+
+    # Queries
+
+    def query_mask(self, query):
+        """Evaluate a query clause to a boolean mask over all documents"""
+        if not query:
+            return np.ones(self.size, dtype=bool)
+        (kind, spec), = query.items()
+        handler = QUERY_HANDLERS.get(kind)
+        if handler is None:
+            raise ValueError(f"Unsupported query: {kind}")
+        return handler(self, spec)
+
+    def match_all_query(self, spec):
+        return np.ones(self.size, dtype=bool)
+
+    def bool_query(self, spec):
+        mask = np.ones(self.size, dtype=bool)
+        for clause in clause_list(spec.get('must')) + clause_list(spec.get('filter')):
+            mask &= self.query_mask(clause)
+        for clause in clause_list(spec.get('must_not')):
+            mask &= ~self.query_mask(clause)
+        should = clause_list(spec.get('should'))
+        if should:
+            # Without must or filter clauses at least one should clause has to match
+            required = spec.get('minimum_should_match', 0 if 'must' in spec or 'filter' in spec else 1)
+            matched = np.sum([self.query_mask(clause) for clause in should], axis=0)
+            mask &= matched >= minimum_should_match(required, len(should))
+        return mask
+
+    def term_query(self, spec):
+        (field, value), = spec.items()
+        options = value if isinstance(value, dict) else {'value': value}
+        return self.terms_mask(field, [options['value']], options.get('case_insensitive', False))
+
+    def terms_query(self, spec):
+        (field, values), = ((field, values) for field, values in spec.items() if field != 'boost')
+        return self.terms_mask(field, values)
+
+    def terms_mask(self, field, values, case_insensitive=False):
+        kind = self.field_type(field)
+        if kind == 'number':
+            return np.isin(self.field_values(field), np.asarray(values, dtype=float))
+        if kind == 'date':
+            return np.isin(self.field_values(field), [parse_date(value) for value in values])
+        terms = self.term_index(field).terms.astype(str)
+        if case_insensitive:
+            return self.term_mask(field, terms.str.lower().isin([str(value).lower() for value in values]))
+        return self.term_mask(field, terms.isin([str(value) for value in values]))
+
+    def range_query(self, spec):
+        (field, bounds), = spec.items()
+        kind = self.field_type(field)
+        values = self.field_values(field)
+        mask = ~pd.isna(values)
+        for op, compare in (('gte', np.greater_equal), ('gt', np.greater), ('lte', np.less_equal), ('lt', np.less)):
+            if bounds.get(op) is None:
+                continue
+            if kind == 'date':
+                # Like ES, gt and lte round a date without a time up to the end of that day
+                bound = parse_date(bounds[op], round_up=op in ('gt', 'lte'))
+            elif kind == 'number':
+                bound = float(bounds[op])
+            else:
+                raise ValueError(f"range on {kind} field {field} is not supported")
+            mask &= compare(values, bound, where=mask, out=np.zeros(self.size, dtype=bool))
+        return mask
+
+    def wildcard_query(self, spec):
+        (field, value), = spec.items()
+        options = value if isinstance(value, dict) else {'value': value}
+        pattern = options.get('value', options.get('wildcard'))
+        if self.field_type(field) == 'text':
+            # Text terms are lowercase, and ES normalizes the pattern the same way
+            pattern = pattern.lower()
+        return self.pattern_mask(field, wildcard_regex(pattern), options.get('case_insensitive', False))
+
+    def prefix_query(self, spec):
+        (field, value), = spec.items()
+        options = value if isinstance(value, dict) else {'value': value}
+        prefix = options['value'].lower() if self.field_type(field) == 'text' else options['value']
+        return self.pattern_mask(field, re.escape(prefix) + '.*', options.get('case_insensitive', False))
+
+    def match_query(self, spec):
+        (field, value), = spec.items()
+        options = value if isinstance(value, dict) else {'query': value}
+        kind = self.field_type(field)
+        if kind not in ('text', 'ngram'):
+            return self.terms_mask(field, [options['query']])
+        tokens = analyze(str(options['query']), kind)
+        if not tokens:
+            return np.zeros(self.size, dtype=bool)
+        if kind == 'text':
+            masks = [self.terms_mask(field, [token]) for token in tokens]
+        else:
+            masks = [self.token_mask(field, token) for token in tokens]
+        return np.logical_and.reduce(masks) if options.get('operator', 'or').lower() == 'and' \
+            else np.logical_or.reduce(masks)
+
+    def match_phrase_query(self, spec):
+        (field, value), = spec.items()
+        options = value if isinstance(value, dict) else {'query': value}
+        if self.field_type(field) not in ('text', 'ngram'):
+            return self.terms_mask(field, [options['query']])
+        return self.token_mask(field, options['query'])
+
+    def exists_query(self, spec):
+        values = self.field_values(spec['field'])
+        return ~np.isnan(values).any(axis=1) if values.ndim == 2 else ~pd.isna(values)
+
+    def geo_distance_query(self, spec):
+        (field, origin), = ((key, value) for key, value in spec.items() if key not in ('distance', 'distance_type'))
+        lat, lon = geo_point(origin)
+        # Only points in the grid cells around the circle are measured
+        return self.grid_index(field).mask_within(lat, lon, parse_distance(spec['distance']), self.size)
+
+    # Hits
+
+    def sorted_hits(self, mask, sort):
+        """Positions of the matching documents ordered by the sort clauses, and the (field, order) of each clause"""
+        positions = np.flatnonzero(mask)
+        clauses = [sort_clause(clause) for clause in clause_list(sort)]
+        keys = []
+        for field, order in clauses:
+            if field == '_doc':
+                values = positions.astype(float)
+            elif field == '_score':
+                values = np.ones(len(positions))
+            else:
+                if self.field_type(field) in ('keyword', 'text'):
+                    values = pd.factorize(self.field_values(field)[positions], sort=True)[0].astype(float)
+                    values[values < 0] = np.nan
+                else:
+                    values = self.field_values(field)[positions]
+                    if self.field_type(field) == 'date':
+                        values = values.astype('datetime64[ms]').astype('int64').astype(float)
+                        values[pd.isna(self.field_values(field)[positions])] = np.nan
+            # Missing values sort last in both directions
+            missing = np.isnan(values)
+            key = np.where(missing, 0.0, -values if order == 'desc' else values)
+            keys += [missing, key]
+        if keys:
+            # np.lexsort sorts by its last key first, so the first clause goes last
+            positions = positions[np.lexsort(keys[::-1])]
+        return positions, clauses
+
+    def sort_value(self, field, position):
+        if field == '_doc':
+            return int(position)
+        if field == '_score':
+            return 1.0
+        value = self.field_values(field)[position]
+        if pd.isna(value):
+            return None
+        if self.field_type(field) == 'date':
+            return int(pd.Timestamp(value).value // 1_000_000)
+        if self.mapping == 'dynamic' and field in FLOAT_FIELDS:
+            # ES renders float sort values with their shortest 32-bit representation
+            return float(str(np.float32(value)))
+        return value.item() if hasattr(value, 'item') else value
+
+    def source(self, position, includes):
+        document = {field: self.columns[field].iat[position] for field in DOCUMENT_FIELDS}
+        document = {field: value.item() if hasattr(value, 'item') else value for field, value in document.items()}
+        if includes is True:
+            return document
+        return {field: value for field, value in document.items()
+                if any(re.fullmatch(wildcard_regex(pattern), field) for pattern in includes)}
+
+    def hits(self, mask, request):
+        size = request.get('size', DEFAULT_SIZE)
+        start = request.get('from', 0)
+        sort = request.get('sort')
+        positions, sort_fields = self.sorted_hits(mask, sort)
+        includes = source_includes(request.get('_source', True))
+        total = int(mask.sum())
+        hits = []
+        for position in positions[start:start + size]:
+            hit = {"_index": index_name, "_id": str(self.columns['SerialNumber'].iat[position]),
+                   "_score": None if sort else 1.0}
+            if includes:
+                hit["_source"] = self.source(position, includes)
+            if sort:
+                hit["sort"] = [self.sort_value(field, position) for field, _ in sort_fields]
+            hits.append(hit)
+        track = request.get('track_total_hits', TOTAL_HITS_LIMIT)
+        limit = TOTAL_HITS_LIMIT if track is False else (total if track is True else track)
+        return {
+            "total": {"value": min(total, limit), "relation": "eq" if total <= limit else "gte"},
+            "max_score": None if sort or not hits else 1.0,
+            "hits": hits
+        }
+
+    # Aggregations
+
+    def aggregate(self, aggs, mask):
+        """Evaluate named aggregations over the documents in mask"""
+        results = {}
+        for name, spec in aggs.items():
+            sub_aggs = spec.get('aggs', spec.get('aggregations', {}))
+            (kind, options), = ((key, value) for key, value in spec.items() if key not in ('aggs', 'aggregations', 'meta'))
+            handler = AGGREGATION_HANDLERS.get(kind)
+            if handler is None:
+                raise ValueError(f"Unsupported aggregation: {kind}")
+            results[name] = handler(self, options, mask, sub_aggs)
+        return results
+
+    def metric_values(self, options, mask):
+        values = self.field_values(options['field'])[mask]
+        if options.get('missing') is not None:
+            return np.where(np.isnan(values), float(options['missing']), values)
+        return values[~np.isnan(values)]
+
+    def avg_aggregation(self, options, mask, sub_aggs):
+        values = self.metric_values(options, mask)
+        return {"value": float(values.mean()) if len(values) else None}
+
+    def sum_aggregation(self, options, mask, sub_aggs):
+        return {"value": float(self.metric_values(options, mask).sum())}
+
+    def min_aggregation(self, options, mask, sub_aggs):
+        values = self.metric_values(options, mask)
+        return {"value": float(values.min()) if len(values) else None}
+
+    def max_aggregation(self, options, mask, sub_aggs):
+        values = self.metric_values(options, mask)
+        return {"value": float(values.max()) if len(values) else None}
+
+    def value_count_aggregation(self, options, mask, sub_aggs):
+        return {"value": int(len(self.metric_values(options, mask)))}
+
+    def stats_aggregation(self, options, mask, sub_aggs):
+        values = self.metric_values(options, mask)
+        if not len(values):
+            return {"count": 0, "min": None, "max": None, "avg": None, "sum": 0.0}
+        return {"count": int(len(values)), "min": float(values.min()), "max": float(values.max()),
+                "avg": float(values.mean()), "sum": float(values.sum())}
+
+    def weighted_avg_aggregation(self, options, mask, sub_aggs):
+        values = self.field_values(options['value']['field'])[mask]
+        weights = self.field_values(options['weight']['field'])[mask]
+        if options['value'].get('missing') is not None:
+            values = np.where(np.isnan(values), float(options['value']['missing']), values)
+        if options['weight'].get('missing') is not None:
+            weights = np.where(np.isnan(weights), float(options['weight']['missing']), weights)
+        present = ~np.isnan(values) & ~np.isnan(weights)
+        weight_sum = weights[present].sum()
+        return {"value": float((values[present] * weights[present]).sum() / weight_sum) if weight_sum else None}
+
+    def terms_aggregation(self, options, mask, sub_aggs):
+        field = options['field']
+        if self.field_type(field) == 'text':
+            raise ValueError(f"Text field {field} cannot be aggregated, use {field}.keyword")
+        index = self.term_index(field)
+        in_mask = mask[index.doc_ids]
+        counts = np.bincount(index.codes[in_mask], minlength=len(index.terms))
+        size = options.get('size', DEFAULT_SIZE)
+        min_doc_count = options.get('min_doc_count', 1)
+        # Terms without documents only take part with min_doc_count 0
+        candidates = np.flatnonzero(counts >= min(min_doc_count, 1))
+
+        buckets = []
+        for code in candidates:
+            bucket_mask = index.docs_with(index.terms == index.terms[code], self.size) & mask
+            bucket = {"key": bucket_key(index.terms[code]), "doc_count": int(counts[code])}
+            bucket.update(self.aggregate(sub_aggs, bucket_mask))
+            buckets.append(bucket)
+        orders = order_list(options.get('order', {'_count': 'desc'}))
+        buckets = sort_buckets(buckets, orders)
+        # Like ES, the shard keeps its top shard_size buckets and leaves only the rest in the other count;
+        # the reduce then drops those below min_doc_count without adding them back, and adds back the
+        # ones beyond size
+        shard_size = max(size, options.get('shard_size', int(size * 1.5 + 10)))
+        kept = [bucket for bucket in buckets[:shard_size] if bucket["doc_count"] >= min_doc_count]
+        returned = kept[:size]
+        other = (counts.sum() - sum(bucket["doc_count"] for bucket in buckets[:shard_size])
+                 + sum(bucket["doc_count"] for bucket in kept[size:]))
+        by_sub_aggregation = any(key not in ('_count', '_key') for key, _ in orders)
+        return {
+            # ES cannot bound the count error when buckets are ordered by a sub-aggregation
+            "doc_count_error_upper_bound": -1 if by_sub_aggregation else 0,
+            "sum_other_doc_count": int(other),
+            "buckets": returned
+        }
+
+    def range_aggregation(self, options, mask, sub_aggs):
+        values = self.field_values(options['field'])
+        buckets = []
+        for bucket_range in options['ranges']:
+            low, high = bucket_range.get('from'), bucket_range.get('to')
+            bucket_mask = mask & ~np.isnan(values)
+            if low is not None:
+                bucket_mask &= values >= low
+            if high is not None:
+                bucket_mask &= values < high
+            key = bucket_range.get('key', f"{'*' if low is None else float(low)}-{'*' if high is None else float(high)}")
+            bucket = {"key": key}
+            if low is not None:
+                bucket["from"] = low
+            if high is not None:
+                bucket["to"] = high
+            bucket["doc_count"] = int(bucket_mask.sum())
+            bucket.update(self.aggregate(sub_aggs, bucket_mask))
+            buckets.append(bucket)
+        return {"buckets": buckets}
+
+    def cardinality_aggregation(self, options, mask, sub_aggs):
+        values = self.field_values(options['field'])[mask]
+        return {"value": int(pd.Series(values).nunique())}
+
+    # Requests
+
+    def search(self, request):
+        """Answer a _search request body with a response shaped like the one from ES"""
+        started = time.perf_counter()
+        mask = self.query_mask(request.get('query'))
+        response = {"took": 0, "timed_out": False,
+                    "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0},
+                    "hits": self.hits(mask, request)}
+        aggs = request.get('aggs', request.get('aggregations'))
+        if aggs:
+            response["aggregations"] = self.aggregate(aggs, mask)
+        response["took"] = int((time.perf_counter() - started) * 1000)
+        return response
+
+QUERY_HANDLERS = {
+    'match_all': QueryEngine.match_all_query,
+    'bool': QueryEngine.bool_query,
+    'term': QueryEngine.term_query,
+    'terms': QueryEngine.terms_query,
+    'range': QueryEngine.range_query,
+    'wildcard': QueryEngine.wildcard_query,
+    'prefix': QueryEngine.prefix_query,
+    'match': QueryEngine.match_query,
+    'match_phrase': QueryEngine.match_phrase_query,
+    'exists': QueryEngine.exists_query,
+    'geo_distance': QueryEngine.geo_distance_query
+}
+
+AGGREGATION_HANDLERS = {
+    'avg': QueryEngine.avg_aggregation,
+    'sum': QueryEngine.sum_aggregation,
+    'min': QueryEngine.min_aggregation,
+    'max': QueryEngine.max_aggregation,
+    'value_count': QueryEngine.value_count_aggregation,
+    'stats': QueryEngine.stats_aggregation,
+    'weighted_avg': QueryEngine.weighted_avg_aggregation,
+    'cardinality': QueryEngine.cardinality_aggregation,
+    'terms': QueryEngine.terms_aggregation,
+    'range': QueryEngine.range_aggregation
+}
+
+def clause_list(clauses):
+    """Bool clauses and sort specs may be a single object or a list"""
+    if clauses is None:
+        return []
+    return clauses if isinstance(clauses, list) else [clauses]
+
+def tokenize(values):
+    """
+    (document, token) pairs of a string column, lowercased and split like the
+    standard analyzer. Each distinct value is tokenized once and its tokens are
+    repeated for every document holding it, since names repeat a lot.
+    """
+    codes, uniques = pd.factorize(values)
+    tokens = pd.Series(uniques, dtype=object).str.lower().str.findall(TOKEN_PATTERN).explode().dropna()
+    owners = tokens.index.to_numpy()
+    counts = np.bincount(owners, minlength=len(uniques))
+    starts = np.cumsum(counts) - counts
+    docs = np.flatnonzero(codes >= 0)
+    per_doc = counts[codes[docs]]
+    # Position of every (document, token) pair in the token list of its distinct value
+    offsets = np.arange(per_doc.sum()) - np.repeat(np.cumsum(per_doc) - per_doc, per_doc)
+    positions = np.repeat(starts[codes[docs]], per_doc) + offsets
+    return np.repeat(docs, per_doc), tokens.to_numpy()[positions]
+
+def analyze(value, kind):
+    """Tokens of a text value: lowercase words for text fields, the trigrams of each word for ngram fields"""
+    if kind == 'text':
+        return re.findall(TOKEN_PATTERN, value.lower())
+    return [word[start:start + NAME_NGRAM_SIZE] for word in re.findall(NGRAM_TOKEN_PATTERN, value.lower())
+            for start in range(len(word) - NAME_NGRAM_SIZE + 1)]
+
+def token_string(tokens):
+    return '|' + '|'.join(tokens) + '|'
+
+def minimum_should_match(value, clauses):
+    """Number of should clauses required, from an integer or a percentage like '50%' (negative counts down)"""
+    text = str(value)
+    if text.endswith('%'):
+        required = int(clauses * abs(int(text[:-1])) / 100)
+        return clauses - required if text.startswith('-') else required
+    required = int(text)
+    return clauses + required if required < 0 else required
+
+def wildcard_regex(pattern):
+    """Translate a wildcard pattern (* and ?) to a regular expression"""
+    return ''.join('.*' if char == '*' else '.' if char == '?' else re.escape(char) for char in pattern)
+
+def parse_date(value, round_up=False):
+    """A date bound as UTC datetime64[ns]; round_up moves a bare date to the last millisecond of the day"""
+    timestamp = pd.Timestamp(value)
+    timestamp = timestamp.tz_localize('UTC') if timestamp.tzinfo is None else timestamp.tz_convert('UTC')
+    if round_up and re.fullmatch(r'\d{4}-\d{2}-\d{2}', str(value)):
+        timestamp += pd.Timedelta(days=1) - pd.Timedelta(milliseconds=1)
+    return timestamp.tz_localize(None).to_datetime64()
+
+def parse_distance(distance):
+    """Meters in a distance like '20km' or 500 (meters)"""
+    if isinstance(distance, (int, float)):
+        return float(distance)
+    number, unit = re.fullmatch(r'\s*([-+]?\d*\.?\d+)\s*([a-zA-Z]*)\s*', distance).groups()
+    return float(number) * DISTANCE_UNITS[unit or 'm']
+
+def geo_point(value):
+    """(lat, lon) from any geo_point form: {lat, lon}, 'lat,lon' or [lon, lat]"""
+    if isinstance(value, dict):
+        return float(value['lat']), float(value['lon'])
+    if isinstance(value, str):
+        lat, lon = value.split(',')
+        return float(lat), float(lon)
+    return float(value[1]), float(value[0])
+
+def sort_clause(clause):
+    """(field, order) of one sort clause"""
+    if isinstance(clause, str):
+        return clause, 'desc' if clause == '_score' else 'asc'
+    (field, options), = clause.items()
+    order = options.get('order', 'asc') if isinstance(options, dict) else options
+    return field, order
+
+def source_includes(source):
+    """The field patterns kept in _source: True for all, an empty list for none"""
+    if source is True or source is False:
+        return source or []
+    if isinstance(source, str):
+        return [source]
+    if isinstance(source, dict):
+        return clause_list(source.get('includes', source.get('include', ['*'])))
+    return source
+
+def bucket_key(term):
+    return term.item() if hasattr(term, 'item') else term
+
+def order_list(order):
+    """Bucket orders as (key, direction) pairs, from a single object or a list of them"""
+    return [next(iter(entry.items())) for entry in clause_list(order)]
+
+def bucket_order_value(bucket, key):
+    if key == '_count':
+        return bucket["doc_count"]
+    if key == '_key':
+        return bucket["key"]
+    # A sub-aggregation, with the metric after a dot for multi-value ones like stats
+    name, _, metric = key.partition('.')
+    value = bucket[name].get(metric or 'value')
+    return -math.inf if value is None else value
+
+def sort_buckets(buckets, orders):
+    """Sort buckets by their orders, breaking ties by ascending key like ES"""
+    # Stable sorts from the last criterion to the first
+    buckets = sorted(buckets, key=lambda bucket: bucket["key"])
+    for key, direction in reversed(orders):
+        buckets = sorted(buckets, key=lambda bucket: bucket_order_value(bucket, key), reverse=direction == 'desc')
+    return buckets
+
+def read_request(query_file):
+    """The JSON body of a Dev Tools request file, skipping a leading 'GET index/_search' line"""
+    with open(query_file, encoding='utf-8') as f:
+        text = f.read().strip()
+    if re.match(r'(GET|POST)\s', text):
+        text = text.split('\n', 1)[1] if '\n' in text else '{}'
+    return json.loads(text) if text.strip() else {}
+
+def result_file_for(query_file):
+    """The stored response next to a query file: Q1Query.txt, Q1QueryNgram.txt or Q1Aggregation.txt -> Q1Result.ndjson"""
+    directory, name = os.path.split(query_file)
+    match = re.match(r'(Q\d+)(Query|Aggregation)\w*\.txt$', name)
+    return os.path.join(directory, f"{match.group(1)}Result.ndjson") if match else None
+
+def normalize(value, field=None):
+    """Make stored and local values comparable: geo_points become (lat, lon), numbers floats"""
+    if field in GEO_FIELDS and value is not None:
+        return tuple(round(part, 6) for part in geo_point(value))
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (int, float)):
+        return float(value)
+    return value
+
+def same_value(expected, actual):
+    if isinstance(expected, float) and isinstance(actual, float):
+        return math.isclose(expected, actual, rel_tol=1e-9, abs_tol=1e-9)
+    return expected == actual
+
+def compare_values(expected, actual, path, differences):
+    """Collect the paths where two JSON values differ, ignoring timings and generated ids"""
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        for key in sorted(set(expected) | set(actual)):
+            if key in ('took', '_shards', '_id', '_index', '_score', 'max_score'):
+                continue
+            if key not in expected or key not in actual:
+                differences.append(f"{path}.{key}: {'missing locally' if key in expected else 'not in stored result'}")
+                continue
+            if key == '_source':
+                expected_source = {field: normalize(value, field) for field, value in expected[key].items()}
+                actual_source = {field: normalize(value, field) for field, value in actual[key].items()}
+                compare_values(expected_source, actual_source, f"{path}._source", differences)
+            else:
+                compare_values(expected[key], actual[key], f"{path}.{key}", differences)
+    elif isinstance(expected, list) and isinstance(actual, list):
+        if len(expected) != len(actual):
+            differences.append(f"{path}: {len(expected)} stored entries, {len(actual)} locally")
+        for position, (left, right) in enumerate(zip(expected, actual)):
+            compare_values(left, right, f"{path}[{position}]", differences)
+    elif not same_value(normalize(expected), normalize(actual)):
+        differences.append(f"{path}: stored {expected!r}, local {actual!r}")
+    return differences
+
+def compare_results(expected, actual, ordered=True):
+    """Differences between a stored ES response and a local one; unsorted hits are compared as a set"""
+    if not ordered:
+        expected, actual = dict(expected), dict(actual)
+        for response in (expected, actual):
+            hits = response.get("hits", {}).get("hits", [])
+            response["hits"] = dict(response["hits"], hits=sorted(
+                hits, key=lambda hit: json.dumps({field: normalize(value, field) for field, value in hit.get('_source', {}).items()},
+                                                 sort_keys=True, default=str)))
+    return compare_values(expected, actual, '', [])
+
+def load_engine(data_file, mapping='dynamic'):
+    """Read a cleaned CSV, or the raw restaurants.csv with its unnamed first column, into a QueryEngine"""
+    try:
+        df = pd.read_csv(data_file, sep=';')
+        df = df.rename(columns={df.columns[0]: 'SerialNumber'})
+    except Exception as e:
+        logging.error(f"Error reading {data_file}: {str(e)}")
+        sys.exit(1)
+    logging.info(f"Loaded {len(df)} documents from {data_file}")
+    return QueryEngine(df, mapping)
+
+def main(query_files, data_file='restaurants_cleaned.csv', check=False, mapping='dynamic', output=None):
+    engine = load_engine(data_file, mapping)
+    mismatches = 0
+    responses = {}
+    for query_file in query_files:
+        try:
+            request = read_request(query_file)
+            response = engine.search(request)
+        except Exception as e:
+            logging.error(f"Error running {query_file}: {str(e)}")
+            return 1
+        responses[query_file] = response
+        logging.info(f"{query_file}: {response['hits']['total']['value']} hits in {response['took']}ms")
+        if not check:
+            continue
+        result_file = result_file_for(query_file)
+        if not result_file or not os.path.exists(result_file):
+            logging.warning(f"No stored result for {query_file}")
+            continue
+        with open(result_file, encoding='utf-8') as f:
+            expected = json.load(f)
+        differences = compare_results(expected, response, ordered='sort' in request)
+        if differences:
+            mismatches += 1
+            logging.error(f"{query_file} differs from {result_file} in {len(differences)} places")
+            for difference in differences:
+                logging.error(f"  {difference}")
+        else:
+            logging.info(f"{query_file} matches {result_file}")
+
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(responses, f, indent=2, ensure_ascii=False, default=str)
+    elif not check:
+        for response in responses.values():
+            print(json.dumps(response, indent=2, ensure_ascii=False, default=str))
+    return 1 if mismatches else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run section1 queries and aggregations locally over the cleaned data")
+    parser.add_argument('query_files', nargs='+', help="Dev Tools request files, e.g. ../../section1Query/Q1Query.txt")
+    parser.add_argument('--data', dest='data_file', default='restaurants_cleaned.csv',
+                        help="Cleaned CSV to query; the stored results were indexed from the raw ../restaurants.csv")
+    parser.add_argument('--check', action='store_true',
+                        help="Compare each response with the stored QnResult.ndjson next to its query file")
+    parser.add_argument('--mapping', choices=MAPPINGS, default='dynamic',
+                        help="Field types to emulate: ES dynamic mapping, or the keyword/double index template")
+    parser.add_argument('--output', default=None, help="Write the responses as JSON to this file instead of stdout")
+    args = parser.parse_args()
+    sys.exit(main(args.query_files, args.data_file, args.check, args.mapping, args.output))
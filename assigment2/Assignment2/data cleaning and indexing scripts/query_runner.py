@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+# query_runner.py
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from elasticsearch_grok_indexer import ES_HOST, ES_PASSWORD, create_session, index_name
+from partitions import prune_partitions
+from query_engine import compare_results, read_request, result_file_for
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+CACHE_DIR = ".query_cache"
+CACHE_MAX_ENTRIES = 256
+# Searches per _msearch request, and how many of them ES may run at once
+MSEARCH_BATCH_SIZE = 50
+MSEARCH_MAX_CONCURRENT = 8
+RUNNER_CONCURRENCY = 4
+PERCENTILES = (50, 95, 99)
+
+REQUEST_LINE_PATTERN = r'(?:GET|POST)\s+/?([^/\s]+)/_search'
+
+session = create_session(RUNNER_CONCURRENCY)
+
+def read_query_file(query_file):
+    """The target index and JSON body of a Dev Tools request file; files without a request line search index_name"""
+    with open(query_file, encoding='utf-8') as f:
+        match = re.match(REQUEST_LINE_PATTERN, f.read().lstrip())
+    return (match.group(1) if match else index_name), read_request(query_file)
+
+def index_generation(index):
+    """
+    Identify the data behind an index or alias: the concrete indices with their
+    uuids (new on every recreate or bulk load) and write counters (which move
+    on every incremental run). Cached results of another generation are stale.
+    None for a missing index, whose searches are not cached.
+    """
+    response = session.get(f"{ES_HOST}/{index}/_stats/docs,indexing")
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    generation = []
+    for name, stats in sorted(response.json().get("indices", {}).items()):
+        primaries = stats.get("primaries", {})
+        generation.append([name, stats.get("uuid"), primaries.get("docs", {}).get("count"),
+                           primaries.get("indexing", {}).get("index_total"),
+                           primaries.get("indexing", {}).get("delete_total")])
+    return hashlib.blake2b(json.dumps(generation).encode('utf-8'), digest_size=8).hexdigest()
+
+def alias_indices(index):
+    """The concrete indices behind an index or alias, none for a missing one"""
+    response = session.get(f"{ES_HOST}/{index}/_alias")
+    if response.status_code == 404:
+        return []
+    response.raise_for_status()
+    return sorted(response.json())
+
+def search_targets(query_files, searches):
+    """
+    The searches with their index narrowed to the year partitions their date
+    range can match, so the shards of the other years are never contacted.
+    Searches that cannot be narrowed keep their index.
+    """
+    indices = {index: alias_indices(index) for index in {index for index, _ in searches}}
+    targets = []
+    for query_file, (index, body) in zip(query_files, searches):
+        kept = prune_partitions(body.get('query', {}), indices[index], index)
+        # A range outside every partition still goes to the whole index, an empty index list would mean _all
+        if kept and len(kept) < len(indices[index]):
+            logging.info(f"{query_file}: searching {', '.join(kept)} ({len(kept)} of {len(indices[index])} indices)")
+            targets.append((','.join(kept), body))
+        else:
+            targets.append((index, body))
+    return targets
+
+def query_key(index, body, generation):
+    """Cache key of one search: the hash of the query against the generation of its index"""
+    query = json.dumps([index, body], sort_keys=True)
+    return f"{hashlib.blake2b(query.encode('utf-8'), digest_size=12).hexdigest()}-{generation}"
+
+class ResultCache:
+    """
+    Search responses on disk, one JSON file per key, evicting the least
+    recently used entries beyond max_entries. File modification times keep
+    the recency order between runs.
+    """
+
+    def __init__(self, directory=CACHE_DIR, max_entries=CACHE_MAX_ENTRIES):
+        self.directory = directory
+        self.max_entries = max_entries
+        os.makedirs(directory, exist_ok=True)
+        paths = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.json')]
+        self.entries = OrderedDict((os.path.basename(path)[:-len('.json')], None)
+                                   for path in sorted(paths, key=os.path.getmtime))
+        self.hits = 0
+        self.misses = 0
+        self.evict()
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        if key not in self.entries:
+            self.misses += 1
+            return None
+        try:
+            with open(self.path(key), encoding='utf-8') as f:
+                response = json.load(f)
+        except (OSError, ValueError):
+            # Removed or half written by another run: treat as a miss
+            del self.entries[key]
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        os.utime(self.path(key))
+        self.hits += 1
+        return response
+
+    def put(self, key, response):
+        tmp_file = f"{self.path(key)}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(response, f, ensure_ascii=False)
+        os.replace(tmp_file, self.path(key))
+        self.entries[key] = None
+        self.entries.move_to_end(key)
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used responses beyond max_entries"""
+        while len(self.entries) > self.max_entries:
+            evicted, _ = self.entries.popitem(last=False)
+            try:
+                os.remove(self.path(evicted))
+            except FileNotFoundError:
+                pass
+
+def msearch(searches, max_concurrent=MSEARCH_MAX_CONCURRENT):
+    """
+    Run (index, body) searches in one _msearch request, which ES runs
+    concurrently. Returns the responses in order and the round trip time.
+    """
+    lines = []
+    for index, body in searches:
+        lines.append(json.dumps({"index": index}))
+        lines.append(json.dumps(body))
+    data = ('\n'.join(lines) + '\n').encode('utf-8')
+    started = time.perf_counter()
+    response = session.post(f"{ES_HOST}/_msearch", data=data, params={"max_concurrent_searches": max_concurrent},
+                            headers={"Content-Type": "application/x-ndjson"})
+    elapsed = time.perf_counter() - started
+    response.raise_for_status()
+    responses = response.json()["responses"]
+    # _msearch adds a status to each response; without it they are the _search responses stored next to the queries
+    for item in responses:
+        item.pop("status", None)
+    return responses, elapsed
+
+def run_searches(searches, batch_size=MSEARCH_BATCH_SIZE, max_concurrent=MSEARCH_MAX_CONCURRENT):
+    """Run searches in _msearch batches of batch_size; returns the responses and one round trip per batch"""
+    responses = []
+    round_trips = []
+    for start in range(0, len(searches), batch_size):
+        batch_responses, elapsed = msearch(searches[start:start + batch_size], max_concurrent)
+        responses.extend(batch_responses)
+        round_trips.append(elapsed)
+    return responses, round_trips
+
+def timed_iterations(searches, iterations, concurrency=RUNNER_CONCURRENCY, batch_size=MSEARCH_BATCH_SIZE,
+                     max_concurrent=MSEARCH_MAX_CONCURRENT):
+    """
+    Send the whole query set iterations times, with up to concurrency
+    iterations in flight. Returns the server-side took of every search per
+    query position, and the round trip of every _msearch request.
+    """
+    took = [[] for _ in searches]
+    round_trips = []
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        runs = [executor.submit(run_searches, searches, batch_size, max_concurrent) for _ in range(iterations)]
+        for run in runs:
+            responses, batch_round_trips = run.result()
+            round_trips.extend(batch_round_trips)
+            for position, response in enumerate(responses):
+                if "error" not in response:
+                    took[position].append(response.get("took", 0))
+    return took, round_trips
+
+def percentile_row(values):
+    return [float(np.percentile(values, p)) if values else float('nan') for p in PERCENTILES]
+
+def report_latencies(query_files, took, round_trips):
+    header = ' '.join(f"{f'p{p} ms':>9}" for p in PERCENTILES)
+    print(f"{'query':<40} {'runs':>5} {header}")
+    for query_file, values in zip(query_files, took):
+        print(f"{os.path.basename(query_file):<40} {len(values):>5} "
+              + ' '.join(f"{value:>9.1f}" for value in percentile_row(values)))
+    print(f"{'_msearch round trip':<40} {len(round_trips):>5} "
+          + ' '.join(f"{value * 1000:>9.1f}" for value in percentile_row(round_trips)))
+
+def check_results(query_files, bodies, responses):
+    """Diff each response against the stored QnResult.ndjson next to its query file; returns the mismatch count"""
+    mismatches = 0
+    for query_file, body, response in zip(query_files, bodies, responses):
+        result_file = result_file_for(query_file)
+        if not result_file or not os.path.exists(result_file):
+            logging.warning(f"No stored result for {query_file}")
+            continue
+        with open(result_file, encoding='utf-8') as f:
+            expected = json.load(f)
+        differences = compare_results(expected, response, ordered='sort' in body)
+        if differences:
+            mismatches += 1
+            logging.error(f"{query_file} differs from {result_file} in {len(differences)} places")
+            for difference in differences:
+                logging.error(f"  {difference}")
+        else:
+            logging.info(f"{query_file} matches {result_file}")
+    return mismatches
+
+def main(query_files, iterations=10, concurrency=RUNNER_CONCURRENCY, batch_size=MSEARCH_BATCH_SIZE,
+         max_concurrent=MSEARCH_MAX_CONCURRENT, check=False, cache_dir=CACHE_DIR, cache_size=CACHE_MAX_ENTRIES,
+         use_cache=True, output=None, prune=True):
+    if not ES_PASSWORD:
+        logging.error("ES_PASS environment variable not set. Please set it before running this script.")
+        return 1
+    try:
+        searches = [read_query_file(query_file) for query_file in query_files]
+    except Exception as e:
+        logging.error(f"Error reading query files: {str(e)}")
+        return 1
+    bodies = [body for _, body in searches]
+
+    try:
+        targets = search_targets(query_files, searches) if prune else searches
+        
+        # Results come from the cache when it holds them for the current generation of their index
+        responses = [None] * len(searches)
+        if use_cache:
+            cache = ResultCache(cache_dir, cache_size)
+            generations = {index: index_generation(index) for index in {index for index, _ in searches}}
+            keys = [query_key(index, body, generations[index]) if generations[index] else None
+                    for index, body in searches]
+            responses = [cache.get(key) if key else None for key in keys]
+        missing = [position for position, response in enumerate(responses) if response is None]
+        if missing:
+            fetched, _ = run_searches([targets[position] for position in missing], batch_size, max_concurrent)
+            for position, response in zip(missing, fetched):
+                responses[position] = response
+                if use_cache and keys[position] and "error" not in response:
+                    cache.put(keys[position], response)
+        if use_cache:
+            logging.info(f"Result cache: {cache.hits} hits, {cache.misses} misses")
+
+        # Timed iterations always go to the cluster
+        if iterations:
+            logging.info(f"Running {len(searches)} queries {iterations} times, {concurrency} iterations in flight")
+            took, round_trips = timed_iterations(targets, iterations, concurrency, batch_size, max_concurrent)
+            report_latencies(query_files, took, round_trips)
+    except Exception as e:
+        logging.error(f"Error running queries against {ES_HOST}: {str(e)}")
+        if hasattr(e, 'response') and e.response is not None:
+            logging.error(f"Response status: {e.response.status_code}")
+            logging.error(f"Response body: {e.response.text}")
+        return 1
+
+    failed = 0
+    for query_file, response in zip(query_files, responses):
+        if "error" in response:
+            failed += 1
+            logging.error(f"{query_file} failed: {json.dumps(response['error'])}")
+    mismatches = check_results(query_files, bodies, responses) if check else 0
+
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(dict(zip(query_files, responses)), f, indent=2, ensure_ascii=False)
+    return 1 if failed or mismatches else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run Dev Tools query files against Elasticsearch through _msearch")
+    parser.add_argument('query_files', nargs='+', help="Dev Tools request files, e.g. ../../section1Query/Q1Query.txt")
+    parser.add_argument('--iterations', type=int, default=10,
+                        help="Times to send the whole query set for the latency percentiles (0: only fetch results)")
+    parser.add_argument('--concurrency', type=int, default=RUNNER_CONCURRENCY,
+                        help="Iterations in flight at once")
+    parser.add_argument('--batch-size', type=int, default=MSEARCH_BATCH_SIZE, help="Searches per _msearch request")
+    parser.add_argument('--max-concurrent-searches', dest='max_concurrent', type=int,
+                        default=MSEARCH_MAX_CONCURRENT, help="Searches ES may run at once for one _msearch request")
+    parser.add_argument('--check', action='store_true',
+                        help="Compare each response with the stored QnResult.ndjson next to its query file")
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help="Directory of the on-disk result cache")
+    parser.add_argument('--cache-size', type=int, default=CACHE_MAX_ENTRIES,
+                        help="Cached responses kept before the least recently used are evicted")
+    parser.add_argument('--no-cache', dest='use_cache', action='store_false',
+                        help="Always fetch results from the cluster")
+    parser.add_argument('--output', default=None, help="Write the responses as JSON to this file")
+    parser.add_argument('--no-prune', dest='prune', action='store_false',
+                        help="Search the whole index even when a query's date range skips year partitions")
+    args = parser.parse_args()
+    sys.exit(main(args.query_files, args.iterations, args.concurrency, args.batch_size, args.max_concurrent,
+                  args.check, args.cache_dir, args.cache_size, args.use_cache, args.output, args.prune))
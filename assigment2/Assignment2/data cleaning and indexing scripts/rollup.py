@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# rollup.py
+import math
+
+ROLLUP_INDEX = "restaurants_rollup"
+# One rollup document per combination of these document fields and the month of Date
+ROLLUP_DIMENSIONS = ["City", "Country", "Continent", "RatingText"]
+ROLLUP_METRICS = ["AverageCostForTwo", "AggregateRating", "Votes"]
+# weighted_avg of AggregateRating by Votes, as in the section1 aggregations
+WEIGHTED_METRIC = "AggregateRating"
+WEIGHT_FIELD = "Votes"
+
+class Rollup:
+    """
+    Mergeable partial aggregates of the documents streaming past, keyed by
+    ROLLUP_DIMENSIONS and month. Every metric keeps count, sum, min and max,
+    so avg, sum, min, max, value_count and stats over any set of rollup
+    documents come out exact; the weighted metric also keeps the sum of
+    value * weight and of the weights for weighted_avg.
+
+    A panel reads the rollup index instead of the restaurants, e.g. the
+    average cost per city is the sum of AverageCostForTwo.sum divided by the
+    sum of AverageCostForTwo.count in each City bucket. The _doc_count field
+    makes terms and other bucket doc counts count restaurants, not rollups.
+    """
+
+    def __init__(self):
+        self.groups = {}
+
+    def __len__(self):
+        return len(self.groups)
+
+    def observe(self, documents):
+        """Pass the documents through, adding each one to the rollup on the way"""
+        for doc in documents:
+            self.add(doc)
+            yield doc
+
+    def add(self, doc):
+        date = doc['Date']
+        # Date is ISO 8601, or 'nan' when the row had none
+        month = date[:7] if len(date) >= 7 else None
+        key = (doc['City'], doc['Country'], doc['Continent'], doc['RatingText'], month)
+        group = self.groups.get(key)
+        if group is None:
+            # doc count, then count, sum, min and max per metric, then the weighted sums
+            group = self.groups[key] = [0] + [0, 0.0, math.inf, -math.inf] * len(ROLLUP_METRICS) + [0.0, 0.0]
+        group[0] += 1
+        position = 1
+        for field in ROLLUP_METRICS:
+            value = doc[field]
+            # NaN != NaN, so missing values are skipped like ES skips documents without the field
+            if value is not None and value == value:
+                group[position] += 1
+                group[position + 1] += value
+                if value < group[position + 2]:
+                    group[position + 2] = value
+                if value > group[position + 3]:
+                    group[position + 3] = value
+            position += 4
+        value, weight = doc[WEIGHTED_METRIC], doc[WEIGHT_FIELD]
+        if value is not None and weight is not None and value == value and weight == weight:
+            group[position] += value * weight
+            group[position + 1] += weight
+
+    def merge(self, other):
+        """Fold the groups of another Rollup (e.g. of another input file) into this one"""
+        for key, theirs in other.groups.items():
+            ours = self.groups.get(key)
+            if ours is None:
+                self.groups[key] = list(theirs)
+                continue
+            ours[0] += theirs[0]
+            for position in range(1, 1 + 4 * len(ROLLUP_METRICS), 4):
+                ours[position] += theirs[position]
+                ours[position + 1] += theirs[position + 1]
+                ours[position + 2] = min(ours[position + 2], theirs[position + 2])
+                ours[position + 3] = max(ours[position + 3], theirs[position + 3])
+            ours[-2] += theirs[-2]
+            ours[-1] += theirs[-1]
+
+    def documents(self):
+        """The rollup documents, one per group"""
+        for key, group in self.groups.items():
+            doc = dict(zip(ROLLUP_DIMENSIONS, key))
+            doc['Month'] = key[-1]
+            doc['_doc_count'] = group[0]
+            for index, field in enumerate(ROLLUP_METRICS):
+                count, total, low, high = group[1 + 4 * index:5 + 4 * index]
+                # Metrics without any value have no min or max, like ES aggregations over no values
+                doc[field] = {"count": count, "sum": total, "min": low if count else None,
+                              "max": high if count else None}
+            doc[WEIGHTED_METRIC].update(weighted_sum=group[-2], weight_sum=group[-1])
+            yield doc
+
+def rollup_mappings():
+    """Mappings of the rollup index; dimensions are keywords and every partial aggregate is a double"""
+    partial = {"properties": {part: {"type": "double"} for part in ("sum", "min", "max")}}
+    partial["properties"]["count"] = {"type": "long"}
+    weighted = {"properties": dict(partial["properties"], weighted_sum={"type": "double"},
+                                   weight_sum={"type": "double"})}
+    return {
+        "properties": {
+            **{field: {"type": "keyword"} for field in ROLLUP_DIMENSIONS},
+            "Month": {"type": "date", "format": "yyyy-MM"},
+            **{field: weighted if field == WEIGHTED_METRIC else partial for field in ROLLUP_METRICS}
+        }
+    }
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# synthetic_restaurants.py
+import argparse
+import logging
+
+import numpy as np
+import pandas as pd
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+COLUMNS = ['SerialNumber', 'RestaurantName', 'AverageCostForTwo', 'AggregateRating', 'RatingText', 'Votes',
+           'Date', 'Coordinates', 'City/Country/Continent']
+
+# City/Country/Continent with a rough centre, weighted like the real dataset (mostly Delhi NCR)
+CITIES = [
+    ("New Delhi/India/Asia", 28.6139, 77.2090, 50),
+    ("Gurgaon/India/Asia", 28.4595, 77.0266, 12),
+    ("Noida/India/Asia", 28.5355, 77.3910, 12),
+    ("Faridabad/India/Asia", 28.4089, 77.3178, 3),
+    ("Ghaziabad/India/Asia", 28.6692, 77.4538, 1),
+    ("Singapore/Singapore/Asia", 1.2903, 103.8520, 1),
+    ("Makati City/Philippines/Asia", 14.5547, 121.0244, 1),
+    ("Doha/Qatar/Asia", 25.2854, 51.5310, 1),
+    ("London/United Kingdom/Europe", 51.5074, -0.1278, 1),
+    ("Albany/United States/North America", 42.6526, -73.7562, 1),
+    ("Boise/United States/North America", 43.6150, -116.2023, 1),
+    ("Rio de Janeiro/Brazil/South America", -22.9068, -43.1729, 1),
+    ("Cape Town/South Africa/Africa", -33.9249, 18.4241, 1),
+    ("Auckland/New Zealand/Oceania", -36.8485, 174.7633, 1),
+]
+
+NAME_FIRST = ['Royal', 'Urban', 'Spice', 'Golden', 'Little', 'Blue', 'Green', 'Punjabi', 'Old', 'New',
+              'Tandoori', 'Chili', 'Big', 'Smoky', 'Sunny', 'The Grand', 'Delhi', 'Mama', 'Sultan', 'Yellow']
+NAME_LAST = ['Bar', 'Cafe', 'Pizza', 'Pizzeria', 'Pasta House', 'Barbeque Nation', 'Bistro', 'Kitchen',
+             'Dhaba', 'Grill', 'Bakery', 'Brew Pub', 'Sweets', 'Biryani Corner', 'Diner', 'Barista',
+             'Momos', 'Express', 'Lounge', 'Barbecue Co']
+
+# Upper bounds of AggregateRating for each rating text (0 means not rated)
+RATING_BINS = [0.0, 2.4, 3.4, 3.9, 4.4, 4.9]
+RATING_TEXTS = ['Not rated', 'Poor', 'Average', 'Good', 'Very Good', 'Excellent']
+
+DATE_START = np.datetime64('2016-01-01T00:00:00')
+DATE_SPAN_SECONDS = 3 * 365 * 24 * 3600
+
+def generate_frame(start, rows, rng):
+    """
+    Generate rows of cleaned restaurant data, numbered from start
+    """
+    city_weights = np.array([city[3] for city in CITIES], dtype=float)
+    city_index = rng.choice(len(CITIES), size=rows, p=city_weights / city_weights.sum())
+    centres = np.array([(city[1], city[2]) for city in CITIES])[city_index]
+    # Spread restaurants over ~15 km around the city centre
+    lat = np.round(centres[:, 0] + rng.normal(0, 0.07, rows), 6)
+    lon = np.round(centres[:, 1] + rng.normal(0, 0.07, rows), 6)
+
+    names = (np.array(NAME_FIRST, dtype=object)[rng.integers(0, len(NAME_FIRST), rows)] + ' '
+             + np.array(NAME_LAST, dtype=object)[rng.integers(0, len(NAME_LAST), rows)])
+
+    rated = rng.random(rows) > 0.22
+    rating = np.where(rated, np.round(rng.uniform(1.8, 4.9, rows), 1), 0.0)
+    rating_text = np.array(RATING_TEXTS, dtype=object)[np.searchsorted(RATING_BINS, rating)]
+    votes = np.where(rated, np.floor(rng.lognormal(3.5, 1.5, rows)), 0.0)
+    cost = (np.round(rng.lognormal(6.0, 0.7, rows) / 50) * 50).astype(np.int64)
+
+    seconds = rng.integers(0, DATE_SPAN_SECONDS, rows)
+    dates = np.char.add(np.datetime_as_string(DATE_START + seconds.astype('timedelta64[s]'), unit='s'), 'Z')
+
+    return pd.DataFrame({
+        'SerialNumber': np.arange(start, start + rows, dtype=np.int64),
+        'RestaurantName': names,
+        'AverageCostForTwo': cost,
+        'AggregateRating': rating,
+        'RatingText': rating_text,
+        'Votes': votes,
+        'Date': dates,
+        'Coordinates': '[' + pd.Series(lat).astype(str) + ', ' + pd.Series(lon).astype(str) + ']',
+        'City/Country/Continent': np.array([city[0] for city in CITIES], dtype=object)[city_index]
+    }, columns=COLUMNS)
+
+UNPARSEABLE_DATES = ['not a date', 'N/A', '2017-13-45', '31/02/2018 25:61']
+MALFORMED_COORDINATES = ['[28.5 77.2]', 'lat:28.5 lon:77.2', 'N/A', '[,]', '()']
+
+def add_dirt(df, rng, dirt_rate):
+    """
+    Corrupt about dirt_rate of the rows the way raw feeds do: non-ISO and bad dates,
+    malformed and out-of-range coordinates, two- or four-part locations, missing or
+    non-numeric values, and exact duplicate rows
+    """
+    rows = len(df)
+    df = df.astype({'AggregateRating': object, 'Votes': object})
+
+    def pick(rate):
+        return rng.random(rows) < rate
+
+    # Dates: other parseable formats, unparseable strings and gaps
+    reformatted = pick(dirt_rate / 3)
+    df.loc[reformatted, 'Date'] = df.loc[reformatted, 'Date'].str.replace('T', ' ').str.rstrip('Z')
+    unparseable = pick(dirt_rate / 6)
+    df.loc[unparseable, 'Date'] = rng.choice(UNPARSEABLE_DATES, unparseable.sum())
+    df.loc[pick(dirt_rate / 6), 'Date'] = np.nan
+
+    # Coordinates: malformed, prefixed by noise, out of range, missing
+    malformed = pick(dirt_rate / 4)
+    df.loc[malformed, 'Coordinates'] = rng.choice(MALFORMED_COORDINATES, malformed.sum())
+    prefixed = pick(dirt_rate / 4)
+    df.loc[prefixed, 'Coordinates'] = ' near ' + df.loc[prefixed, 'Coordinates']
+    out_of_range = pick(dirt_rate / 4)
+    df.loc[out_of_range, 'Coordinates'] = [
+        f"[{lat}, {lon}]" for lat, lon in zip(np.round(rng.uniform(90.5, 120, out_of_range.sum()), 4),
+                                              np.round(rng.uniform(-360, -180.5, out_of_range.sum()), 4))
+    ]
+    df.loc[pick(dirt_rate / 8), 'Coordinates'] = np.nan
+
+    # Locations: continent missing, an extra leading part, or no location at all
+    two_parts = pick(dirt_rate / 4)
+    df.loc[two_parts, 'City/Country/Continent'] = df.loc[two_parts, 'City/Country/Continent'].str.rsplit('/', n=1).str[0]
+    four_parts = pick(dirt_rate / 4)
+    df.loc[four_parts, 'City/Country/Continent'] = 'Old Town/' + df.loc[four_parts, 'City/Country/Continent']
+    df.loc[pick(dirt_rate / 8), 'City/Country/Continent'] = np.nan
+
+    # Numeric and text fields: missing or non-numeric values
+    df.loc[pick(dirt_rate / 4), 'AggregateRating'] = 'NEW'
+    df.loc[pick(dirt_rate / 4), 'Votes'] = np.nan
+    df.loc[pick(dirt_rate / 8), 'RestaurantName'] = np.nan
+    df.loc[pick(dirt_rate / 8), 'RatingText'] = np.nan
+
+    # Exact duplicates: overwrite some rows with copies of earlier ones
+    duplicates = np.flatnonzero(pick(dirt_rate / 4))
+    duplicates = duplicates[duplicates > 0]
+    if len(duplicates):
+        sources = (rng.random(len(duplicates)) * duplicates).astype(np.int64)
+        df.iloc[duplicates] = df.iloc[sources].to_numpy()
+    return df
+
+def generate_dataset(output_file, rows, seed=42, chunk_rows=100000, raw=False, dirt_rate=0.05):
+    """
+    Write a semicolon-separated file chunk by chunk. By default it has the
+    restaurants_cleaned.csv layout; with raw=True it has the restaurants.csv
+    layout (unnamed first column) and about dirt_rate of the rows are corrupted.
+    """
+    rng = np.random.default_rng(seed)
+    written = 0
+    while written < rows:
+        chunk = generate_frame(written, min(chunk_rows, rows - written), rng)
+        if raw:
+            chunk = add_dirt(chunk, rng, dirt_rate).rename(columns={'SerialNumber': ''})
+        chunk.to_csv(output_file, sep=';', index=False, mode='w' if written == 0 else 'a', header=written == 0)
+        written += len(chunk)
+    logging.info(f"Generated {written} rows in {output_file}")
+    return output_file
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic restaurants dataset")
+    parser.add_argument('output_file', help="Where to write the semicolon-separated file")
+    parser.add_argument('--rows', type=int, default=10000, help="Number of rows to generate")
+    parser.add_argument('--seed', type=int, default=42, help="Random seed, so runs are reproducible")
+    parser.add_argument('--raw', action='store_true',
+                        help="Write the raw restaurants.csv layout with dirty rows instead of cleaned data")
+    parser.add_argument('--dirt-rate', type=float, default=0.05, help="With --raw, fraction of rows to corrupt")
+    args = parser.parse_args()
+    generate_dataset(args.output_file, args.rows, args.seed, raw=args.raw, dirt_rate=args.dirt_rate)
@@ -0,0 +1,42 @@
+# test_data_cleaner.py
+import os
+
+import pandas as pd
+import pytest
+
+from data_cleaner import clean_restaurant_data
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+RAW_CSV = os.path.join(SCRIPTS_DIR, '..', 'restaurants.csv')
+CLEANED_CSV = os.path.join(SCRIPTS_DIR, 'restaurants_cleaned.csv')
+
+MODES = pytest.mark.parametrize('options', [
+    {},
+    {'chunksize': 1000},
+    {'workers': 2},
+    {'compact': True},
+    {'chunksize': 1000, 'compact': True},
+    {'workers': 2, 'compact': True},
+], ids=['default', 'chunksize', 'workers', 'compact', 'chunksize-compact', 'workers-compact'])
+
+@MODES
+def test_cleaned_output_matches_committed_file(tmp_path, options):
+    """Every cleaning mode writes restaurants.csv out byte for byte as the committed restaurants_cleaned.csv"""
+    output_file = tmp_path / 'restaurants_cleaned.csv'
+    clean_restaurant_data(RAW_CSV, str(output_file), **options)
+    with open(CLEANED_CSV, 'rb') as expected:
+        assert output_file.read_bytes() == expected.read()
+
+@MODES
+def test_dates_with_mixed_utc_offsets(tmp_path, options):
+    """Dates with different UTC offsets in one column keep their local time, as when each was parsed alone"""
+    raw_file = tmp_path / 'restaurants.csv'
+    raw_file.write_text(
+        ";RestaurantName;AverageCostForTwo;AggregateRating;RatingText;Votes;Date;Coordinates;City/Country/Continent\n"
+        "0;A;100;4.0;Good;10.0;2017-01-01 10:00:00+05:30;[14.5, 121.0];Pune/India/Asia\n"
+        "1;B;200;3.5;Good;20.0;2017-02-01 10:00:00-03:00;[14.5, 121.0];Pune/India/Asia\n"
+        "2;C;300;3.0;Average;30.0;2018-01-01 12:00;[14.5, 121.0];Pune/India/Asia\n")
+    output_file = tmp_path / 'restaurants_cleaned.csv'
+    clean_restaurant_data(str(raw_file), str(output_file), **options)
+    dates = pd.read_csv(output_file, sep=';')['Date'].tolist()
+    assert dates == ['2017-01-01T10:00:00Z', '2017-02-01T10:00:00Z', '2018-01-01T12:00:00Z']
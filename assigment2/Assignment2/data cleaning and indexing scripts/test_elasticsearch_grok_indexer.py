@@ -0,0 +1,78 @@
+# test_elasticsearch_grok_indexer.py
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import pytest
+
+import elasticsearch_grok_indexer as indexer
+
+COORDINATES = [
+    '[28.43061045188525, 77.89902520679447]',
+    '[14.565443, 121.027535]',
+    '[-33.8688, 151.20930000000001]',
+    '[0.0001, 0.00001]',
+    '[120, -0.0]',
+    '[123456789012345.6, 1.5]',
+    '[ 1.5 ,2.5 ]',
+    '(1.5, 2.5)',
+    None,
+]
+
+def cleaned_rows(coordinates):
+    rows = len(coordinates)
+    return pd.DataFrame({
+        'SerialNumber': range(rows),
+        'RestaurantName': ['Cafe'] * rows,
+        'AverageCostForTwo': [500] * rows,
+        'AggregateRating': [4.5] * rows,
+        'RatingText': ['Excellent'] * rows,
+        'Votes': [10.0] * rows,
+        'Date': ['2017-01-01T00:00:00Z'] * rows,
+        'Coordinates': coordinates,
+        'City/Country/Continent': ['Pune/India/Asia'] * rows
+    })
+
+@pytest.mark.skipif(indexer.pa is None, reason="compares the pyarrow path against the one without it")
+def test_build_documents_same_with_and_without_pyarrow(monkeypatch):
+    """The Arrow fast path writes Coordinates exactly as repr() of the parsed floats, like the path without it"""
+    df = cleaned_rows(COORDINATES)
+    with_pyarrow = indexer.build_documents(df)
+    monkeypatch.setattr(indexer, 'pa', None)
+    without_pyarrow = indexer.build_documents(df)
+    assert json.dumps(with_pyarrow) == json.dumps(without_pyarrow)
+    assert with_pyarrow[0]['Coordinates'] == '28.43061045188525,77.89902520679448'
+
+class ProxyRejectingHandler(BaseHTTPRequestHandler):
+    """Answers the first _bulk request with a plain-text 429 like a proxy would, then with a bulk response"""
+    requests_seen = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        type(self).requests_seen += 1
+        if type(self).requests_seen == 1:
+            status, body, content_type = 429, b'<html>Too Many Requests</html>', 'text/html'
+        else:
+            status, body, content_type = 200, b'{"took": 1, "errors": false, "items": []}', 'application/json'
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def test_post_bulk_retries_a_429_without_a_json_body(monkeypatch):
+    """A proxy's 429 is backed off and retried instead of failing on its body"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ProxyRejectingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(indexer, 'ES_HOST', f"http://127.0.0.1:{server.server_address[1]}")
+    monkeypatch.setattr(indexer, 'backoff_delay', lambda attempt: 0)
+    try:
+        result = indexer.post_bulk(b'{"index": {}}\n{}\n')
+    finally:
+        server.shutdown()
+    assert result == {"took": 1, "errors": False, "items": []}
+    assert ProxyRejectingHandler.requests_seen == 2
@@ -0,0 +1,50 @@
+# test_query_engine.py
+import os
+
+import pandas as pd
+import pytest
+
+from query_engine import QueryEngine, main
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+RAW_CSV = os.path.join(SCRIPTS_DIR, '..', 'restaurants.csv')
+SECTION1_DIR = os.path.join(SCRIPTS_DIR, '..', '..')
+
+@pytest.mark.parametrize('query_file', [
+    os.path.join('section1Query', 'Q2Query.txt'),
+    os.path.join('section1Query', 'Q3Query.txt'),
+    os.path.join('section1Aggregation', 'Q1Aggregation.txt'),
+    os.path.join('section1Aggregation', 'Q2Aggregation.txt'),
+    os.path.join('section1Aggregation', 'Q3Aggregation.txt'),
+])
+def test_check_matches_stored_results(query_file):
+    """--check over the raw restaurants.csv reproduces the stored QnResult.ndjson"""
+    assert main([os.path.join(SECTION1_DIR, query_file)], RAW_CSV, check=True) == 0
+
+def test_terms_other_count_leaves_out_shard_buckets_below_min_doc_count():
+    """
+    The top shard_size buckets are taken out of sum_other_doc_count on the
+    shard; the ones below min_doc_count are then dropped without being added back
+    """
+    cities = ['A'] * 3 + ['B'] * 1 + ['C'] * 2 + ['D'] * 4
+    costs = [900] * 3 + [800] * 1 + [100] * 2 + [50] * 4
+    rows = len(cities)
+    df = pd.DataFrame({
+        'SerialNumber': range(rows),
+        'RestaurantName': ['Cafe'] * rows,
+        'AverageCostForTwo': costs,
+        'AggregateRating': [4.0] * rows,
+        'RatingText': ['Very Good'] * rows,
+        'Votes': [10.0] * rows,
+        'Date': ['2017-01-01T00:00:00Z'] * rows,
+        'Coordinates': ['[14.5, 121.0]'] * rows,
+        'City/Country/Continent': [f"{city}/India/Asia" for city in cities]
+    })
+    engine = QueryEngine(df, 'dynamic')
+    terms = {"field": "City.keyword", "size": 1, "shard_size": 3, "min_doc_count": 2, "order": {"avg_cost": "desc"}}
+    response = engine.search({"size": 0, "aggs": {"cities": {
+        "terms": terms, "aggs": {"avg_cost": {"avg": {"field": "AverageCostForTwo"}}}}}})
+    cities = response["aggregations"]["cities"]
+    # Shard top 3 by avg_cost: A (3), B (1), C (2); B is dropped, C goes back to the other count with D
+    assert [bucket["key"] for bucket in cities["buckets"]] == ['A']
+    assert cities["sum_other_doc_count"] == 6